@@ -1,27 +1,82 @@
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
-from django.db import connection
-from decimal import Decimal, InvalidOperation
+from django.core.cache import cache
+from django.db import transaction
+from decimal import InvalidOperation
+
+
+def _version_key(user_id):
+    return f'auth-user:{user_id}:version'
+
+
+def _user_key(user_id, version):
+    return f'auth-user:{user_id}:v{version}'
+
+
+def invalidate_cached_user(user_id):
+    """Retire the cached copy of a user by bumping their version."""
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        cache.set(_version_key(user_id), 2, timeout=None)
+
+
+def invalidate_cached_user_on_commit(user_id):
+    # Readers that start after the bump see the committed row, so a stale
+    # copy can never be cached under the new version
+    transaction.on_commit(lambda: invalidate_cached_user(user_id))
+
+
+def _invalidate_cached_users(user_ids):
+    for user_id in user_ids:
+        invalidate_cached_user(user_id)
+
+
+def invalidate_cached_users_on_commit(user_ids):
+    """``invalidate_cached_user_on_commit`` for many users, as one callback."""
+    user_ids = list(user_ids)
+    transaction.on_commit(lambda: _invalidate_cached_users(user_ids))
+
 
 class CleaningModelBackend(ModelBackend):
     """Custom backend that handles corrupt Decimal values on user retrieval.
 
     If a Decimal conversion (e.g. for `balance`) raises InvalidOperation when
-    Django loads the user from the DB, this backend resets the user's balance
-    to 0.00 using a direct SQL update and retries retrieval. This avoids
-    crashing the request pipeline while repairing the bad value.
+    Django loads the user from the DB, this backend repairs the balance the
+    way ``fix_balances`` does (``accounts.ledger.repair_balances``: back to
+    the user's ledger total) and retries retrieval. This avoids crashing the
+    request pipeline while repairing the bad value.
+
+    Loaded users are cached for ``AUTH_USER_CACHE_TIMEOUT`` seconds under a
+    per-user version that is bumped whenever the row or the balance changes,
+    so most authenticated requests never query the users table. Settings
+    leave the cache off unless ``CACHES`` is shared by all workers.
     """
     def get_user(self, user_id):
+        timeout = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 300)
+        if not timeout:
+            return self._load_user(user_id)
+        # Read the version before the row; see invalidate_cached_user_on_commit
+        version = cache.get_or_set(_version_key(user_id), 1, timeout=None)
+        key = _user_key(user_id, version)
+        user = cache.get(key)
+        if user is None:
+            user = self._load_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, timeout)
+        return user if self.user_can_authenticate(user) else None
+
+    def _load_user(self, user_id):
         try:
             return super().get_user(user_id)
         except InvalidOperation:
-            # Try to repair the user's balance at the DB level and retry
+            # ledger imports this module for its cache invalidation
+            from .ledger import repair_balances
             try:
-                with connection.cursor() as cursor:
-                    # SQLite uses ? parameter marker
-                    cursor.execute(
-                        "UPDATE accounts_customuser SET balance = ? WHERE id = ?",
-                        [str(Decimal('0.00')), user_id]
-                    )
+                # Reads only the ledger and writes with a bare UPDATE, so the
+                # corrupt value is never loaded, on any backend
+                repair_balances([user_id])
             except Exception:
                 # If repair fails, return None to avoid breaking the request
                 return None
@@ -29,4 +84,3 @@ class CleaningModelBackend(ModelBackend):
                 return super().get_user(user_id)
             except Exception:
                 return None
-
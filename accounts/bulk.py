@@ -0,0 +1,171 @@
+"""Bulk balance top-ups from an uploaded file.
+
+A file is a stream of ``(user, amount)`` rows, as CSV (``user,amount``, with
+an optional header) or NDJSON (``{"user": ..., "amount": ...}`` per line).
+Name the user column ``id`` or ``username`` (CSV header, NDJSON key) to say
+which it holds. A plain ``user`` column, or a CSV without a header, may hold
+either; a value that is one user's id and another's username is then
+rejected as ambiguous. Rows are read lazily and validated a chunk at a time,
+with two queries per chunk to resolve the users. The valid credits are
+applied by ``ledger.credit_many`` inside one transaction for the whole file.
+"""
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from .ledger import _amount, balance_problem, credit_many, raw_balances
+from .models import CustomUser
+
+FORMATS = ('csv', 'ndjson')
+USER_COLUMNS = ('id', 'username', 'user')
+# Keeps each chunk's id/username lookups under SQLite's 999-parameter limit
+DEFAULT_CHUNK_SIZE = 900
+# Largest single credit; CustomUser.balance holds at most 10 digits
+MAX_AMOUNT = Decimal('1000000.00')
+_balance = CustomUser._meta.get_field('balance')
+# Largest balance the field can store; a credit may not go past it
+MAX_BALANCE = Decimal(10) ** (_balance.max_digits - _balance.decimal_places) - Decimal('0.01')
+AMBIGUOUS = 'ambiguous'
+
+
+class TopUpReport:
+    """Outcome of a bulk top-up: rows read, valid rows and their total, one
+    error per bad row, and whether the credits were committed."""
+    def __init__(self):
+        self.rows = 0
+        self.valid = 0
+        self.total = Decimal('0.00')
+        self.errors = []
+        self.committed = False
+
+    def error(self, line, user, message):
+        self.errors.append({'line': line, 'user': user, 'error': message})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'valid': self.valid,
+            'total': str(self.total),
+            'committed': self.committed,
+            'errors': self.errors,
+        }
+
+
+def text_stream(binary):
+    """Decode an uploaded file (or any binary stream) line by line."""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line, column, user, amount)``; malformed lines yield ``amount=None``.
+
+    ``column`` is the user column's name, one of ``USER_COLUMNS``.
+    """
+    if fmt == 'csv':
+        reader = csv.reader(stream)
+        column = 'user'
+        for row in reader:
+            line = reader.line_num
+            if not row or not ''.join(row).strip():
+                continue
+            if len(row) != 2:
+                yield line, column, ','.join(row), None
+            elif line == 1 and row[1].strip().lower() == 'amount':
+                # header; any other name for the user column means either
+                column = row[0].strip().lower()
+                if column not in USER_COLUMNS:
+                    column = 'user'
+            else:
+                yield line, column, row[0].strip(), row[1].strip()
+    elif fmt == 'ndjson':
+        for line, text in enumerate(stream, 1):
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+                [column] = [name for name in USER_COLUMNS if name in record]
+                yield line, column, str(record[column]).strip(), str(record['amount']).strip()
+            except (ValueError, KeyError, TypeError):
+                yield line, 'user', text.strip()[:100], None
+    else:
+        raise ValueError(f'Unknown format {fmt!r}; expected one of {", ".join(FORMATS)}')
+
+
+def _resolve(users):
+    """Map each ``(column, identifier)`` in ``users`` to ``(pk, role, raw
+    balance)``, or to ``AMBIGUOUS``, with two queries."""
+    # ASCII digits only: isdigit() is also true for '²', which int() rejects
+    ids = [int(u) for column, u in users if column != 'username' and u.isascii() and u.isdecimal()]
+    names = [u for column, u in users if column != 'id']
+    fields = ('pk', 'username', 'user_role', 'raw_balance')
+    by_id, by_name = {}, {}
+    for pk, username, role, raw in raw_balances(CustomUser.objects.filter(pk__in=ids)).values_list(*fields):
+        by_id[str(pk)] = (pk, role, raw)
+    for pk, username, role, raw in raw_balances(CustomUser.objects.filter(username__in=names)).values_list(*fields):
+        by_name[username] = (pk, role, raw)
+
+    found = {}
+    for column, u in users:
+        candidates = {match for match in (by_id.get(u) if column != 'username' else None,
+                                          by_name.get(u) if column != 'id' else None) if match}
+        if len(candidates) == 1:
+            found[column, u] = candidates.pop()
+        elif candidates:
+            found[column, u] = AMBIGUOUS
+    return found
+
+
+def top_up(rows, kind='staff_credit', reference='', chunk_size=DEFAULT_CHUNK_SIZE,
+           skip_invalid=False, dry_run=False):
+    """Validate ``rows`` from ``read_rows`` and credit the valid ones.
+
+    With any invalid row nothing is applied, unless ``skip_invalid``. A
+    user listed on several rows gets the sum. Staff users can't be credited.
+    """
+    report = TopUpReport()
+    credits = {}
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        report.rows += len(chunk)
+        users = _resolve({(column, user) for _, column, user, amount in chunk if amount is not None})
+        for line, column, user, amount in chunk:
+            if amount is None:
+                report.error(line, user, 'Expected a user and an amount')
+                continue
+            if (column, user) not in users:
+                report.error(line, user, 'No such user')
+                continue
+            if users[column, user] == AMBIGUOUS:
+                report.error(line, user, 'Both a user id and a username; name the column id or username')
+                continue
+            pk, role, raw_balance = users[column, user]
+            if role == 'staff':
+                report.error(line, user, 'Staff balances cannot be topped up')
+                continue
+            try:
+                value = _amount(amount)
+            except (InvalidOperation, ValueError):
+                report.error(line, user, 'Amount must be a positive number')
+                continue
+            if value > MAX_AMOUNT:
+                report.error(line, user, f'Amount is over the {MAX_AMOUNT} limit per row')
+                continue
+            if balance_problem(raw_balance, _balance):
+                report.error(line, user, 'Stored balance is corrupt; run fix_balances first')
+                continue
+            if Decimal(raw_balance) + credits.get(pk, Decimal('0.00')) + value > MAX_BALANCE:
+                report.error(line, user, f'Would take the balance over {MAX_BALANCE}')
+                continue
+            credits[pk] = credits.get(pk, Decimal('0.00')) + value
+            report.valid += 1
+            report.total += value
+
+    if dry_run or not credits or (report.errors and not skip_invalid):
+        return report
+    credit_many(credits, kind, reference=reference)
+    report.committed = True
+    return report
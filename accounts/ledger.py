@@ -0,0 +1,215 @@
+"""Balance ledger operations.
+
+Every change to ``CustomUser.balance`` goes through this module. Each call
+appends ``BalanceEntry`` rows and applies the same amounts to the cached
+``balance`` column with single-statement ``F()`` increments, all inside one
+transaction, so concurrent writers can't lose each other's updates and no row
+is held locked while Python does arithmetic.
+"""
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from django.db import connection, transaction
+from django.db.models import Case, CharField, DecimalField, ExpressionWrapper, F, Max, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+from .backends import invalidate_cached_user_on_commit, invalidate_cached_users_on_commit
+from .models import BalanceEntry, BalanceSnapshot, CustomUser
+
+CENT = Decimal('0.01')
+# credit_many gives an amount its own UPDATE once this many users share it
+SHARED_AMOUNT_MIN_USERS = 20
+
+
+class InsufficientFunds(Exception):
+    pass
+
+
+def _amount(value):
+    amount = Decimal(value).quantize(CENT)
+    if amount <= 0:
+        raise ValueError('Amount must be positive')
+    return amount
+
+
+def credit(user_id, amount, kind, reference=''):
+    """Add ``amount`` to a user's balance and record it in the ledger."""
+    amount = _amount(amount)
+    with transaction.atomic():
+        updated = CustomUser.objects.filter(pk=user_id).update(balance=F('balance') + amount)
+        if not updated:
+            raise CustomUser.DoesNotExist(f'No user with id {user_id}')
+        invalidate_cached_user_on_commit(user_id)
+        return BalanceEntry.objects.create(user_id=user_id, amount=amount, kind=kind, reference=reference)
+
+
+def credit_many(credits, kind, reference=''):
+    """Credit many users at once; ``credits`` maps user id to amount.
+
+    All in one transaction: users sharing an amount (the usual promotion)
+    are credited by one ``UPDATE ... WHERE id IN (...)`` per chunk, the rest
+    by ``UPDATE ... SET balance = balance + CASE id WHEN ...`` statements, and
+    the entries go in with ``bulk_create``. Every user must exist; returns
+    the entries.
+    """
+    credits = {user_id: _amount(amount) for user_id, amount in credits.items()}
+    by_amount = {}
+    for user_id, amount in credits.items():
+        by_amount.setdefault(amount, []).append(user_id)
+    shared = {amount: ids for amount, ids in by_amount.items() if len(ids) >= SHARED_AMOUNT_MIN_USERS}
+    mixed = sorted(pk for amount, ids in by_amount.items() if amount not in shared for pk in ids)
+
+    max_params = connection.features.max_query_params or 3000
+    money = DecimalField(max_digits=10, decimal_places=2)
+    with transaction.atomic():
+        updated = 0
+        for amount, ids in shared.items():
+            ids.sort()
+            for start in range(0, len(ids), max_params - 1):
+                updated += CustomUser.objects.filter(pk__in=ids[start:start + max_params - 1]).update(
+                    balance=F('balance') + amount
+                )
+        # Each user costs three parameters here: the IN list, the WHEN and the THEN
+        per_statement = max_params // 3
+        for start in range(0, len(mixed), per_statement):
+            chunk = mixed[start:start + per_statement]
+            updated += CustomUser.objects.filter(pk__in=chunk).update(balance=F('balance') + Case(
+                *[When(pk=pk, then=Value(credits[pk])) for pk in chunk],
+                output_field=money,
+            ))
+        if updated != len(credits):
+            raise CustomUser.DoesNotExist('Some of the users to credit do not exist')
+        invalidate_cached_users_on_commit(credits)
+        return BalanceEntry.objects.bulk_create([
+            BalanceEntry(user_id=pk, amount=amount, kind=kind, reference=reference)
+            for pk, amount in sorted(credits.items())
+        ])
+
+
+def transfer(from_user_id, to_user_id, amount, reference='',
+             debit_kind='ride_payment', credit_kind='ride_earning'):
+    """Move ``amount`` between two users as a pair of ledger entries.
+
+    The debit only applies while the payer's balance covers it; otherwise
+    ``InsufficientFunds`` is raised and nothing is written. Rows are updated
+    in primary key order so opposing transfers can't deadlock.
+    """
+    amount = _amount(amount)
+    with transaction.atomic():
+        for user_id in sorted({from_user_id, to_user_id}):
+            if user_id == from_user_id:
+                debited = CustomUser.objects.filter(pk=user_id, balance__gte=amount).update(
+                    balance=F('balance') - amount
+                )
+                if not debited:
+                    raise InsufficientFunds(f'User {user_id} cannot cover {amount}')
+            if user_id == to_user_id:
+                CustomUser.objects.filter(pk=user_id).update(balance=F('balance') + amount)
+            invalidate_cached_user_on_commit(user_id)
+
+        return BalanceEntry.objects.bulk_create([
+            BalanceEntry(user_id=from_user_id, amount=-amount, kind=debit_kind, reference=reference),
+            BalanceEntry(user_id=to_user_id, amount=amount, kind=credit_kind, reference=reference),
+        ])
+
+
+def with_ledger_totals(users, settled_before=None):
+    """Annotate ``users`` with ``ledger_balance`` and ``ledger_last_entry``.
+
+    The balance is the user's latest snapshot plus the sum of entries appended
+    after it, computed in the same statement that reads ``balance``, so the
+    two can be compared without racing concurrent writers. With
+    ``settled_before`` only entries created before that instant are counted,
+    which is what a snapshot must use: ids are allocated before commit, so a
+    fresh entry with a lower id than its neighbours may still be in flight.
+    """
+    latest = BalanceSnapshot.objects.filter(user=OuterRef('pk')).order_by('-last_entry_id')
+    tail = BalanceEntry.objects.filter(user=OuterRef('pk'), id__gt=OuterRef('snapshot_last_entry'))
+    if settled_before is not None:
+        tail = tail.filter(created_at__lt=settled_before)
+    tail = tail.order_by().values('user')
+
+    money = DecimalField(max_digits=12, decimal_places=2)
+    return users.annotate(
+        snapshot_balance=Coalesce(Subquery(latest.values('balance')[:1]), Value(Decimal('0.00')), output_field=money),
+        snapshot_last_entry=Coalesce(Subquery(latest.values('last_entry_id')[:1]), Value(0)),
+    ).annotate(
+        ledger_balance=ExpressionWrapper(
+            F('snapshot_balance') + Coalesce(
+                Subquery(tail.annotate(total=Sum('amount')).values('total')[:1]),
+                Value(Decimal('0.00')),
+                output_field=money,
+            ),
+            output_field=money,
+        ),
+        ledger_last_entry=Coalesce(
+            Subquery(tail.annotate(last=Max('id')).values('last')[:1]),
+            F('snapshot_last_entry'),
+        ),
+    )
+
+
+def ledger_balance(user_id):
+    """Return the user's balance as derived from the ledger alone."""
+    user = with_ledger_totals(CustomUser.objects.filter(pk=user_id)).values('ledger_balance').get()
+    return Decimal(user['ledger_balance']).quantize(CENT)
+
+
+def take_snapshots(user_ids, settle_seconds=300):
+    """Snapshot the settled ledger totals of ``user_ids`` and drop older snapshots."""
+    settled_before = timezone.now() - timedelta(seconds=settle_seconds)
+    rows = with_ledger_totals(CustomUser.objects.filter(pk__in=user_ids), settled_before).values_list(
+        'pk', 'ledger_balance', 'ledger_last_entry', 'snapshot_last_entry'
+    )
+    snapshots = [
+        BalanceSnapshot(user_id=pk, balance=Decimal(balance).quantize(CENT), last_entry_id=last)
+        for pk, balance, last, previous in rows
+        if last != previous
+    ]
+    with transaction.atomic():
+        created = BalanceSnapshot.objects.bulk_create(snapshots)
+        for snapshot in snapshots:
+            BalanceSnapshot.objects.filter(
+                user_id=snapshot.user_id, last_entry_id__lt=snapshot.last_entry_id
+            ).delete()
+    return created
+
+
+def balance_problem(raw, field=None):
+    """Why a raw stored balance can't be loaded as a Decimal, or None if it can."""
+    field = field or CustomUser._meta.get_field('balance')
+    try:
+        # Convert using str() to handle bytes/None etc in a predictable way
+        dec = Decimal(str(raw))
+    except (InvalidOperation, TypeError, ValueError):
+        return 'invalid'
+    if not dec.is_finite():
+        return 'invalid'
+    if abs(dec) >= Decimal(10) ** (field.max_digits - field.decimal_places):
+        return 'out_of_range'
+    return None
+
+
+def raw_balances(users):
+    """``(pk, stored balance as text)`` for ``users``; never converts to Decimal."""
+    return users.annotate(raw_balance=Cast('balance', CharField())).values_list('pk', 'raw_balance')
+
+
+def repair_balances(user_ids):
+    """Set the balances of ``user_ids`` to their ledger totals; the one repair
+    for balances that can't be loaded. Returns ``{user_id: new balance}``.
+
+    Only the ledger is read, never the corrupt column, so this is safe to call
+    before the users can be loaded.
+    """
+    repairs = {
+        pk: Decimal(total).quantize(CENT)
+        for pk, total in with_ledger_totals(CustomUser.objects.filter(pk__in=user_ids)).values_list('pk', 'ledger_balance')
+    }
+    if repairs:
+        with transaction.atomic():
+            CustomUser.objects.filter(pk__in=repairs).update(balance=Case(
+                *[When(pk=pk, then=Value(amount)) for pk, amount in repairs.items()],
+                output_field=CustomUser._meta.get_field('balance'),
+            ))
+            invalidate_cached_users_on_commit(repairs)
+    return repairs
@@ -0,0 +1,72 @@
+import csv
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from accounts.bulk import DEFAULT_CHUNK_SIZE, FORMATS, read_rows, text_stream, top_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Credit many users from a CSV (user,amount) or NDJSON "
+        "({\"user\": ..., \"amount\": ...}) file. Name the user column id or "
+        "username to say which it holds; a plain user column may hold either, "
+        "and a value that is one user's id and another's username is rejected. "
+        "Rows are validated in chunks and every valid credit is applied in one "
+        "transaction with set-based balance updates. Any invalid row aborts the "
+        "whole file unless --skip-invalid is given; each one is reported with "
+        "its line number. A row that would take a balance past what the "
+        "field can store is invalid."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, or '-' for stdin")
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension, else csv')
+        parser.add_argument('--kind', choices=['staff_credit', 'top_up'], default='staff_credit',
+                            help='Ledger entry kind for the credits')
+        parser.add_argument('--reference', default='', help='Ledger reference, e.g. the promotion name')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows validated per chunk')
+        parser.add_argument('--skip-invalid', action='store_true', help='Apply the valid rows even if some are not')
+        parser.add_argument('--dry-run', action='store_true', help='Validate only; change nothing')
+        parser.add_argument('--errors', help='Also write the error report to this CSV file')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        try:
+            binary = sys.stdin.buffer if path == '-' else open(path, 'rb')
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+
+        started = time.perf_counter()
+        with text_stream(binary) as stream:
+            report = top_up(
+                read_rows(stream, fmt),
+                kind=options['kind'],
+                reference=options['reference'][:64],
+                chunk_size=options['chunk_size'],
+                skip_invalid=options['skip_invalid'],
+                dry_run=options['dry_run'],
+            )
+        elapsed = time.perf_counter() - started
+
+        for error in report.errors:
+            self.stderr.write(f"line {error['line']}: {error['user']}: {error['error']}")
+        if options['errors']:
+            with open(options['errors'], 'w', newline='', encoding='utf-8') as fh:
+                writer = csv.DictWriter(fh, fieldnames=['line', 'user', 'error'])
+                writer.writeheader()
+                writer.writerows(report.errors)
+
+        rate = report.rows / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Rows: {report.rows}  valid: {report.valid}  invalid: {len(report.errors)}  "
+            f"total: {report.total}  ({elapsed:.2f}s, {rate:.0f} rows/s)"
+        )
+        if report.committed:
+            self.stdout.write(self.style.SUCCESS(f"Credited {report.total} across {report.valid} rows."))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING("Dry run, nothing changed."))
+        elif report.errors:
+            raise CommandError(f"{len(report.errors)} invalid rows; nothing applied (see --skip-invalid)")
+        else:
+            self.stdout.write("Nothing to apply.")
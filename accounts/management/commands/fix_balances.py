@@ -1,60 +1,64 @@
 from django.core.management.base import BaseCommand
-from decimal import Decimal, InvalidOperation
-from django.db import connection, transaction
+from accounts.ledger import balance_problem, raw_balances, repair_balances, with_ledger_totals
 from accounts.models import CustomUser
 
+
 class Command(BaseCommand):
     help = (
-        "Fix invalid balance values for CustomUser by setting them to 0.00 when "
-        "Decimal conversion fails. Uses raw SQL to avoid ORM Decimal conversion "
-        "errors when the DB contains corrupt values."
+        "Find CustomUser balances that can't be loaded as Decimals (malformed or "
+        "beyond the field's max_digits) and repair them. Balances are read as "
+        "text, so corrupt values never reach Django's Decimal conversion, in "
+        "primary key chunks of bounded size. Each chunk's repairs are one "
+        "UPDATE that sets the balance to the user's ledger total, so "
+        "reconcile_balances stays clean afterwards. Works on any database "
+        "backend. --dry-run only reports; --show also lists every stored value."
     )
 
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report bad balances without changing them')
+        parser.add_argument('--show', action='store_true', help='Print every raw stored balance')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Users read per query')
+
     def handle(self, *args, **options):
-        # Get model field metadata so we can validate values against max_digits
-        field = CustomUser._meta.get_field('balance')
-        max_digits = field.max_digits
-        decimal_places = field.decimal_places
-        # Maximum absolute value allowed (e.g. for max_digits=10, decimal_places=2 -> 10**8)
-        max_allowed = Decimal(10) ** (max_digits - decimal_places)
-
-        # Read raw values directly from the DB to avoid Django's Decimal conversion
-        # that happens when loading model instances and can raise InvalidOperation
-        # if the stored value is malformed.
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT id, balance FROM accounts_customuser")
-            rows = cursor.fetchall()
-
-        bad_ids = []
-        for id_, balance in rows:
-            try:
-                # Convert using str() to handle bytes/None etc in a predictable way
-                dec = Decimal(str(balance))
-            except (InvalidOperation, TypeError, ValueError):
-                bad_ids.append(id_)
-                continue
+        users = CustomUser.objects.order_by('pk')
+        checked = bad = fixed = 0
+        last_id = 0
 
-            # If the absolute value exceeds the field's allowed maximum mark it as bad
-            try:
-                if abs(dec) >= max_allowed:
-                    bad_ids.append(id_)
-            except Exception:
-                # Any unexpected error treat as bad so we can repair it
-                bad_ids.append(id_)
+        if options['show']:
+            self.stdout.write('id | balance')
+        while True:
+            rows = list(raw_balances(users.filter(pk__gt=last_id))[:options['chunk_size']])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            checked += len(rows)
 
-        if not bad_ids:
-            self.stdout.write(self.style.SUCCESS("No invalid balances found."))
-            return
-
-        fixed = 0
-        # Update invalid rows to a clean decimal string. Use a transaction for safety.
-        with transaction.atomic():
-            with connection.cursor() as cursor:
-                for uid in bad_ids:
-                    cursor.execute("UPDATE accounts_customuser SET balance = ? WHERE id = ?", ["0.00", uid])
-                    fixed += 1
+            problems = {}
+            for pk, raw in rows:
+                if options['show']:
+                    self.stdout.write(f"{pk} | {raw!r}")
+                problem = balance_problem(raw)
+                if problem:
+                    problems[pk] = (raw, problem)
+            if not problems:
+                continue
+            bad += len(problems)
 
-        for uid in bad_ids:
-            self.stdout.write(f"Fixed user id={uid} balance -> 0.00")
+            if options['dry_run']:
+                repairs = dict(
+                    with_ledger_totals(CustomUser.objects.filter(pk__in=problems)).values_list('pk', 'ledger_balance')
+                )
+            else:
+                repairs = repair_balances(problems)
+                fixed += len(repairs)
+            for pk, (raw, problem) in problems.items():
+                action = 'would set' if options['dry_run'] else 'set'
+                self.stdout.write(f"user id={pk} balance={raw!r} ({problem}) {action} -> {repairs[pk]:.2f}")
 
-        self.stdout.write(self.style.SUCCESS(f"Balances fixed: {fixed}"))
+        self.stdout.write(f"Users checked: {checked}")
+        if not bad:
+            self.stdout.write(self.style.SUCCESS("No invalid balances found."))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Invalid balances found: {bad} (dry run, nothing changed)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Balances fixed: {fixed}"))
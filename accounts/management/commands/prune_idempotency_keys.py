@@ -0,0 +1,18 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from accounts.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete idempotency keys older than IDEMPOTENCY_KEY_TTL. Expired keys "
+        "are never replayed anyway (a retry reuses the row), so this only keeps "
+        "the table small. Safe to run from cron at any time."
+    )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(f'Deleted {deleted} idempotency keys older than {cutoff:%Y-%m-%d %H:%M}')
@@ -0,0 +1,64 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from accounts.backends import invalidate_cached_user
+from accounts.ledger import CENT, take_snapshots, with_ledger_totals
+from accounts.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that every CustomUser.balance equals the ledger total (latest "
+        "snapshot plus the entries after it). Each user's stored and derived "
+        "balance are read in the same statement, so a mismatch can't be caused "
+        "by a concurrent ledger write. --fix applies the difference as an F() "
+        "increment, which stays correct even if new entries land meanwhile. "
+        "--snapshot records settled totals so later runs only sum new entries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Set mismatched balances to the ledger total')
+        parser.add_argument('--snapshot', action='store_true', help='Record a snapshot for every user checked')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Users checked per query')
+        parser.add_argument(
+            '--settle-seconds', type=int, default=300,
+            help='Only snapshot entries older than this, so in-flight transactions are never skipped',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        checked = mismatched = fixed = snapshotted = 0
+        last_id = 0
+
+        while True:
+            users = with_ledger_totals(CustomUser.objects.filter(pk__gt=last_id)).order_by('pk')
+            rows = list(users.values_list('pk', 'balance', 'ledger_balance')[:chunk_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            checked += len(rows)
+
+            for pk, balance, derived in rows:
+                derived = Decimal(derived).quantize(CENT)
+                delta = derived - balance
+                if not delta:
+                    continue
+                mismatched += 1
+                self.stdout.write(f"user id={pk} balance={balance} ledger={derived} diff={delta}")
+                if options['fix']:
+                    CustomUser.objects.filter(pk=pk).update(balance=F('balance') + delta)
+                    invalidate_cached_user(pk)
+                    fixed += 1
+
+            if options['snapshot']:
+                snapshotted += len(take_snapshots([r[0] for r in rows], options['settle_seconds']))
+
+        self.stdout.write(f"Users checked: {checked}")
+        if options['snapshot']:
+            self.stdout.write(f"Snapshots taken: {snapshotted}")
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS("Every balance matches the ledger."))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Balances fixed: {fixed}"))
+        else:
+            self.stdout.write(self.style.WARNING(f"Mismatched balances: {mismatched} (rerun with --fix)"))
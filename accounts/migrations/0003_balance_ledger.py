@@ -0,0 +1,88 @@
+# Generated by Django 4.2.15 on 2026-10-18 11:32
+
+from decimal import Decimal, InvalidOperation
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Cast
+import django.db.models.deletion
+
+
+def seed_opening_entries(apps, schema_editor):
+    """Give every valid non-zero balance an 'opening' ledger entry.
+
+    Balances are read as text, so malformed values never pass through
+    Django's Decimal conversion, and each is validated here. A value that
+    isn't a finite decimal within the field's max_digits gets no entry and
+    is reset to its ledger total, 0.00: the rule accounts.ledger.
+    repair_balances applies to such balances later on.
+    """
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    BalanceEntry = apps.get_model('accounts', 'BalanceEntry')
+    db = schema_editor.connection.alias
+    field = CustomUser._meta.get_field('balance')
+    limit = Decimal(10) ** (field.max_digits - field.decimal_places)
+    users = CustomUser.objects.using(db).annotate(raw=Cast('balance', models.CharField())).order_by('pk')
+    last_id = 0
+    while True:
+        rows = list(users.filter(pk__gt=last_id).values_list('pk', 'raw')[:2000])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        entries, corrupt = [], []
+        for pk, raw in rows:
+            try:
+                amount = Decimal(str(raw)).quantize(Decimal('0.01'))
+            except (InvalidOperation, TypeError, ValueError):
+                corrupt.append(pk)
+                continue
+            if not amount.is_finite() or abs(amount) >= limit:
+                corrupt.append(pk)
+            elif amount:
+                entries.append(BalanceEntry(user_id=pk, amount=amount, kind='opening', reference=''))
+        BalanceEntry.objects.using(db).bulk_create(entries)
+        CustomUser.objects.using(db).filter(pk__in=corrupt).update(balance=Decimal('0.00'))
+
+
+def remove_opening_entries(apps, schema_editor):
+    BalanceEntry = apps.get_model('accounts', 'BalanceEntry')
+    BalanceEntry.objects.using(schema_editor.connection.alias).filter(kind='opening').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_alter_customuser_balance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('last_entry_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_entry_id'],
+                'indexes': [models.Index(fields=['user', '-last_entry_id'], name='accounts_ba_user_id_6fddf4_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('kind', models.CharField(choices=[('opening', 'Opening balance'), ('top_up', 'Top-up'), ('staff_credit', 'Staff credit'), ('ride_payment', 'Ride payment'), ('ride_earning', 'Ride earning'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('reference', models.CharField(blank=True, max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['user', 'id'], name='accounts_ba_user_id_d16fbe_idx')],
+            },
+        ),
+        migrations.RunPython(seed_opening_entries, remove_opening_entries),
+    ]
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models.functions import Lower
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
@@ -19,6 +20,15 @@ class CustomUser(AbstractUser):
         validators=[MinValueValidator(Decimal('0.00'))]
     )
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Prefix search in accounts.search matches on the lowercased columns
+            models.Index(Lower('username'), name='user_username_lower_idx'),
+            models.Index(Lower('first_name'), name='user_first_name_lower_idx'),
+            models.Index(Lower('last_name'), name='user_last_name_lower_idx'),
+            models.Index(Lower('email'), name='user_email_lower_idx'),
+        ]
+
     def get_full_name(self):
         """Return the full name with middle name if available."""
         full_name = super().get_full_name()
@@ -27,3 +37,81 @@ class CustomUser(AbstractUser):
             if len(names) >= 2:
                 return f"{names[0]} {self.middle_name} {' '.join(names[1:])}"
         return full_name
+
+
+class BalanceEntry(models.Model):
+    """One append-only line of the balance ledger.
+
+    ``CustomUser.balance`` is the running total of a user's entries; it is kept
+    in step by ``accounts.ledger`` inside the same transaction as the insert.
+    Entries are never updated or deleted.
+    """
+    KIND_CHOICES = (
+        ('opening', 'Opening balance'),
+        ('top_up', 'Top-up'),
+        ('staff_credit', 'Staff credit'),
+        ('ride_payment', 'Ride payment'),
+        ('ride_earning', 'Ride earning'),
+        ('adjustment', 'Adjustment'),
+    )
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='balance_entries')
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    reference = models.CharField(max_length=64, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['user', 'id'])]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.amount} for user {self.user_id}"
+
+
+class BalanceSnapshot(models.Model):
+    """Ledger total for a user up to and including ``last_entry_id``.
+
+    Reconciliation starts from the latest snapshot and only sums the entries
+    appended after it, so checking a balance doesn't rescan its whole history.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='balance_snapshots')
+    balance = models.DecimalField(max_digits=12, decimal_places=2)
+    last_entry_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-last_entry_id']
+        indexes = [models.Index(fields=['user', '-last_entry_id'])]
+
+    def __str__(self):
+        return f"Snapshot of user {self.user_id} at entry {self.last_entry_id}: {self.balance}"
+
+
+class IdempotencyKey(models.Model):
+    """A user's idempotency key for one view (see ``ridebooking.idempotency``).
+
+    The unique constraint is what makes a key usable once across every
+    worker: the first request inserts the row, a retry hits the constraint
+    and finds the stored response, or ``status_code`` still empty while the
+    first request is running.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='idempotency_keys')
+    view = models.CharField(max_length=200)
+    key = models.CharField(max_length=128)
+    fingerprint = models.CharField(max_length=64)
+    # Empty until the first request finishes; a claim past this is abandoned
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    locked_until = models.DateTimeField()
+    headers = models.JSONField(default=dict)
+    content = models.BinaryField(default=b'')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'view', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [models.Index(fields=['created_at'])]
+
+    def __str__(self):
+        return f"{self.key} for user {self.user_id} on {self.view}"
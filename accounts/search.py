@@ -0,0 +1,64 @@
+"""Prefix search over users for the staff typeahead and user list.
+
+Each searchable column has an index on its lowercased value (see
+``CustomUser.Meta``). A prefix is matched as the range ``[term, term + 1)``
+on that expression, which every backend answers from the index; a LIKE,
+which ``istartswith`` would emit, can only use it on some backends and
+collations. The range is rechecked with ``startswith`` so collation quirks
+can't widen the match.
+"""
+from django.db.models import Q
+from django.db.models.functions import Lower
+from rides.pagination import keyset_paginate
+from .models import CustomUser
+
+SEARCH_FIELDS = ('username', 'first_name', 'last_name', 'email')
+SEARCH_PAGE_SIZE = 20
+
+
+def _upper_bound(term):
+    # The smallest string greater than every string starting with ``term``
+    return term[:-1] + chr(ord(term[-1]) + 1)
+
+
+def _prefix(field, term):
+    key = f'{field}_lower'
+    return Q(**{f'{key}__gte': term, f'{key}__lt': _upper_bound(term), f'{key}__startswith': term})
+
+
+def search_users(term='', roles=None):
+    """Users matching ``term`` as a prefix, optionally limited to ``roles``.
+
+    One word matches the start of the username, first name, last name or
+    email; two or more match first name then last name ("jo smi").
+    """
+    users = CustomUser.objects.all()
+    if roles:
+        users = users.filter(user_role__in=roles)
+    words = term.lower().split()
+    if not words:
+        return users
+    users = users.annotate(**{f'{f}_lower': Lower(f) for f in SEARCH_FIELDS})
+    if len(words) == 1:
+        match = Q()
+        for field in SEARCH_FIELDS:
+            match |= _prefix(field, words[0])
+        return users.filter(match)
+    return users.filter(_prefix('first_name', words[0]), _prefix('last_name', ' '.join(words[1:])))
+
+
+def search_page(term='', roles=None, cursor=None, page_size=SEARCH_PAGE_SIZE):
+    """One keyset page of ``search_users``, ordered by username."""
+    return keyset_paginate(search_users(term, roles), cursor, fields=('username',), descending=False,
+                           page_size=page_size)
+
+
+def user_summary(user):
+    return {
+        'id': user.pk,
+        'username': user.username,
+        'name': user.get_full_name(),
+        'email': user.email,
+        'role': user.user_role,
+        'balance': str(user.balance),
+    }
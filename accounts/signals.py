@@ -0,0 +1,11 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .backends import invalidate_cached_user_on_commit
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    # Logins, password changes and profile edits all land here
+    invalidate_cached_user_on_commit(instance.pk)
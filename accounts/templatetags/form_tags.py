@@ -1,7 +1,16 @@
+import uuid
 from django import template
+from django.utils.html import format_html
+from ridebooking.idempotency import FIELD
 
 register = template.Library()
 
 @register.filter(name='addclass')
 def addclass(field, css_class):
     return field.as_widget(attrs={'class': css_class})
+
+
+@register.simple_tag
+def idempotency_field():
+    """Hidden input with a fresh idempotency key, so a resubmitted form is replayed"""
+    return format_html('<input type="hidden" name="{}" value="{}">', FIELD, uuid.uuid4().hex)
@@ -1,3 +1,258 @@
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+from datetime import timedelta
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from . import ledger
+from .bulk import MAX_BALANCE, read_rows, top_up
+from .backends import CleaningModelBackend
+from .ledger import InsufficientFunds, credit, credit_many, ledger_balance, transfer
+from .models import BalanceEntry, CustomUser, IdempotencyKey
+from .search import search_page, search_users
 
-# Create your tests here.
+
+def make_user(username, balance='0.00', role='customer'):
+    user = CustomUser.objects.create_user(username=username, password='pw', user_role=role)
+    if Decimal(balance):
+        credit(user.pk, balance, 'top_up')
+    return user
+
+
+def store_raw_balance(user_id, raw):
+    # Written past the ORM, as the legacy corruption was
+    with connection.cursor() as cursor:
+        cursor.execute('UPDATE accounts_customuser SET balance = %s WHERE id = %s', [raw, user_id])
+
+
+class TransferTests(TestCase):
+    def setUp(self):
+        self.payer = make_user('payer', '30.00')
+        self.payee = make_user('payee', role='rider')
+
+    def balances(self):
+        return [CustomUser.objects.get(pk=u.pk).balance for u in (self.payer, self.payee)]
+
+    def test_moves_the_amount_as_two_entries(self):
+        transfer(self.payer.pk, self.payee.pk, '12.50', reference='ride:1')
+        self.assertEqual(self.balances(), [Decimal('17.50'), Decimal('12.50')])
+        self.assertEqual(
+            list(BalanceEntry.objects.filter(reference='ride:1').values_list('user_id', 'amount')),
+            [(self.payer.pk, Decimal('-12.50')), (self.payee.pk, Decimal('12.50'))],
+        )
+
+    def test_may_spend_the_whole_balance(self):
+        transfer(self.payer.pk, self.payee.pk, '30.00')
+        self.assertEqual(self.balances(), [Decimal('0.00'), Decimal('30.00')])
+
+    def test_insufficient_funds_writes_nothing(self):
+        entries = BalanceEntry.objects.count()
+        with self.assertRaises(InsufficientFunds):
+            transfer(self.payer.pk, self.payee.pk, '30.01')
+        self.assertEqual(self.balances(), [Decimal('30.00'), Decimal('0.00')])
+        self.assertEqual(BalanceEntry.objects.count(), entries)
+
+    def test_guard_applies_to_the_current_balance(self):
+        # The second debit is checked against what the first one left
+        transfer(self.payer.pk, self.payee.pk, '20.00')
+        with self.assertRaises(InsufficientFunds):
+            transfer(self.payer.pk, self.payee.pk, '20.00')
+        self.assertEqual(self.balances(), [Decimal('10.00'), Decimal('20.00')])
+
+    def test_rejects_non_positive_amounts(self):
+        for amount in ('0', '-5.00'):
+            with self.subTest(amount=amount), self.assertRaises(ValueError):
+                transfer(self.payer.pk, self.payee.pk, amount)
+
+
+class CreditManyTests(TestCase):
+    def setUp(self):
+        self.users = [make_user(f'user{i}', '1.00') for i in range(10)]
+
+    def test_shared_and_mixed_amounts_across_chunks(self):
+        # Tiny statements: three users share an amount, the rest each get
+        # their own, and the CASE updates need several chunks
+        credits = {u.pk: Decimal('5.00') for u in self.users[:3]}
+        credits.update({u.pk: Decimal(f'{i}.25') for i, u in enumerate(self.users[3:], start=1)})
+        with mock.patch.object(ledger, 'SHARED_AMOUNT_MIN_USERS', 3), \
+                mock.patch.object(connection.features, 'max_query_params', 7):
+            entries = credit_many(credits, 'top_up', reference='promo')
+        self.assertEqual(len(entries), 10)
+        for user in self.users:
+            with self.subTest(user=user.username):
+                expected = Decimal('1.00') + credits[user.pk]
+                self.assertEqual(CustomUser.objects.get(pk=user.pk).balance, expected)
+                self.assertEqual(ledger_balance(user.pk), expected)
+
+    def test_unknown_user_rolls_everything_back(self):
+        credits = {self.users[0].pk: Decimal('5.00'), 999999: Decimal('5.00')}
+        with self.assertRaises(CustomUser.DoesNotExist):
+            credit_many(credits, 'top_up')
+        self.assertEqual(CustomUser.objects.get(pk=self.users[0].pk).balance, Decimal('1.00'))
+        self.assertFalse(BalanceEntry.objects.filter(kind='top_up', amount=Decimal('5.00')).exists())
+
+
+class BalanceRepairTests(TestCase):
+    """The login backend and ``fix_balances`` repair a corrupt balance the same way."""
+    def setUp(self):
+        self.user = make_user('corrupt', '42.00')
+        # Beyond max_digits: loading it raises InvalidOperation
+        store_raw_balance(self.user.pk, 123456789012)
+
+    def test_backend_restores_the_ledger_total(self):
+        user = CleaningModelBackend().get_user(self.user.pk)
+        self.assertEqual(user.balance, Decimal('42.00'))
+
+    def test_fix_balances_restores_the_ledger_total(self):
+        call_command('fix_balances', stdout=StringIO())
+        self.assertEqual(CustomUser.objects.get(pk=self.user.pk).balance, Decimal('42.00'))
+
+
+class OpeningEntriesMigrationTests(TestCase):
+    def seed(self):
+        migration = import_module('accounts.migrations.0003_balance_ledger')
+        migration.seed_opening_entries(apps, SimpleNamespace(connection=connection))
+
+    def test_only_valid_balances_get_opening_entries(self):
+        users = {raw: CustomUser.objects.create_user(username=f'legacy{i}', password='pw')
+                 for i, raw in enumerate(['25.50', '0', 'garbage', '123456789.00', 'NaN'])}
+        for raw, user in users.items():
+            store_raw_balance(user.pk, raw)
+        self.seed()
+
+        self.assertEqual(
+            list(BalanceEntry.objects.filter(kind='opening').values_list('user_id', 'amount')),
+            [(users['25.50'].pk, Decimal('25.50'))],
+        )
+        for raw in ('garbage', '123456789.00', 'NaN'):
+            with self.subTest(raw=raw):
+                self.assertEqual(CustomUser.objects.get(pk=users[raw].pk).balance, Decimal('0.00'))
+                self.assertEqual(ledger_balance(users[raw].pk), Decimal('0.00'))
+
+
+class IdempotencyKeyTests(TestCase):
+    """Keys are claimed through the database, so a retry is caught by any worker."""
+    def setUp(self):
+        self.user = make_user('customer')
+        self.client.force_login(self.user)
+
+    def add_funds(self, amount='10.00', key='key-1'):
+        return self.client.post(reverse('accounts:add_funds'), {'amount': amount}, HTTP_IDEMPOTENCY_KEY=key)
+
+    def balance(self):
+        return CustomUser.objects.get(pk=self.user.pk).balance
+
+    def test_retry_replays_the_first_response(self):
+        first = self.add_funds()
+        retry = self.add_funds()
+        self.assertEqual(retry.status_code, first.status_code)
+        self.assertEqual(retry['Location'], first['Location'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.balance(), Decimal('10.00'))
+
+    def test_key_reused_for_another_body_is_rejected(self):
+        self.add_funds()
+        self.assertEqual(self.add_funds('20.00').status_code, 422)
+        self.assertEqual(self.balance(), Decimal('10.00'))
+
+    def test_in_flight_key_is_a_conflict_until_its_lock_expires(self):
+        self.add_funds()
+        entry = IdempotencyKey.objects.get()
+        IdempotencyKey.objects.filter(pk=entry.pk).update(
+            status_code=None, locked_until=timezone.now() + timedelta(seconds=60),
+        )
+        self.assertEqual(self.add_funds().status_code, 409)
+        IdempotencyKey.objects.filter(pk=entry.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.add_funds().status_code, 302)
+        self.assertEqual(self.balance(), Decimal('20.00'))
+
+    def test_failed_request_releases_its_key(self):
+        with mock.patch('accounts.views.credit', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.add_funds()
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.add_funds()
+        self.assertEqual(self.balance(), Decimal('10.00'))
+
+    def test_expired_keys_are_reused_and_pruned(self):
+        self.add_funds()
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.add_funds().status_code, 302)
+        self.assertEqual(self.balance(), Decimal('20.00'))
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        call_command('prune_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class BulkTopUpTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice', '1.00')
+        self.bob = make_user('bob')
+        # A username that is also bob's id
+        self.numeric = make_user(str(self.bob.pk))
+
+    def top_up(self, text, fmt='csv'):
+        return top_up(read_rows(StringIO(text), fmt))
+
+    def balances(self):
+        return [CustomUser.objects.get(pk=u.pk).balance for u in (self.alice, self.bob, self.numeric)]
+
+    def test_named_column_picks_the_lookup(self):
+        name = self.numeric.username
+        self.assertTrue(self.top_up(f'username,amount\n{name},5.00\n').committed)
+        self.assertTrue(self.top_up(f'{{"id": {name}, "amount": "3.00"}}\n', 'ndjson').committed)
+        self.assertEqual(self.balances(), [Decimal('1.00'), Decimal('3.00'), Decimal('5.00')])
+
+    def test_ambiguous_identifier_is_rejected(self):
+        report = self.top_up(f'user,amount\n{self.numeric.username},5.00\nalice,1.00\n')
+        self.assertFalse(report.committed)
+        self.assertEqual([e['line'] for e in report.errors], [2])
+        self.assertEqual(self.balances(), [Decimal('1.00'), Decimal('0.00'), Decimal('0.00')])
+
+    def test_non_ascii_digits_are_row_errors(self):
+        report = self.top_up('id,amount\n\u00b2,1.00\n\u0661,1.00\n')
+        self.assertEqual([(e['line'], e['error']) for e in report.errors], [(2, 'No such user'), (3, 'No such user')])
+
+    def test_rows_may_not_take_a_balance_past_the_field(self):
+        credit(self.bob.pk, MAX_BALANCE - Decimal('9.99'), 'top_up')
+        report = self.top_up('username,amount\nbob,5.00\nbob,5.00\nalice,5.00\n')
+        self.assertEqual([e['line'] for e in report.errors], [3])
+        self.assertFalse(report.committed)
+
+
+class UserSearchTests(TestCase):
+    def setUp(self):
+        for username, first, last, role in [
+            ('jsmith', 'John', 'Smith', 'customer'),
+            ('jo', 'Joanna', 'Reyes', 'rider'),
+            ('msmith', 'Maria', 'Smithers', 'rider'),
+            ('zed', 'Zed', 'Cruz', 'staff'),
+        ]:
+            CustomUser.objects.create_user(username=username, password='pw', user_role=role, first_name=first,
+                                           last_name=last, email=f'{username}@example.com')
+
+    def found(self, term, roles=None):
+        return sorted(search_users(term, roles).values_list('username', flat=True))
+
+    def test_one_word_is_a_prefix_of_any_field(self):
+        self.assertEqual(self.found('JO'), ['jo', 'jsmith'])
+        self.assertEqual(self.found('smith'), ['jsmith', 'msmith'])
+        self.assertEqual(self.found('zed@'), ['zed'])
+        self.assertEqual(self.found('mith'), [])
+        self.assertEqual(self.found('smith', roles=['rider']), ['msmith'])
+        self.assertEqual(self.found(''), ['jo', 'jsmith', 'msmith', 'zed'])
+
+    def test_two_words_are_first_then_last_name(self):
+        self.assertEqual(self.found('jo smi'), ['jsmith'])
+        self.assertEqual(self.found('m  SMITHERS'), ['msmith'])
+        self.assertEqual(self.found('smith jo'), [])
+
+    def test_pages_by_username(self):
+        first = search_page('', page_size=3)
+        self.assertEqual([user.username for user in first], ['jo', 'jsmith', 'msmith'])
+        self.assertEqual([user.username for user in search_page('', cursor=first.next_cursor, page_size=3)], ['zed'])
@@ -4,11 +4,20 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .forms import CustomUserCreationForm
 from django.db.models import Sum
-from rides.models import Ride, RideEvent
-from datetime import datetime
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from rides.fragments import cached_list, list_cache_key, user_scope
+from rides.models import Ride, RiderDailyStats
+from rides.tasks import record_manual_distance
+from tasks.queue import enqueue
+from datetime import datetime, time, timedelta
 from decimal import Decimal, InvalidOperation
 from .models import CustomUser
-from .backends import CleaningModelBackend
+from .ledger import credit
+from ridebooking.idempotency import idempotent
+
+# Days of rider history shown on the profile
+PROFILE_HISTORY_DAYS = 14
 
 def signup_view(request):
     if request.method == 'POST':
@@ -33,7 +42,7 @@ def profile_view(request):
                 raise InvalidOperation
         except (InvalidOperation, TypeError):
             messages.error(request, 'Please enter a valid non-negative number for distance')
-            return redirect('profile')
+            return redirect('accounts:profile')
 
         # Create a demo ride representing this distance (status dropped)
         demo_ride = Ride.objects.create(
@@ -46,49 +55,60 @@ def profile_view(request):
             status='dropped'
         )
 
-        RideEvent.objects.create(
-            ride=demo_ride,
-            step_count=1,
-            description='Manual distance added from profile (demo)'
-        )
+        # The demo ride's event and the rider's rollup are filled in by the task queue
+        enqueue(record_manual_distance, key=f'manual-distance:{demo_ride.pk}', ride_id=demo_ride.pk)
 
         messages.success(request, f'Manual distance {distance} km added for demo purposes')
-        return redirect('profile')
+        return redirect('accounts:profile')
 
     context = {
         'user': request.user
     }
 
     if request.user.user_role == 'rider':
-        # Get total distance for all completed rides
-        total_distance = Ride.objects.filter(
-            rider=request.user,
-            status='dropped'
-        ).aggregate(total=Sum('total_distance'))['total'] or 0
+        # Totals come from the daily rollup: one row per day, not per ride
+        daily = RiderDailyStats.objects.filter(rider=request.user)
+        total_distance = daily.aggregate(total=Sum('distance'))['total'] or 0
 
-        # Get today's rides and distance
-        today = datetime.now().date()
-        today_rides = Ride.objects.filter(
+        # Days follow TIME_ZONE rather than the server clock; ?date= picks one
+        today = timezone.localdate()
+        try:
+            day = parse_date(request.GET.get('date') or '') or today
+        except ValueError:
+            day = today
+        day_stats = daily.filter(day=day).first()
+        day_start = timezone.make_aware(datetime.combine(day, time.min))
+        day_end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+        day_rides = Ride.objects.filter(
             rider=request.user,
             status='dropped',
-            updated_at__date=today
-        )
-        today_distance = today_rides.aggregate(total=Sum('total_distance'))['total'] or 0
+            updated_at__gte=day_start,
+            updated_at__lt=day_end
+        ).select_related('rider').order_by('-updated_at')
+        fragment_key = list_cache_key(user_scope(request.user.pk), 'profile', day.isoformat())
 
         context.update({
             'total_distance': total_distance,
-            'today_distance': today_distance,
-            'today_rides': today_rides
+            'day': day,
+            'is_today': day == today,
+            'day_distance': day_stats.distance if day_stats else 0,
+            'day_earnings': day_stats.earnings if day_stats else 0,
+            'day_rides': cached_list(fragment_key, lambda: list(day_rides)),
+            'fragment_key': fragment_key,
+            'history': daily.filter(day__gt=day - timedelta(days=PROFILE_HISTORY_DAYS), day__lte=day),
         })
 
     elif request.user.user_role == 'customer':
         # Get all rides for customer
-        rides = Ride.objects.filter(customer=request.user).order_by('-created_at')
-        context['rides'] = rides
+        rides = Ride.objects.filter(customer=request.user).select_related('rider').order_by('-created_at')
+        fragment_key = list_cache_key(user_scope(request.user.pk), 'profile')
+        context['rides'] = cached_list(fragment_key, lambda: list(rides))
+        context['fragment_key'] = fragment_key
 
     return render(request, 'accounts/profile.html', context)
 
 @login_required
+@idempotent
 def add_funds(request):
     # Allow customers to add funds to their own balance
     if request.method == 'POST':
@@ -99,18 +119,16 @@ def add_funds(request):
                 raise InvalidOperation
         except (InvalidOperation, TypeError):
             messages.error(request, 'Please enter a valid positive amount')
-            return redirect('add_funds')
+            return redirect('accounts:add_funds')
 
-        # Update user's balance
-        user = request.user
-        user.balance += amount_decimal
-        user.save()
+        credit(request.user.pk, amount_decimal, 'top_up')
         messages.success(request, f'Added ${amount_decimal} to your balance')
-        return redirect('profile')
+        return redirect('accounts:profile')
 
     return render(request, 'accounts/add_funds.html')
 
 @login_required
+@idempotent
 def staff_add_balance(request):
     if not request.user.user_role == 'staff':
         messages.error(request, 'Access denied!')
@@ -121,15 +139,13 @@ def staff_add_balance(request):
         amount = request.POST.get('amount')
         try:
             user = CustomUser.objects.get(id=user_id)
-            user.balance += Decimal(amount)
-            user.save()
+            credit(user.pk, amount, 'staff_credit', reference=f'staff:{request.user.pk}')
             messages.success(request, f'Successfully added ${amount} to {user.get_full_name()}\'s balance')
-        except (CustomUser.DoesNotExist, InvalidOperation, TypeError):
+        except (CustomUser.DoesNotExist, InvalidOperation, TypeError, ValueError):
             messages.error(request, 'Invalid user or amount')
-        return redirect('staff_add_balance')
+        return redirect('accounts:staff_add_balance')
 
-    users = CustomUser.objects.exclude(user_role='staff')
-    return render(request, 'accounts/add_balance.html', {'users': users})
+    return render(request, 'accounts/add_balance.html')
 
 def logout_view(request):
     # Accept GET or POST for simplicity; perform logout and redirect to home
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rides.models import Ride
+from rides.signals import ride_status_changed
+from .stats import invalidate_dashboard_counts, invalidate_rider_stats
+
+
+@receiver(ride_status_changed)
+def ride_status_changed_handler(sender, ride_id, status, **kwargs):
+    invalidate_dashboard_counts()
+    if status == 'dropped':
+        invalidate_rider_stats()
+
+
+@receiver(post_save, sender=Ride)
+@receiver(post_delete, sender=Ride)
+def ride_saved_or_deleted(sender, **kwargs):
+    # Direct saves (profile demo rides, admin, scripts) bypass the ride views
+    invalidate_dashboard_counts()
+
+
+def _user_count_changed(user):
+    invalidate_dashboard_counts()
+    if user.user_role == 'rider':
+        invalidate_rider_stats()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def user_saved(sender, instance, created, **kwargs):
+    # Logins and profile edits save the user too; only new rows change counts
+    if created:
+        _user_count_changed(instance)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_deleted(sender, instance, **kwargs):
+    _user_count_changed(instance)
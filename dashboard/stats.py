@@ -0,0 +1,149 @@
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Count, DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from accounts.models import CustomUser
+from rides.models import ArchivedRide, Ride, RiderDailyStats
+from ridebooking.db_router import replica_reads_active
+
+RIDER_STATS_VERSION_KEY = 'rider-stats:version'
+DASHBOARD_COUNTS_KEY = 'dashboard:counts'
+RIDER_STATS_PAGE_SIZE = 50
+
+# Public sort keys mapped to the annotated columns they order by
+RIDER_STATS_SORTS = {
+    'name': ('first_name', 'last_name'),
+    'rides': ('completed_rides',),
+    'distance': ('total_distance',),
+    'earnings': ('earnings',),
+}
+DEFAULT_RIDER_STATS_SORT = '-earnings'
+
+
+def _money(expression):
+    return Coalesce(expression, Value(Decimal('0.00')), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def _rider_stats_version():
+    return cache.get_or_set(RIDER_STATS_VERSION_KEY, 1, timeout=None)
+
+
+def invalidate_rider_stats():
+    """Retire every cached leaderboard page by bumping the shared version."""
+    try:
+        cache.incr(RIDER_STATS_VERSION_KEY)
+    except ValueError:
+        cache.set(RIDER_STATS_VERSION_KEY, 2, timeout=None)
+
+
+def normalize_sort(sort):
+    key = (sort or '').lstrip('-')
+    if key not in RIDER_STATS_SORTS:
+        return DEFAULT_RIDER_STATS_SORT
+    return sort
+
+
+def rider_stats_queryset(sort=DEFAULT_RIDER_STATS_SORT):
+    """All riders annotated with their completed ride totals in one grouped query.
+
+    Totals are summed from the daily rollup rather than the rides, so they
+    cost O(days) per rider and still count rides that have been archived.
+    """
+    sort = normalize_sort(sort)
+    prefix = '-' if sort.startswith('-') else ''
+    ordering = [prefix + field for field in RIDER_STATS_SORTS[sort.lstrip('-')]]
+
+    return (
+        CustomUser.objects.filter(user_role='rider')
+        .annotate(
+            completed_rides=Coalesce(Sum('daily_stats__rides'), Value(0)),
+            total_distance=_money(Sum('daily_stats__distance')),
+            earnings=_money(Sum('daily_stats__earnings')),
+        )
+        .order_by(*ordering, 'id')
+    )
+
+
+def rider_leaderboard(sort=DEFAULT_RIDER_STATS_SORT, page=1, page_size=RIDER_STATS_PAGE_SIZE):
+    """Return ``(total_earnings, page)`` for the rider leaderboard.
+
+    Pages, the rider count and the platform total are cached under the current
+    leaderboard version, so a completed ride only has to bump the version for
+    every stale entry to fall out of use. A fully cached page costs no queries.
+    Reads served by the replica are used but not cached (see ``ridebooking.db_router``).
+    """
+    sort = normalize_sort(sort)
+    timeout = getattr(settings, 'RIDER_STATS_CACHE_TIMEOUT', 300)
+    cacheable = not replica_reads_active()
+    prefix = f'rider-stats:v{_rider_stats_version()}'
+
+    totals = cache.get(f'{prefix}:totals')
+    if totals is None:
+        totals = {
+            'riders': CustomUser.objects.filter(user_role='rider').count(),
+            'earnings': RiderDailyStats.objects.aggregate(total=_money(Sum('earnings')))['total'],
+        }
+        if cacheable:
+            cache.set(f'{prefix}:totals', totals, timeout)
+
+    paginator = Paginator(rider_stats_queryset(sort), page_size)
+    # Seed the paginator so it doesn't issue its own COUNT(*)
+    paginator.count = totals['riders']
+    page_obj = paginator.get_page(page)
+
+    page_key = f'{prefix}:{sort}:{page_size}:{page_obj.number}'
+    rows = cache.get(page_key)
+    if rows is None:
+        rows = list(page_obj.object_list)
+        if cacheable:
+            cache.set(page_key, rows, timeout)
+    page_obj.object_list = rows
+    return totals['earnings'], page_obj
+
+
+_RIDE_COUNTS = {
+    'total_rides': Count('id'),
+    'completed_rides': Count('id', filter=Q(status='dropped')),
+    'active_rides': Count('id', filter=Q(status='assigned')),
+}
+
+
+def _with_archived(counts, archived):
+    counts['total_rides'] += archived
+    counts['completed_rides'] += archived
+    return counts
+
+
+def dashboard_counts():
+    """User and ride totals for the staff landing page.
+
+    The three ride counts come from one conditional-aggregate pass instead of
+    three COUNT(*) scans, plus one count of the archived (all dropped) rides,
+    and the result is cached for a short TTL. Ride and user lifecycle signals
+    drop the cached copy (see ``dashboard.signals``). Counts read from the
+    replica aren't cached.
+    """
+    counts = cache.get(DASHBOARD_COUNTS_KEY)
+    if counts is None:
+        counts = _with_archived(Ride.objects.aggregate(**_RIDE_COUNTS), ArchivedRide.objects.count())
+        counts['total_users'] = CustomUser.objects.count()
+        if not replica_reads_active():
+            cache.set(DASHBOARD_COUNTS_KEY, counts, getattr(settings, 'DASHBOARD_COUNTS_CACHE_TIMEOUT', 30))
+    return counts
+
+
+async def adashboard_counts():
+    """``dashboard_counts`` through the async cache and ORM APIs."""
+    counts = await cache.aget(DASHBOARD_COUNTS_KEY)
+    if counts is None:
+        counts = _with_archived(await Ride.objects.aaggregate(**_RIDE_COUNTS), await ArchivedRide.objects.acount())
+        counts['total_users'] = await CustomUser.objects.acount()
+        if not replica_reads_active():
+            await cache.aset(DASHBOARD_COUNTS_KEY, counts, getattr(settings, 'DASHBOARD_COUNTS_CACHE_TIMEOUT', 30))
+    return counts
+
+
+def invalidate_dashboard_counts():
+    cache.delete(DASHBOARD_COUNTS_KEY)
@@ -1,3 +1,216 @@
-from django.test import TestCase
+import re
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from accounts.models import CustomUser
+from rides.archive import archive_batch
+from rides.models import Ride, RiderDailyStats
+from rides.signals import ride_status_changed
+from ridebooking import db_router
+from .stats import DASHBOARD_COUNTS_KEY, adashboard_counts, dashboard_counts, rider_leaderboard
 
-# Create your tests here.
+
+@override_settings(QUERY_BUDGET_STRICT=True, TASKS_RUNNER='immediate')
+class QueryBudgetTests(TestCase):
+    """Each budgeted dashboard view stays inside ``QUERY_BUDGETS`` on a cold cache."""
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = CustomUser.objects.create_user(username='staff', password='pw', user_role='staff')
+        customers = [
+            CustomUser.objects.create_user(username=f'customer{i}', password='pw', user_role='customer')
+            for i in range(5)
+        ]
+        riders = [
+            CustomUser.objects.create_user(username=f'rider{i}', password='pw', user_role='rider')
+            for i in range(5)
+        ]
+        Ride.objects.bulk_create([
+            Ride(customer=customers[i % 5], rider=riders[i % 5] if status != 'created' else None, status=status,
+                 pickup_location='Makati', destination='BGC', total_distance=Decimal('3.67'), price=Decimal('50.00'))
+            for i, status in enumerate(['created'] * 5 + ['assigned'] * 5 + ['dropped'] * 10)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def assertWithinBudget(self, url, view_name, **data):
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        queries = int(re.search(r'"(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertLessEqual(queries, settings.QUERY_BUDGETS[view_name], f'{view_name} ran {queries} queries')
+
+    def test_home(self):
+        self.assertWithinBudget(reverse('dashboard:home'), 'dashboard:home')
+
+    def test_ride_statistics(self):
+        self.assertWithinBudget(reverse('dashboard:ride_statistics'), 'dashboard:ride_statistics')
+
+    def test_user_list(self):
+        self.assertWithinBudget(reverse('dashboard:user_list'), 'dashboard:user_list')
+        self.assertWithinBudget(reverse('dashboard:user_list'), 'dashboard:user_list', q='cust')
+
+    def test_user_search(self):
+        self.assertWithinBudget(reverse('dashboard:user_search'), 'dashboard:user_search', q='rider')
+
+
+class ReplicaCacheTests(TestCase):
+    """Reads served by a (possibly lagging) replica are never cached."""
+    def setUp(self):
+        cache.clear()
+        CustomUser.objects.create_user(username='rider', password='pw', user_role='rider')
+
+    def test_replica_reads_are_not_cached(self):
+        token = db_router._replica_reads.set(True)
+        try:
+            self.assertEqual(dashboard_counts()['total_users'], 1)
+            rider_leaderboard()
+        finally:
+            db_router._replica_reads.reset(token)
+        self.assertIsNone(cache.get(DASHBOARD_COUNTS_KEY))
+        self.assertFalse([key for key in cache._cache if re.search(r'rider-stats:v\d+:', key)])
+
+    def test_primary_reads_are_cached(self):
+        dashboard_counts()
+        rider_leaderboard()
+        self.assertIsNotNone(cache.get(DASHBOARD_COUNTS_KEY))
+        self.assertTrue([key for key in cache._cache if re.search(r'rider-stats:v\d+:', key)])
+
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    """Listed GET views read from the replica until the user writes."""
+    def setUp(self):
+        self.middleware = db_router.ReplicaRoutingMiddleware(lambda request: HttpResponse())
+        self.router = db_router.ReplicaRouter()
+        # The middleware leaves the write flag set on the test thread
+        self.addCleanup(db_router._wrote.set, False)
+        self.addCleanup(db_router._replica_reads.set, False)
+
+    def start(self, path='/dashboard/', method='get', pin=None):
+        request = getattr(RequestFactory(), method)(path)
+        request.user = AnonymousUser()
+        request.resolver_match = resolve(path)
+        if pin is not None:
+            request.COOKIES[db_router.PIN_COOKIE] = pin
+        self.middleware.process_request(request)
+        self.middleware.process_view(request, None, (), {})
+        return request
+
+    def test_listed_reads_go_to_the_replica(self):
+        self.start()
+        self.assertEqual(self.router.db_for_read(CustomUser), db_router.REPLICA)
+        # Writes through a listed view and views that aren't listed stay on the primary
+        for path, method in [('/dashboard/', 'post'), (reverse('dashboard:create_user'), 'get')]:
+            self.start(path, method)
+            self.assertEqual(self.router.db_for_read(CustomUser), 'default')
+
+    def test_a_write_pins_the_user_to_the_primary(self):
+        request = self.start()
+        self.assertEqual(self.router.db_for_write(CustomUser), 'default')
+        # The rest of this request reads its own write
+        self.assertEqual(self.router.db_for_read(CustomUser), 'default')
+        response = self.middleware.process_response(request, HttpResponse())
+        cookie = response.cookies[db_router.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.DATABASE_REPLICA_PIN_SECONDS)
+        self.assertTrue(cookie['httponly'])
+
+        # So does the next one, until the pin runs out
+        self.start(pin=cookie.value)
+        self.assertFalse(db_router.replica_reads_active())
+        for stale in (str(time.time() - 1), 'not-a-time'):
+            self.start(pin=stale)
+            self.assertTrue(db_router.replica_reads_active())
+
+    def test_reads_only_leave_no_pin(self):
+        request = self.start()
+        response = self.middleware.process_response(request, HttpResponse())
+        self.assertNotIn(db_router.PIN_COOKIE, response.cookies)
+        self.assertFalse(db_router.replica_reads_active())
+
+
+class RiderLeaderboardTests(TestCase):
+    """Leaderboard totals come from the daily rollup and are cached until a ride is dropped."""
+    def setUp(self):
+        cache.clear()
+        self.ana = CustomUser.objects.create_user(username='ana', password='pw', user_role='rider', first_name='Ana')
+        self.ben = CustomUser.objects.create_user(username='ben', password='pw', user_role='rider', first_name='Ben')
+        RiderDailyStats.objects.record_drop(self.ana.pk, date(2024, 1, 1), Decimal('3.00'), Decimal('40.00'))
+        RiderDailyStats.objects.record_drop(self.ana.pk, date(2024, 1, 2), Decimal('2.00'), Decimal('20.00'))
+        RiderDailyStats.objects.record_drop(self.ben.pk, date(2024, 1, 1), Decimal('9.00'), Decimal('90.00'))
+
+    def test_totals_and_sorting(self):
+        total, page = rider_leaderboard()
+        self.assertEqual(total, Decimal('150.00'))
+        self.assertEqual(
+            [(r.username, r.completed_rides, r.total_distance, r.earnings) for r in page.object_list],
+            [('ben', 1, Decimal('9.00'), Decimal('90.00')), ('ana', 2, Decimal('5.00'), Decimal('60.00'))],
+        )
+        self.assertEqual([r.username for r in rider_leaderboard('-rides')[1].object_list], ['ana', 'ben'])
+        self.assertEqual([r.username for r in rider_leaderboard('name')[1].object_list], ['ana', 'ben'])
+        # Unknown sort keys fall back to the default order
+        self.assertEqual([r.username for r in rider_leaderboard('password')[1].object_list], ['ben', 'ana'])
+
+    def test_cached_until_a_ride_is_dropped(self):
+        rider_leaderboard()
+        RiderDailyStats.objects.record_drop(self.ana.pk, date(2024, 1, 3), Decimal('8.00'), Decimal('80.00'))
+        with self.assertNumQueries(0):
+            total, page = rider_leaderboard()
+        self.assertEqual(total, Decimal('150.00'))
+
+        ride_status_changed.send(Ride, ride_id=0, status='dropped')
+        total, page = rider_leaderboard()
+        self.assertEqual(total, Decimal('230.00'))
+        self.assertEqual([r.username for r in page.object_list], ['ana', 'ben'])
+
+
+class DashboardCountsTests(TestCase):
+    """Counts are cached until a ride or user changes, and include archived rides."""
+    def setUp(self):
+        cache.clear()
+        self.customer = CustomUser.objects.create_user(username='customer', password='pw', user_role='customer')
+        self.rider = CustomUser.objects.create_user(username='rider', password='pw', user_role='rider')
+        self.rides = [
+            Ride.objects.create(customer=self.customer, pickup_location='Makati', destination='BGC',
+                                total_distance=Decimal('3.67'), price=Decimal('50.00'))
+            for _ in range(3)
+        ]
+
+    def claim_and_drop(self, ride):
+        Ride.objects.claim(ride.pk, self.rider)
+        Ride.objects.complete(ride.pk, self.rider)
+
+    def test_counts(self):
+        self.claim_and_drop(self.rides[0])
+        self.claim_and_drop(self.rides[1])
+        archive_batch(timezone.now() + timedelta(seconds=1), batch_size=1)
+        Ride.objects.claim(self.rides[2].pk, self.rider)
+        expected = {'total_rides': 3, 'completed_rides': 2, 'active_rides': 1, 'total_users': 2}
+        self.assertEqual(dashboard_counts(), expected)
+        cache.clear()
+        self.assertEqual(async_to_sync(adashboard_counts)(), expected)
+
+    def test_cached_until_invalidated(self):
+        self.assertEqual(dashboard_counts()['active_rides'], 0)
+        with self.assertNumQueries(0):
+            dashboard_counts()
+
+        # Bare UPDATEs rely on the status signal to retire the counts
+        Ride.objects.claim(self.rides[0].pk, self.rider)
+        self.assertEqual(dashboard_counts()['active_rides'], 0)
+        ride_status_changed.send(Ride, ride_id=self.rides[0].pk, status='assigned')
+        self.assertEqual(dashboard_counts()['active_rides'], 1)
+
+        Ride.objects.create(customer=self.customer, pickup_location='Makati', destination='BGC',
+                            total_distance=Decimal('3.67'), price=Decimal('50.00'))
+        self.assertEqual(dashboard_counts()['total_rides'], 4)
+        CustomUser.objects.create_user(username='another', password='pw', user_role='customer')
+        self.assertEqual(dashboard_counts()['total_users'], 3)
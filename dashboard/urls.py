@@ -1,12 +1,15 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'dashboard'
 
 urlpatterns = [
-    path('', views.dashboard_home, name='home'),
+    path('', views.dashboard_home_async if settings.ASYNC_VIEWS else views.dashboard_home, name='home'),
     path('users/', views.user_list, name='user_list'),
+    path('users/search/', views.user_search, name='user_search'),
     path('users/create/', views.create_user, name='create_user'),
     path('users/add-balance/', views.add_balance, name='add_balance'),
+    path('users/add-balance/bulk/', views.bulk_add_balance, name='bulk_add_balance'),
     path('statistics/', views.ride_statistics, name='ride_statistics'),
 ]
@@ -1,10 +1,15 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect
+from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from accounts.models import CustomUser
-from rides.models import Ride, RideEvent
 from accounts.forms import CustomUserCreationForm
-from django.db.models import Sum
+from accounts.bulk import FORMATS, read_rows, text_stream, top_up
+from accounts.ledger import credit
+from accounts.search import search_page, user_summary
+from ridebooking.decorators import async_login_required
+from ridebooking.idempotency import idempotent
+from .stats import adashboard_counts, dashboard_counts, normalize_sort, rider_leaderboard
 from decimal import Decimal, InvalidOperation
 
 @login_required
@@ -13,18 +18,16 @@ def dashboard_home(request):
         messages.error(request, 'Access denied. Staff only.')
         return redirect('home')
 
-    total_users = CustomUser.objects.count()
-    total_rides = Ride.objects.count()
-    completed_rides = Ride.objects.filter(status='dropped').count()
-    active_rides = Ride.objects.filter(status='assigned').count()
+    return render(request, 'dashboard/home.html', dashboard_counts())
 
-    context = {
-        'total_users': total_users,
-        'total_rides': total_rides,
-        'completed_rides': completed_rides,
-        'active_rides': active_rides,
-    }
-    return render(request, 'dashboard/home.html', context)
+@async_login_required
+async def dashboard_home_async(request):
+    """``dashboard_home`` on the async ORM, for ``ASYNC_VIEWS`` under ASGI."""
+    if request.user.user_role != 'staff':
+        messages.error(request, 'Access denied. Staff only.')
+        return redirect('home')
+
+    return render(request, 'dashboard/home.html', await adashboard_counts())
 
 @login_required
 def user_list(request):
@@ -32,8 +35,23 @@ def user_list(request):
         messages.error(request, 'Access denied. Staff only.')
         return redirect('home')
 
-    users = CustomUser.objects.all()
-    return render(request, 'dashboard/user_list.html', {'users': users})
+    # One page at a time; the search box narrows it by name, username or email
+    term = request.GET.get('q', '').strip()
+    page = search_page(term, cursor=request.GET.get('cursor'))
+    return render(request, 'dashboard/user_list.html', {'users': page.object_list, 'page': page, 'q': term})
+
+@login_required
+def user_search(request):
+    """JSON page of users whose username, name or email starts with ``q``"""
+    if request.user.user_role != 'staff':
+        return JsonResponse({'error': 'Staff only'}, status=403)
+
+    roles = [r for r in request.GET.getlist('role') if r in dict(CustomUser.USER_ROLES)]
+    page = search_page(request.GET.get('q', '').strip(), roles=roles, cursor=request.GET.get('cursor'))
+    return JsonResponse({
+        'results': [user_summary(u) for u in page.object_list],
+        'next_cursor': page.next_cursor,
+    })
 
 @login_required
 def create_user(request):
@@ -53,6 +71,7 @@ def create_user(request):
     return render(request, 'dashboard/create_user.html', {'form': form})
 
 @login_required
+@idempotent
 def add_balance(request):
     if request.user.user_role != 'staff':
         messages.error(request, 'Access denied. Staff only.')
@@ -68,8 +87,7 @@ def add_balance(request):
             if amount_decimal <= 0:
                 raise ValueError('Amount must be positive')
 
-            user.balance += amount_decimal
-            user.save()
+            credit(user.pk, amount_decimal, 'staff_credit', reference=f'staff:{request.user.pk}')
             messages.success(request, f'Successfully added ${amount} to {user.get_full_name()}\'s balance')
 
         except (CustomUser.DoesNotExist, ValueError, InvalidOperation) as e:
@@ -77,33 +95,55 @@ def add_balance(request):
 
         return redirect('dashboard:add_balance')
 
-    users = CustomUser.objects.exclude(user_role='staff')
-    return render(request, 'dashboard/add_balance.html', {'users': users})
+    # Users are picked through the user_search typeahead, not a full dropdown
+    return render(request, 'dashboard/add_balance.html')
+
+# Errors listed on the bulk top-up page; the JSON answer has them all
+BULK_ERRORS_SHOWN = 200
 
 @login_required
-def ride_statistics(request):
+@idempotent
+def bulk_add_balance(request):
+    """Credit every (user, amount) row of an uploaded CSV or NDJSON file."""
     if request.user.user_role != 'staff':
         messages.error(request, 'Access denied. Staff only.')
         return redirect('home')
 
-    total_earnings = Ride.objects.filter(status='dropped').aggregate(total=Sum('price'))['total'] or 0
-    riders = CustomUser.objects.filter(user_role='rider')
-    rider_stats = []
+    context = {'formats': FORMATS}
+    if request.method == 'POST':
+        upload = request.FILES.get('file')
+        fmt = request.POST.get('format') or ('ndjson' if upload and upload.name.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if upload is None or fmt not in FORMATS:
+            messages.error(request, 'Upload a CSV or NDJSON file')
+            return redirect('dashboard:bulk_add_balance')
+
+        report = top_up(
+            read_rows(text_stream(upload), fmt),
+            reference=(request.POST.get('reference') or f'bulk:{request.user.pk}')[:64],
+            skip_invalid=request.POST.get('skip_invalid') == 'on',
+            dry_run=request.POST.get('dry_run') == 'on',
+        )
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse(report.as_dict(), status=200 if report.committed or not report.errors else 400)
+        if report.committed:
+            messages.success(request, f'Credited ₱{report.total} across {report.valid} rows')
+        context.update({'report': report, 'errors_shown': report.errors[:BULK_ERRORS_SHOWN]})
+
+    return render(request, 'dashboard/bulk_add_balance.html', context)
 
-    for rider in riders:
-        completed_rides = Ride.objects.filter(rider=rider, status='dropped')
-        total_distance = completed_rides.aggregate(total=Sum('total_distance'))['total'] or 0
-        earnings = completed_rides.aggregate(total=Sum('price'))['total'] or 0
+@login_required
+def ride_statistics(request):
+    if request.user.user_role != 'staff':
+        messages.error(request, 'Access denied. Staff only.')
+        return redirect('home')
 
-        rider_stats.append({
-            'rider': rider,
-            'completed_rides': completed_rides.count(),
-            'total_distance': total_distance,
-            'earnings': earnings
-        })
+    sort = normalize_sort(request.GET.get('sort'))
+    total_earnings, page_obj = rider_leaderboard(sort=sort, page=request.GET.get('page'))
 
     context = {
         'total_earnings': total_earnings,
-        'rider_stats': rider_stats
+        'rider_stats': page_obj.object_list,
+        'page_obj': page_obj,
+        'sort': sort,
     }
     return render(request, 'dashboard/ride_statistics.html', context)
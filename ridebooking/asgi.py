@@ -3,14 +3,26 @@ ASGI config for ridebooking project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn ridebooking.asgi:application``)
+to stream the rider ride feed at ``/rides/feed/``; under WSGI each open feed
+would pin a whole worker. ``Procfile.asgi`` is the full ASGI profile: it also
+sets ``ASYNC_VIEWS`` so the read-heavy pages run on the async ORM, and
+local static files (``USE_S3=False``) are then served from here because
+WhiteNoise only works under WSGI.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
 
+from django.conf import settings
+from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ridebooking.settings')
 
 application = get_asgi_application()
+
+if settings.ASYNC_VIEWS and not settings.USE_S3:
+    application = ASGIStaticFilesHandler(application)
@@ -0,0 +1,78 @@
+"""Send the reads of selected views to a read replica.
+
+``ReplicaRoutingMiddleware`` marks a request as replica-eligible when its
+view is listed in ``DATABASE_REPLICA_VIEWS``; ``ReplicaRouter`` then answers
+its reads from the ``replica`` alias. Everything else, every write and all
+reads outside a request (tasks, commands) use ``default``.
+
+Replicas lag, so a user who writes is pinned to the primary for
+``DATABASE_REPLICA_PIN_SECONDS``: the first write of a request flips the
+rest of that request to the primary, and a cookie carries the pin across
+the user's next requests, whichever worker serves them.
+
+Code that caches what it reads must not fill the cache from a replica: a
+lagging read right after a version bump would be stored under the new
+version and outlive the lag. It checks ``replica_reads_active()`` first.
+"""
+import time
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.deprecation import MiddlewareMixin
+
+REPLICA = 'replica'
+PIN_COOKIE = 'primary_until'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+_wrote = ContextVar('wrote', default=False)
+
+
+def replica_reads_active():
+    """True while this request's reads go to the replica."""
+    return _replica_reads.get() and not _wrote.get()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if replica_reads_active():
+            return REPLICA
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+
+def _pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        # Contexts outlive requests on a reused thread, so start every request clean
+        _replica_reads.set(False)
+        _wrote.set(False)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name if request.resolver_match else None
+        if request.method in ('GET', 'HEAD') and view_name in settings.DATABASE_REPLICA_VIEWS \
+                and not _pinned(request):
+            # The session and user come from the primary: a fresh login may
+            # not have reached the replica yet
+            request.user.is_authenticated
+            _replica_reads.set(True)
+
+    def process_response(self, request, response):
+        if _wrote.get():
+            seconds = getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 10)
+            response.set_cookie(PIN_COOKIE, str(time.time() + seconds), max_age=seconds,
+                                httponly=True, samesite='Lax', secure=request.is_secure())
+        _replica_reads.set(False)
+        return response
@@ -0,0 +1,22 @@
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+
+
+def _load_user(request):
+    # Forces the lazy request.user, so later reads never touch the database
+    return request.user.is_authenticated
+
+
+def async_login_required(view):
+    """``login_required`` for ``async def`` views (Django 4.2's only wraps sync ones).
+
+    The session and user are loaded in a worker thread before the view runs,
+    so the view can read ``request.user`` from the event loop.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(_load_user)(request):
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,119 @@
+"""Idempotency keys for state-changing POSTs.
+
+A client sends a key with a POST, in the ``Idempotency-Key`` header or an
+``idempotency_key`` form field (see the ``idempotency_field`` template tag).
+The first request with a key runs the view and its response is stored for
+``IDEMPOTENCY_KEY_TTL`` seconds. A retry with the same key gets that
+response replayed without running the view, so it can't create a second
+ride or credit. Keys are scoped to the user and the view, and are bound to
+the request body: reusing one for a different request is a 422. A retry
+that arrives while the first is still running gets a 409.
+
+Keys live in the ``accounts.IdempotencyKey`` table, whose unique constraint
+decides which request runs, so a retry is caught whichever worker serves
+it. Run ``manage.py prune_idempotency_keys`` now and then to drop old keys.
+"""
+import hashlib
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from accounts.models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+FIELD = 'idempotency_key'
+MAX_KEY_LENGTH = 128
+# Fields that differ between honest retries of the same submission
+IGNORED_FIELDS = ('csrfmiddlewaretoken', FIELD)
+
+
+def _fingerprint(request):
+    body = sorted(
+        (name, value) for name, values in request.POST.lists() if name not in IGNORED_FIELDS for value in values
+    )
+    files = sorted((name, f.name, f.size) for name, f in request.FILES.items())
+    return hashlib.sha256(repr((request.path, body, files)).encode()).hexdigest()[:32]
+
+
+def _store(response):
+    # Enough to rebuild the response: the views here answer with redirects or small pages
+    headers = {name: response[name] for name in ('Content-Type', 'Location') if response.has_header(name)}
+    return {'status_code': response.status_code, 'headers': headers, 'content': response.content}
+
+
+def _replay(entry):
+    response = HttpResponse(bytes(entry.content), status=entry.status_code)
+    for name, value in entry.headers.items():
+        response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(lookup, fingerprint):
+    """Insert the key; returns ``(claimed, existing entry or None)``."""
+    keys = IdempotencyKey.objects.filter(**lookup)
+    now = timezone.now()
+    locked_until = now + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 60))
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(**lookup, fingerprint=fingerprint, locked_until=locked_until)
+        return True, None
+    except IntegrityError:
+        pass
+    entry = keys.first()
+    if entry is None:
+        # Pruned in between; the next attempt can insert it again
+        return False, None
+    if entry.created_at < now - timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400)):
+        # Expired: reuse the row as a fresh claim
+        taken = keys.filter(pk=entry.pk, created_at=entry.created_at).update(
+            fingerprint=fingerprint, status_code=None, locked_until=locked_until, created_at=now,
+            headers={}, content=b'',
+        )
+        return bool(taken), None if taken else keys.first()
+    if entry.fingerprint == fingerprint and entry.status_code is None and entry.locked_until < now:
+        # The first request died without finishing; take its claim over
+        taken = keys.filter(pk=entry.pk, status_code=None, locked_until=entry.locked_until).update(
+            locked_until=locked_until,
+        )
+        return bool(taken), None if taken else keys.first()
+    return False, entry
+
+
+def idempotent(view):
+    """Replay the stored response for a repeated idempotency key (POST only)."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = None
+        if request.method == 'POST' and request.user.is_authenticated:
+            key = request.headers.get(HEADER) or request.POST.get(FIELD)
+        if not key:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH or not key.isprintable():
+            return HttpResponse('Invalid idempotency key', status=400)
+
+        lookup = {'user': request.user, 'view': f'{view.__module__}.{view.__name__}', 'key': key}
+        fingerprint = _fingerprint(request)
+        claimed, entry = _claim(lookup, fingerprint)
+        if not claimed:
+            if entry is not None and entry.fingerprint != fingerprint:
+                return HttpResponse('Idempotency key was used for a different request', status=422)
+            if entry is None or entry.status_code is None:
+                return HttpResponse('A request with this idempotency key is in progress', status=409)
+            return _replay(entry)
+
+        keys = IdempotencyKey.objects.filter(**lookup)
+        try:
+            response = view(request, *args, **kwargs)
+        except BaseException:
+            keys.delete()
+            raise
+        if response.status_code >= 500 or response.streaming:
+            # Let the client try again for real
+            keys.delete()
+        else:
+            keys.update(**_store(response))
+        return response
+    return wrapper
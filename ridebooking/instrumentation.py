@@ -0,0 +1,181 @@
+"""Per-request SQL, template and latency instrumentation.
+
+``RequestInstrumentationMiddleware`` times every request, counts and times
+its SQL through ``execute_wrapper`` on each database connection, groups the
+statements by shape to expose N+1 patterns, and reports the result as a
+``Server-Timing`` header plus one JSON log line on the
+``ridebooking.requests`` logger. ``TimedDjangoTemplates`` is a drop-in
+template backend that adds template render time to the same record. The
+latency also feeds the per-view histogram in ``ridebooking.metrics``.
+
+Query budgets: ``QUERY_BUDGETS`` maps view names (``'dashboard:home'``) to
+the most queries a request may run. Going over logs a warning, or raises
+``QueryBudgetExceeded`` when ``QUERY_BUDGET_STRICT`` is on, which makes any
+test-client request that blows its budget fail the test.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+from . import metrics
+
+logger = logging.getLogger('ridebooking.requests')
+
+_current = ContextVar('request_stats', default=None)
+
+_IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)+\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_shape(sql):
+    """Collapse a statement to its shape so repeats with other params match."""
+    return _NUMBER.sub('N', _IN_LIST.sub('(...)', sql))
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def repeated(self, limit):
+        return [(shape, count) for shape, count in self.shapes.most_common(limit) if count > 1]
+
+
+def current_stats():
+    """The stats of the request being served on this thread/task, if any."""
+    return _current.get()
+
+
+class RequestInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_INSTRUMENTATION', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.top_queries = getattr(settings, 'REQUEST_INSTRUMENTATION_TOP_QUERIES', 5)
+        self.budgets = getattr(settings, 'QUERY_BUDGETS', {})
+        self.default_budget = getattr(settings, 'QUERY_BUDGET_DEFAULT', None)
+        self.strict = getattr(settings, 'QUERY_BUDGET_STRICT', False)
+        # Under ASGI with async views, stay on the event loop
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            with _wrap_connections(stats):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        # Connections are thread-local: hook the ones in the request's
+        # thread-sensitive worker thread, where the async ORM runs queries
+        wrappers = await sync_to_async(_wrap_connections)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrappers.close)()
+            _current.reset(token)
+        return self.report(request, response, stats, time.perf_counter() - started)
+
+    def report(self, request, response, stats, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+        repeated = stats.repeated(self.top_queries)
+
+        response['Server-Timing'] = ', '.join([
+            f'app;dur={elapsed * 1000:.1f}',
+            f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.queries} queries"',
+            f'tpl;dur={stats.template_seconds * 1000:.1f}',
+        ])
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 2),
+            'queries': stats.queries,
+            'sql_ms': round(stats.sql_seconds * 1000, 2),
+            'template_ms': round(stats.template_seconds * 1000, 2),
+            'repeated_queries': [{'count': count, 'sql': shape[:300]} for shape, count in repeated],
+        }
+        logger.info(json.dumps(record))
+        metrics.observe('ridebooking_request_duration_seconds', elapsed,
+                        view=view_name or 'unresolved', method=request.method)
+
+        budget = self.budgets.get(view_name, self.default_budget)
+        if budget is not None and stats.queries > budget:
+            message = f'{view_name} ran {stats.queries} queries, over its budget of {budget}'
+            if self.strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={'request_stats': record})
+        return response
+
+
+def _wrap_connections(stats):
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(stats))
+    return stack
+
+
+class TimedTemplate:
+    """Wraps a backend template so its render time is charged to the request."""
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        if stats is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """``DjangoTemplates`` whose templates report their render time."""
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,164 @@
+"""Prometheus metrics shared by every worker on the host.
+
+Each process counts into in-memory histograms, and a background thread
+adds what it counted to a small SQLite file at ``METRICS_STORE`` every
+``METRICS_FLUSH_SECONDS`` (one row per series, ``value = value + ?``), so
+requests, including async views on the event loop, never wait on it. The file
+is the local shared store: ``/metrics`` and ``manage.py export_metrics``
+render it, so a scrape sees the sum over all gunicorn workers, including
+ones that have since restarted.
+
+Histograms:
+
+* ``ridebooking_request_duration_seconds{view,method}`` for every request,
+  observed by ``RequestInstrumentationMiddleware``;
+* ``ridebooking_ride_wait_seconds{stage}`` for rides: ``assigned`` is
+  created to assigned, ``dropped`` is assigned to dropped. Both come from
+  the ride's own timestamps (``created_at``, ``accepted_at`` and
+  ``updated_at``) when its status changes.
+"""
+import atexit
+import hmac
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.http import HttpResponse
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RIDE_WAIT_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 21600, 86400)
+
+HISTOGRAMS = {
+    'ridebooking_request_duration_seconds': ('Request latency by view.', REQUEST_BUCKETS),
+    'ridebooking_ride_wait_seconds': (
+        'Time rides spend reaching each status: created to assigned, assigned to dropped.', RIDE_WAIT_BUCKETS,
+    ),
+}
+
+_pending = {}
+_lock = threading.Lock()
+# Process that started the flush thread; a forked worker starts its own
+_flusher_pid = None
+
+
+def _store_path():
+    return getattr(settings, 'METRICS_STORE', None) or os.path.join(tempfile.gettempdir(), 'ridebooking-metrics.sqlite3')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    return ','.join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items()))
+
+
+def _sort_key(name):
+    # Series of one label set together, buckets in ascending ``le`` order
+    base, _, labels = name.partition('{')
+    labels, _, le = labels.rstrip('}').partition('le="')
+    le = le.rstrip('"')
+    return labels.rstrip(','), base.rsplit('_', 1)[-1], float('inf') if le == '+Inf' else float(le or 0)
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def increments(name, value, **labels):
+    """The ``(series, amount)`` additions that record ``value`` in histogram ``name``."""
+    buckets = HISTOGRAMS[name][1]
+    label_text = _labels(labels)
+    prefix = label_text + ',' if label_text else ''
+    series = [(f'{name}_bucket{{{prefix}le="{le}"}}', 1) for le in buckets if value <= le]
+    return series + [
+        (f'{name}_bucket{{{prefix}le="+Inf"}}', 1),
+        (f'{name}_count{{{label_text}}}', 1),
+        (f'{name}_sum{{{label_text}}}', value),
+    ]
+
+
+def observe(name, value, **labels):
+    """Add ``value`` to histogram ``name``; the flush thread stores it later."""
+    global _flusher_pid
+    with _lock:
+        for key, amount in increments(name, value, **labels):
+            _pending[key] = _pending.get(key, 0) + amount
+        if _flusher_pid != os.getpid():
+            _flusher_pid = os.getpid()
+            threading.Thread(target=_flush_forever, name='metrics-flush', daemon=True).start()
+
+
+def _flush_forever():
+    while True:
+        time.sleep(getattr(settings, 'METRICS_FLUSH_SECONDS', 5))
+        flush()
+
+
+def _connect():
+    conn = sqlite3.connect(_store_path(), timeout=5)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS series (name TEXT PRIMARY KEY, value REAL NOT NULL)')
+    return conn
+
+
+def flush():
+    """Add this process's counts to the shared store."""
+    with _lock:
+        pending = list(_pending.items())
+        _pending.clear()
+    if not pending:
+        return
+    try:
+        conn = _connect()
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT INTO series (name, value) VALUES (?, ?) '
+                    'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+                    pending,
+                )
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        # Keep the counts for the next flush rather than lose them
+        with _lock:
+            for key, value in pending:
+                _pending[key] = _pending.get(key, 0) + value
+
+
+atexit.register(flush)
+
+
+def exposition(rows, metrics=None):
+    """Format ``(series, value)`` rows in the Prometheus text format."""
+    lines = []
+    for metric in metrics or HISTOGRAMS:
+        names = (f'{metric}_bucket', f'{metric}_sum', f'{metric}_count')
+        series = sorted(((n, v) for n, v in rows if n.partition('{')[0] in names), key=lambda row: _sort_key(row[0]))
+        lines += [f'# HELP {metric} {HISTOGRAMS[metric][0]}', f'# TYPE {metric} histogram']
+        lines += [f'{name} {_number(value)}' for name, value in series]
+    return '\n'.join(lines) + '\n'
+
+
+def render():
+    """The shared store in the Prometheus text format."""
+    flush()
+    conn = _connect()
+    try:
+        rows = conn.execute('SELECT name, value FROM series').fetchall()
+    finally:
+        conn.close()
+    return exposition(rows)
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint: a ``METRICS_TOKEN`` bearer token or a staff session."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    given = request.headers.get('Authorization', '').encode()
+    authorized = token and hmac.compare_digest(given, f'Bearer {token}'.encode())
+    if not authorized and not (request.user.is_authenticated and request.user.user_role == 'staff'):
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
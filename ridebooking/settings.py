@@ -1,5 +1,7 @@
 from pathlib import Path
 import os
+import sys
+import tempfile
 from dotenv import load_dotenv
 import dj_database_url
 
@@ -22,6 +24,8 @@ if not DEBUG:
     CSRF_COOKIE_SECURE = True
     SECURE_BROWSER_XSS_FILTER = True
     SECURE_CONTENT_TYPE_NOSNIFF = True
+    # The router in front of the app terminates TLS and says so in this header
+    SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
 else:
     SECURE_SSL_REDIRECT = False
     SESSION_COOKIE_SECURE = False
@@ -41,6 +45,7 @@ INSTALLED_APPS = [
     'accounts',
     'rides',
     'dashboard',
+    'tasks',
 ]
 
 # Crispy Forms Configuration
@@ -56,6 +61,7 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 MIDDLEWARE = [
+    'ridebooking.instrumentation.RequestInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Add this line for static files
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -66,6 +72,18 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Route the read-heavy pages to their async views; only worth it under ASGI (Procfile.asgi)
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+if ASYNC_VIEWS:
+    # WhiteNoise is sync-only and would push every request back onto a thread;
+    # ridebooking.asgi serves local static files instead
+    MIDDLEWARE.remove('whitenoise.middleware.WhiteNoiseMiddleware')
+
+# The rider live feed (rides/feed/) is an open event stream: under WSGI it is
+# buffered and holds a sync worker for FEED_MAX_SECONDS, so it is only routed,
+# and only opened by the home page, when served over ASGI (Procfile.asgi)
+RIDE_FEED_ENABLED = os.getenv('RIDE_FEED_ENABLED', 'False') == 'True'
+
 # AWS S3 Configuration
 USE_S3 = os.environ.get('USE_S3', 'True') == 'True'
 
@@ -100,7 +118,8 @@ ROOT_URLCONF = 'ridebooking.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to the instrumentation middleware
+        'BACKEND': 'ridebooking.instrumentation.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -114,6 +133,17 @@ TEMPLATES = [
     },
 ]
 
+if not DEBUG:
+    # Compile each template once per process. Django's default when no loaders
+    # are given; spelled out so custom loaders added later keep the cache.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'ridebooking.wsgi.application'
 
 
@@ -127,6 +157,171 @@ if os.getenv('DATABASE_URL'):
     import dj_database_url
     DATABASES['default'] = dj_database_url.config(conn_max_age=600)
 
+# Several gunicorn workers on one SQLite file: WAL, a busy timeout and
+# BEGIN IMMEDIATE writes instead of "database is locked" (ridebooking.sqlite)
+SQLITE_CONCURRENT = os.getenv('SQLITE_CONCURRENT', 'False') == 'True'
+if SQLITE_CONCURRENT and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['ENGINE'] = 'ridebooking.sqlite'
+    DATABASES['default']['OPTIONS'] = {
+        'transaction_mode': 'IMMEDIATE',
+        'pragmas': {
+            'journal_mode': 'WAL',
+            # Durable at every checkpoint, not every commit; safe with WAL
+            'synchronous': 'NORMAL',
+            'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+            'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+            # Negative: KiB rather than pages
+            'cache_size': -int(os.getenv('SQLITE_CACHE_KIB', '20000')),
+            'temp_store': 'MEMORY',
+        },
+    }
+
+# Test SQLite databases are files rather than :memory:, so the race tests
+# can open one from several threads
+if DATABASES['default']['ENGINE'] in ('django.db.backends.sqlite3', 'ridebooking.sqlite'):
+    DATABASES['default'].setdefault('TEST', {}).setdefault(
+        'NAME', os.path.join(tempfile.gettempdir(), 'ridebooking-test.sqlite3')
+    )
+
+# Optional read replica (any dj_database_url URL, e.g. a second local SQLite
+# or Postgres). Reads of DATABASE_REPLICA_VIEWS go to it; see ridebooking.db_router.
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(DATABASE_REPLICA_URL, conn_max_age=600)
+    # Tests run against one database; the replica alias reads the same one
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+    DATABASE_ROUTERS = ['ridebooking.db_router.ReplicaRouter']
+    MIDDLEWARE.insert(
+        MIDDLEWARE.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+        'ridebooking.db_router.ReplicaRoutingMiddleware',
+    )
+# Read-only staff pages that can tolerate replica lag. The ride lists are left
+# out: their version-keyed caches must not be filled from stale rows, and they
+# would gain nothing from the replica without them. The dashboard's counters
+# and leaderboard skip their caches when reading from the replica instead.
+DATABASE_REPLICA_VIEWS = [
+    'dashboard:home',
+    'dashboard:ride_statistics',
+    'dashboard:user_list',
+    'dashboard:user_search',
+]
+# Seconds a user who wrote keeps reading from the primary
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv('DATABASE_REPLICA_PIN_SECONDS', '10'))
+
+# Cache used for dashboard statistics. Point CACHE_BACKEND/CACHE_LOCATION at a
+# shared backend (database, Redis, memcached) when running several workers.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'ridebooking'),
+    }
+}
+# Whether every worker sees the same cache. Per-process caches only ever hold
+# data that may be briefly stale; anything a worker must not miss (who is
+# logged in, which request already ran) is only cached in a shared one.
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Seconds a rider leaderboard page stays cached (it is also invalidated when a ride completes)
+RIDER_STATS_CACHE_TIMEOUT = int(os.getenv('RIDER_STATS_CACHE_TIMEOUT', '300'))
+
+# Seconds the staff dashboard counters stay cached between lifecycle events
+DASHBOARD_COUNTS_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_COUNTS_CACHE_TIMEOUT', '30'))
+
+# Seconds a page of a ride list (and its rendered fragment) stays cached;
+# lists are retired early by a version bump whenever one of their rides
+# changes (rides.fragments). 0 disables it. Only with a shared cache: a bump
+# in one worker's locmem never reaches the others, which would hide a new
+# ride from its customer and keep claimed rides on the open list there
+RIDE_LIST_CACHE_TIMEOUT = int(os.getenv('RIDE_LIST_CACHE_TIMEOUT', '300')) if SHARED_CACHE else 0
+
+# Responses to POSTs carrying an idempotency key are replayed to retries for
+# this many seconds; a first request holds its key for at most LOCK_SECONDS
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', '86400'))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', '60'))
+
+# Authenticated users are cached by id and version; 0 disables the cache. Only
+# with a shared cache: a version bump in one worker's locmem never reaches the
+# others, which would keep a deactivated user or an old password working there
+AUTH_USER_CACHE_TIMEOUT = int(os.getenv('AUTH_USER_CACHE_TIMEOUT', '300')) if SHARED_CACHE else 0
+
+# In-process grid index of open rides for nearby matching (rides.spatial):
+# it pulls in rides created by other workers at most every SYNC_SECONDS, is
+# rebuilt from the database every REFRESH_SECONDS, and buckets pickups into
+# cells of CELL_DEGREES (0.01 is ~1.1 km)
+RIDES_SPATIAL_SYNC_SECONDS = float(os.getenv('RIDES_SPATIAL_SYNC_SECONDS', '5'))
+RIDES_SPATIAL_REFRESH_SECONDS = float(os.getenv('RIDES_SPATIAL_REFRESH_SECONDS', '60'))
+RIDES_SPATIAL_CELL_DEGREES = float(os.getenv('RIDES_SPATIAL_CELL_DEGREES', '0.01'))
+
+# Pub/sub backend behind the rider ride feed (rides.broker)
+RIDES_BROKER_BACKEND = os.getenv('RIDES_BROKER_BACKEND', 'rides.broker.InProcessBroker')
+
+# Where queued background tasks run: 'thread' (in-process pool), 'worker'
+# (manage.py run_tasks processes) or 'immediate' (in the committing request).
+# Except with 'worker', a job enqueued with a delay waits on an in-process timer
+TASKS_RUNNER = os.getenv('TASKS_RUNNER', 'thread')
+
+# Dropped rides older than this move to the archive tables (archive_rides)
+RIDES_ARCHIVE_AFTER_DAYS = int(os.getenv('RIDES_ARCHIVE_AFTER_DAYS', '180'))
+
+# Batch quotes (rides/quotes/): partner bearer tokens (comma-separated; staff
+# can also use their session) and the limits for one request. The byte limit
+# defaults to Django's DATA_UPLOAD_MAX_MEMORY_SIZE.
+RIDES_QUOTE_TOKENS = [t for t in os.getenv('RIDES_QUOTE_TOKENS', '').split(',') if t]
+RIDES_QUOTE_MAX_PAIRS = int(os.getenv('RIDES_QUOTE_MAX_PAIRS', '10000'))
+RIDES_QUOTE_MAX_BYTES = int(os.getenv('RIDES_QUOTE_MAX_BYTES', str(2621440)))
+
+# Per-request SQL/template timing (Server-Timing header + a JSON log line)
+REQUEST_INSTRUMENTATION = os.getenv('REQUEST_INSTRUMENTATION', 'True') == 'True'
+REQUEST_INSTRUMENTATION_TOP_QUERIES = int(os.getenv('REQUEST_INSTRUMENTATION_TOP_QUERIES', 5))
+# Most SQL queries a single request to each view may run. Budgets cover the
+# worst runner: with TASKS_RUNNER='immediate' (tests) a view's deferred tasks
+# run inside the request and count towards it.
+QUERY_BUDGETS = {
+    'home': 10,
+    'create_ride': 12,
+    'ride_list': 10,
+    'ride_detail': 8,
+    'nearby_rides': 6,
+    'accept_ride': 12,
+    # 15 in the view, 13 more for record_ride_drop and its receivers
+    'complete_ride': 28,
+    'dashboard:home': 6,
+    'dashboard:ride_statistics': 8,
+    'dashboard:user_list': 4,
+    'dashboard:user_search': 4,
+}
+QUERY_BUDGET_DEFAULT = int(os.getenv('QUERY_BUDGET_DEFAULT', 50))
+# Raise instead of logging when a budget is exceeded (turn on for test runs)
+QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', 'False') == 'True'
+
+# Prometheus histograms (ridebooking.metrics): each worker adds its counts to
+# this host-local file every METRICS_FLUSH_SECONDS, from a background thread;
+# /metrics sums them.
+# Scrapers authenticate with METRICS_TOKEN as a bearer token.
+METRICS_STORE = os.getenv('METRICS_STORE', '')
+METRICS_FLUSH_SECONDS = float(os.getenv('METRICS_FLUSH_SECONDS', '5'))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# One JSON line per request at INFO; test runs only show the over-budget warnings
+TESTING = sys.argv[1:2] == ['test']
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'ridebooking.requests': {
+            'handlers': ['console'],
+            'level': os.getenv('REQUEST_LOG_LEVEL', 'WARNING' if TESTING else 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',},
@@ -0,0 +1,42 @@
+"""SQLite backend tuned for several processes sharing one database file.
+
+Enabled by ``SQLITE_CONCURRENT`` (see settings). On top of the stock
+backend it:
+
+* applies ``OPTIONS['pragmas']`` to every new connection: WAL so readers
+  never wait for the writer, a busy timeout so writers queue for the lock
+  instead of failing, and mmap/cache sizes for the read path;
+* starts ``atomic`` blocks with ``BEGIN IMMEDIATE`` (``OPTIONS
+  ['transaction_mode']``). A deferred transaction that reads and then
+  writes has to upgrade its lock mid-way, and SQLite fails such an upgrade
+  at once with "database is locked" when another writer is active, without
+  waiting on the busy timeout. Taking the write lock up front makes writers
+  wait their turn instead.
+
+Django 5.1 grew ``transaction_mode`` and ``init_command`` options for this;
+on 4.2 it takes a backend subclass.
+"""
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Ours, not sqlite3.connect()'s
+        params.pop('pragmas', None)
+        params.pop('transaction_mode', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode', 'DEFERRED').upper()
+        if mode not in TRANSACTION_MODES:
+            mode = 'DEFERRED'
+        self.cursor().execute(f'BEGIN {mode}')
@@ -1,11 +1,14 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
-from rides.home_view import home_view
+from rides.home_view import home_view, home_view_async
+from ridebooking.metrics import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', home_view, name='home'),
+    path('', home_view_async if settings.ASYNC_VIEWS else home_view, name='home'),
     path('accounts/', include(('accounts.urls', 'accounts'), namespace='accounts')),
     path('rides/', include('rides.urls')),
     path('dashboard/', include('dashboard.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,74 @@
+"""Move old dropped rides out of the hot tables.
+
+``Ride`` and ``RideEvent`` only need to hold open, active and recently
+finished rides. ``archive_batch`` copies the oldest dropped rides past the
+retention age, with their events, into ``ArchivedRide``/``ArchivedRideEvent``
+and deletes the originals in the same transaction. Every batch commits on its
+own, so an interrupted run loses nothing and the next run carries on from
+where it stopped. ``Ride.history`` still finds archived rides.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .fragments import bump_ride_lists
+from .models import ArchivedRide, ArchivedRideEvent, Ride, RideEvent
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+RIDE_FIELDS = [f.attname for f in ArchivedRide._meta.concrete_fields if f.name != 'archived_at']
+EVENT_FIELDS = [f.attname for f in ArchivedRideEvent._meta.concrete_fields]
+
+
+def archive_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'RIDES_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    return timezone.now() - timedelta(days=days)
+
+
+def archivable(cutoff):
+    return Ride.objects.filter(status='dropped', updated_at__lt=cutoff)
+
+
+def _bump_lists(users):
+    for customer_id, rider_id in users:
+        bump_ride_lists(customer_id, rider_id)
+
+
+def archive_batch(cutoff, batch_size=1000):
+    """Archive up to ``batch_size`` rides dropped before ``cutoff``.
+
+    Returns ``(rides, events)`` moved; ``(0, 0)`` once nothing is left.
+    """
+    with transaction.atomic():
+        # Locks the batch on backends that support it, so a ride can't change under the copy
+        rides = list(
+            archivable(cutoff).select_for_update().order_by('pk').values(*RIDE_FIELDS)[:batch_size]
+        )
+        if not rides:
+            return 0, 0
+        ids = [ride['id'] for ride in rides]
+        now = timezone.now()
+        # ignore_conflicts lets a rerun skip rows an earlier copy already wrote
+        ArchivedRide.objects.bulk_create(
+            [ArchivedRide(archived_at=now, **ride) for ride in rides], ignore_conflicts=True
+        )
+        events = 0
+        last_id = 0
+        while True:
+            chunk = list(
+                RideEvent.objects.filter(ride_id__in=ids, pk__gt=last_id)
+                .order_by('pk').values(*EVENT_FIELDS)[:batch_size]
+            )
+            if not chunk:
+                break
+            last_id = chunk[-1]['id']
+            ArchivedRideEvent.objects.bulk_create(
+                [ArchivedRideEvent(**event) for event in chunk], ignore_conflicts=True
+            )
+            events += len(chunk)
+        RideEvent.objects.filter(ride_id__in=ids).delete()
+        Ride.objects.filter(pk__in=ids).delete()
+        # Archived rides drop off the hot lists of everyone they belonged to
+        users = {(ride['customer_id'], ride['rider_id']) for ride in rides}
+        transaction.on_commit(lambda: _bump_lists(users))
+    return len(ids), events
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+RIDES_CHANNEL = 'rides'
+
+
+class InProcessBroker:
+    """Pub/sub fan-out for subscribers living in this process.
+
+    Each subscriber is a bounded ``asyncio.Queue`` on its own event loop, so
+    an idle connection costs one parked coroutine and no database work.
+    ``publish`` is safe to call from sync code on any thread; a subscriber
+    that falls ``queue_size`` messages behind misses the overflow rather than
+    slowing everyone else down.
+
+    Only clients served by the same process see each other's messages. Point
+    ``RIDES_BROKER_BACKEND`` at another class with the same ``publish`` and
+    ``subscribe`` methods to fan out across processes.
+    """
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, message)
+            except RuntimeError:
+                # The subscriber's loop has already shut down
+                pass
+
+    @staticmethod
+    def _offer(queue, message):
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        """Yield a queue receiving every message published to ``channel``."""
+        entry = (asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                self._subscribers.get(channel, set()).discard(entry)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                backend = getattr(settings, 'RIDES_BROKER_BACKEND', 'rides.broker.InProcessBroker')
+                _broker = import_string(backend)()
+    return _broker
+
+
+def publish_ride(event, ride_id, status, **details):
+    """Broadcast a ride delta (``ride.created``, ``ride.taken``, ``ride.completed``)."""
+    get_broker().publish(RIDES_CHANNEL, {'event': event, 'id': ride_id, 'status': status, **details})
@@ -1,5 +1,10 @@
+from decimal import Decimal
 from django import forms
-from .models import Ride, RideEvent
+from .models import Ride
+from .routing import UnknownLocation, get_engine
+
+# Slack allowed between the submitted distance and the server's own estimate
+DISTANCE_TOLERANCE_KM = Decimal('0.05')
 
 class RideForm(forms.ModelForm):
     class Meta:
@@ -23,3 +28,27 @@ class RideForm(forms.ModelForm):
             self.fields['pickup_location'].widget.attrs.update({'class': 'form-control'})
         if 'destination' in self.fields:
             self.fields['destination'].widget.attrs.update({'class': 'form-control'})
+
+    def clean(self):
+        cleaned_data = super().clean()
+        pickup = cleaned_data.get('pickup_location')
+        destination = cleaned_data.get('destination')
+        submitted = cleaned_data.get('total_distance')
+        if not pickup or not destination:
+            return cleaned_data
+
+        engine = get_engine()
+        for field, place in (('pickup_location', pickup), ('destination', destination)):
+            try:
+                engine.resolve(place)
+            except UnknownLocation:
+                self.add_error(field, 'Unknown location. Use a known place name or "lat,lng" coordinates.')
+        if self.has_error('pickup_location') or self.has_error('destination'):
+            return cleaned_data
+
+        self.instance.pickup_lat, self.instance.pickup_lng = engine.resolve(pickup)
+        expected = engine.distance(pickup, destination)
+
+        if submitted is None or abs(submitted - expected) > DISTANCE_TOLERANCE_KM:
+            self.add_error('total_distance', f'Distance does not match the route ({expected} km)')
+        return cleaned_data
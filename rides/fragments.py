@@ -0,0 +1,83 @@
+"""Versioned caching of ride lists and their rendered fragments.
+
+Each list a user sees is cached under a *scope* version: ``user:<id>`` for
+rides a user is customer or rider of, and ``open`` for the rides waiting
+for a rider. Any change to a ride bumps the versions of the scopes it
+belongs to (see ``rides.receivers``), which retires every cached page and
+fragment of those lists at once, without tracking individual keys.
+Versions live in the default cache, so with a per-process one
+``RIDE_LIST_CACHE_TIMEOUT`` is 0 and lists are built on every request.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+OPEN_RIDES = 'open'
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+def _version_key(scope):
+    return f'ride-list:{scope}:version'
+
+
+def list_version(scope):
+    return cache.get_or_set(_version_key(scope), 1, timeout=None)
+
+
+def bump_list_versions(*scopes):
+    for scope in scopes:
+        try:
+            cache.incr(_version_key(scope))
+        except ValueError:
+            cache.set(_version_key(scope), 2, timeout=None)
+
+
+def bump_ride_lists(customer_id, rider_id=None, open_rides=False):
+    """Retire the cached lists a ride with these users appears on."""
+    scopes = [user_scope(customer_id)]
+    if rider_id:
+        scopes.append(user_scope(rider_id))
+    if open_rides:
+        scopes.append(OPEN_RIDES)
+    bump_list_versions(*scopes)
+
+
+def list_cache_timeout():
+    """Seconds a list and its fragment are cached; 0 means not at all."""
+    return getattr(settings, 'RIDE_LIST_CACHE_TIMEOUT', 300)
+
+
+def list_cache_key(scope, *parts):
+    """Key for one list of ``scope``, e.g. a page at a cursor; also names its fragment."""
+    return ':'.join(['ride-list', scope, f'v{list_version(scope)}'] + [str(p) for p in parts])
+
+
+def cached_list(key, build):
+    """The cached value at ``key``, or ``build()`` cached there."""
+    timeout = list_cache_timeout()
+    if not timeout:
+        return build()
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, timeout)
+    return value
+
+
+async def alist_cache_key(scope, *parts):
+    version = await cache.aget_or_set(_version_key(scope), 1, timeout=None)
+    return ':'.join(['ride-list', scope, f'v{version}'] + [str(p) for p in parts])
+
+
+async def acached_list(key, build):
+    """``cached_list`` for async views; ``build`` is a coroutine function."""
+    timeout = list_cache_timeout()
+    if not timeout:
+        return await build()
+    value = await cache.aget(key)
+    if value is None:
+        value = await build()
+        await cache.aset(key, value, timeout)
+    return value
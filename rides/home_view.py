@@ -1,16 +1,51 @@
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from rides.models import Ride
+from rides.fragments import (
+    OPEN_RIDES, acached_list, alist_cache_key, cached_list, list_cache_key, list_cache_timeout, user_scope,
+)
+from rides.pagination import akeyset_paginate, keyset_paginate
+from ridebooking.decorators import async_login_required
+
+
+def _home_query(user):
+    """``(context name, rides, cache scope)`` for the user's home page, or None for staff."""
+    if user.user_role == 'rider':
+        # Show available rides for riders
+        return 'available_rides', Ride.objects.filter(status='created').select_related('rider'), OPEN_RIDES
+    elif user.user_role == 'customer':
+        # Show customer's own rides
+        return 'rides', user.rides_as_customer.select_related('rider'), user_scope(user.pk)
+    return None
+
 
 @login_required
 def home_view(request):
     context = {}
+    query = _home_query(request.user)
+    if query is not None:
+        name, rides, scope = query
+        cursor = request.GET.get('cursor')
+        # The same key names the rendered list in ride_list_partial.html
+        key = list_cache_key(scope, 'home', cursor or '')
+        page = cached_list(key, lambda: keyset_paginate(rides, cursor))
+        context.update({'page': page, name: page.object_list, 'fragment_key': key,
+                        'fragment_timeout': list_cache_timeout()})
 
-    if request.user.user_role == 'rider':
-        # Show available rides for riders
-        context['available_rides'] = Ride.objects.filter(status='created')
-    elif request.user.user_role == 'customer':
-        # Show customer's own rides
-        context['rides'] = request.user.rides_as_customer.all()
+    return render(request, 'home.html', context)
+
+
+@async_login_required
+async def home_view_async(request):
+    """``home_view`` on the async ORM, for ``ASYNC_VIEWS`` under ASGI."""
+    context = {}
+    query = _home_query(request.user)
+    if query is not None:
+        name, rides, scope = query
+        cursor = request.GET.get('cursor')
+        key = await alist_cache_key(scope, 'home', cursor or '')
+        page = await acached_list(key, lambda: akeyset_paginate(rides, cursor))
+        context.update({'page': page, name: page.object_list, 'fragment_key': key,
+                        'fragment_timeout': list_cache_timeout()})
 
     return render(request, 'home.html', context)
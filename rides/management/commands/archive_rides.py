@@ -0,0 +1,48 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rides.archive import archivable, archive_batch, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "Move dropped rides older than --days (default RIDES_ARCHIVE_AFTER_DAYS, "
+        "180) and their events into the archive tables, one committed batch at "
+        "a time. Safe to interrupt and rerun: each run resumes with whatever is "
+        "still left in the hot tables. Archived rides stay reachable through "
+        "Ride.history."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Archive rides dropped more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches')
+        parser.add_argument('--sleep', type=float, default=0, help='Seconds to pause between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rides that would move')
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days must not be negative')
+        cutoff = archive_cutoff(options['days'])
+
+        if options['dry_run']:
+            count = archivable(cutoff).count()
+            self.stdout.write(f"{count} dropped rides last changed before {cutoff:%Y-%m-%d %H:%M} would be archived")
+            return
+
+        total_rides = total_events = batches = 0
+        started = time.perf_counter()
+        while options['max_batches'] is None or batches < options['max_batches']:
+            rides, events = archive_batch(cutoff, options['batch_size'])
+            if not rides:
+                break
+            batches += 1
+            total_rides += rides
+            total_events += events
+            self.stdout.write(f"  batch {batches}: {rides} rides, {events} events")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {total_rides} rides and {total_events} events in "
+            f"{time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,139 @@
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from accounts.models import CustomUser
+from rides.management.commands.benchmark_views import percentile
+
+# How each serving profile is started; ASGI mirrors Procfile.asgi
+SERVERS = {
+    'wsgi': (['gunicorn', 'ridebooking.wsgi'], {}),
+    'asgi': (['gunicorn', 'ridebooking.asgi:application', '-k', 'uvicorn.workers.UvicornWorker'],
+             {'ASYNC_VIEWS': 'True'}),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent throughput of the WSGI profile (Procfile: sync "
+        "gunicorn workers) with the ASGI profile (Procfile.asgi: uvicorn "
+        "workers and the async views). Each profile is started on a local port "
+        "against the configured database, then hammered with --concurrency "
+        "parallel clients logged in as a --role user. Reports requests/s, "
+        "p50/p95/p99 latency and errors per profile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', choices=['wsgi', 'asgi', 'both'], default='both')
+        parser.add_argument('--workers', type=int, default=2, help='Server worker processes')
+        parser.add_argument('--concurrency', type=int, default=32, help='Parallel client connections')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests per profile')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help="URL path to request, repeatable (default: '/' and '/rides/')")
+        parser.add_argument('--role', choices=['customer', 'rider', 'staff'], default='customer')
+        parser.add_argument('--port', type=int, default=8701)
+        parser.add_argument('--output', help='Write results to this JSON file')
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.filter(user_role=options['role']).order_by('pk').first()
+        if user is None:
+            raise CommandError(f"No '{options['role']}' user found; run generate_data first")
+        client = Client()
+        client.force_login(user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        paths = options['paths'] or ['/', '/rides/']
+
+        profiles = ['wsgi', 'asgi'] if options['server'] == 'both' else [options['server']]
+        results = {}
+        for offset, profile in enumerate(profiles):
+            port = options['port'] + offset
+            server = self._start(profile, port, options['workers'])
+            try:
+                # Warm every worker's imports and caches before measuring
+                self._load(port, cookie, paths, options['concurrency'], options['concurrency'] * 2)
+                results[profile] = self._load(port, cookie, paths, options['concurrency'], options['requests'])
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            r = results[profile]
+            self.stdout.write(
+                f"{profile}: {r['rps']:8.1f} req/s  p50 {r['p50_ms']:7.2f}ms  p95 {r['p95_ms']:7.2f}ms  "
+                f"p99 {r['p99_ms']:7.2f}ms  errors {r['errors']}"
+            )
+
+        if len(results) == 2 and results['wsgi']['rps']:
+            ratio = results['asgi']['rps'] / results['wsgi']['rps']
+            self.stdout.write(self.style.SUCCESS(f"ASGI throughput is {ratio:.2f}x WSGI"))
+        if options['output']:
+            report = {'options': {k: options[k] for k in ('workers', 'concurrency', 'requests', 'role')},
+                      'paths': paths, 'results': results}
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, indent=2, sort_keys=True)
+
+    def _start(self, profile, port, workers):
+        command, extra_env = SERVERS[profile]
+        env = dict(os.environ, REQUEST_LOG_LEVEL='WARNING', **extra_env)
+        argv = [sys.executable, '-m'] + command + ['-w', str(workers), '-b', f'127.0.0.1:{port}']
+        try:
+            server = subprocess.Popen(argv, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError as exc:
+            raise CommandError(f"Could not start {profile} server: {exc}")
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"{profile} server exited with code {server.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f"{profile} server did not start listening on port {port}")
+
+    def _load(self, port, cookie, paths, concurrency, total):
+        headers = {'Cookie': cookie, 'X-Forwarded-Proto': 'https', 'Host': 'localhost'}
+
+        def worker(count):
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            latencies, errors = [], 0
+            for i in range(count):
+                started = time.perf_counter()
+                try:
+                    conn.request('GET', paths[i % len(paths)], headers=headers)
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status >= 400:
+                        errors += 1
+                except (OSError, http.client.HTTPException):
+                    errors += 1
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                latencies.append((time.perf_counter() - started) * 1000)
+            conn.close()
+            return latencies, errors
+
+        shares = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(worker, [n for n in shares if n]))
+        elapsed = time.perf_counter() - started
+
+        latencies = [ms for lat, _ in outcomes for ms in lat]
+        return {
+            'requests': len(latencies),
+            'errors': sum(e for _, e in outcomes),
+            'seconds': round(elapsed, 3),
+            'rps': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+        }
@@ -0,0 +1,148 @@
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+from django.core.management.base import BaseCommand, CommandError
+
+# Worker processes import this module before Django is set up, so model
+# imports stay inside the functions that run after _init_worker.
+
+
+def _init_worker(path, concurrent):
+    os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    os.environ['SQLITE_CONCURRENT'] = 'True' if concurrent else 'False'
+    os.environ['REQUEST_LOG_LEVEL'] = 'WARNING'
+    import django
+    django.setup()
+
+
+def _seed(processes, ops):
+    """Migrate the fresh database and give each process its own assigned rides."""
+    from decimal import Decimal
+    from django.core.management import call_command
+    from accounts.models import CustomUser
+    from rides.models import Ride
+
+    call_command('migrate', verbosity=0)
+    customers = CustomUser.objects.bulk_create([
+        CustomUser(username=f'bench-customer-{i}', user_role='customer', balance=Decimal('1000000.00'))
+        for i in range(processes)
+    ])
+    riders = CustomUser.objects.bulk_create([
+        CustomUser(username=f'bench-rider-{i}', user_role='rider') for i in range(processes)
+    ])
+    Ride.objects.bulk_create([
+        Ride(customer=customers[i], rider=riders[i], pickup_location='Makati', destination='BGC',
+             total_distance=Decimal('5.00'), price=Decimal('50.00'), status='assigned')
+        for i in range(processes) for _ in range(ops)
+    ], batch_size=500)
+
+
+def _work(args):
+    """Run ``ops`` reads and writes; returns latencies and errors."""
+    index, ops, write_ratio, start_at = args
+    from django.db import OperationalError, close_old_connections, transaction
+    from accounts.ledger import transfer
+    from accounts.models import CustomUser
+    from rides.models import Ride
+
+    customer = CustomUser.objects.get(username=f'bench-customer-{index}')
+    rider = CustomUser.objects.get(username=f'bench-rider-{index}')
+    open_rides = list(Ride.objects.filter(rider=rider, status='assigned').values_list('pk', flat=True))
+    rng = random.Random(index)
+    writes, reads, errors = [], [], 0
+    time.sleep(max(0, start_at - time.time()))
+
+    for _ in range(ops):
+        started = time.perf_counter()
+        try:
+            if rng.random() < write_ratio and open_rides:
+                # complete_ride's transaction, led by a read as its real callers are
+                pk = open_rides.pop()
+                with transaction.atomic():
+                    ride = Ride.objects.filter(pk=pk).values('customer_id', 'rider_id', 'price').get()
+                    if Ride.objects.complete(pk, ride['rider_id']):
+                        transfer(ride['customer_id'], ride['rider_id'], ride['price'], reference=f'ride:{pk}')
+                        Ride.objects.append_events(pk, ['Ride completed successfully'])
+                writes.append((time.perf_counter() - started) * 1000)
+            else:
+                list(Ride.objects.filter(customer=customer).select_related('rider').order_by('-created_at')[:20])
+                CustomUser.objects.filter(pk=customer.pk).values_list('balance', flat=True).get()
+                reads.append((time.perf_counter() - started) * 1000)
+        except OperationalError:
+            # "database is locked"
+            errors += 1
+    close_old_connections()
+    return writes, reads, errors
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare SQLite under several processes with the stock settings "
+        "and with the SQLITE_CONCURRENT profile (WAL, busy timeout, mmap, "
+        "cache size, BEGIN IMMEDIATE). Each profile gets a fresh database "
+        "file in a temporary directory. --processes workers then each run --ops "
+        "operations at once: complete_ride-style write transactions "
+        "(--write-ratio) and ride list reads. Reports writes/s, reads/s, "
+        "p95 latencies and 'database is locked' errors per profile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=['default', 'concurrent', 'both'], default='both')
+        parser.add_argument('--processes', type=int, default=8, help='Concurrent worker processes')
+        parser.add_argument('--ops', type=int, default=300, help='Operations per process')
+        parser.add_argument('--write-ratio', type=float, default=0.3, help='Share of operations that write')
+        parser.add_argument('--output', help='Write results to this JSON file')
+
+    def handle(self, *args, **options):
+        from rides.management.commands.benchmark_views import percentile
+
+        processes, ops = options['processes'], options['ops']
+        if processes < 1 or ops < 1 or not 0 <= options['write_ratio'] <= 1:
+            raise CommandError('--processes and --ops must be positive and --write-ratio within 0..1')
+        profiles = ['default', 'concurrent'] if options['profile'] == 'both' else [options['profile']]
+        # Fresh interpreters, so each profile configures its own connections
+        context = multiprocessing.get_context('spawn')
+        results = {}
+        for profile in profiles:
+            directory = tempfile.mkdtemp(prefix='benchmark-sqlite-')
+            path = os.path.join(directory, 'db.sqlite3')
+            init = (path, profile == 'concurrent')
+            try:
+                with context.Pool(1, _init_worker, init) as pool:
+                    pool.apply(_seed, (processes, ops))
+                with context.Pool(processes, _init_worker, init) as pool:
+                    # Let every worker finish setting up, then start them together
+                    start_at = time.time() + 2
+                    outcomes = pool.map(_work, [(i, ops, options['write_ratio'], start_at) for i in range(processes)])
+                    elapsed = time.time() - start_at
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+
+            writes = [ms for w, _, _ in outcomes for ms in w]
+            reads = [ms for _, r, _ in outcomes for ms in r]
+            results[profile] = {
+                'seconds': round(elapsed, 3),
+                'writes': len(writes),
+                'reads': len(reads),
+                'errors': sum(e for _, _, e in outcomes),
+                'writes_per_second': round(len(writes) / elapsed, 1),
+                'reads_per_second': round(len(reads) / elapsed, 1),
+                'write_p95_ms': round(percentile(writes, 95), 3) if writes else None,
+                'read_p95_ms': round(percentile(reads, 95), 3) if reads else None,
+                'write_mean_ms': round(statistics.fmean(writes), 3) if writes else None,
+            }
+            r = results[profile]
+            self.stdout.write(
+                f"{profile:>10}: {r['writes_per_second']:8.1f} writes/s  {r['reads_per_second']:8.1f} reads/s  "
+                f"write p95 {r['write_p95_ms']}ms  read p95 {r['read_p95_ms']}ms  locked errors {r['errors']}"
+            )
+
+        if options['output']:
+            report = {'options': {k: options[k] for k in ('processes', 'ops', 'write_ratio')}, 'results': results}
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, indent=2, sort_keys=True)
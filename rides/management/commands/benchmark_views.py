@@ -0,0 +1,248 @@
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone as dt_timezone
+from importlib import import_module
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import resolve, reverse
+from accounts.models import CustomUser
+from rides.models import Ride
+from rides.routing import GAZETTEER, route_distance
+
+URL_MODULES = ('rides.urls', 'accounts.urls', 'dashboard.urls')
+# Views that can't be timed as a single request/response
+SKIPPED = {
+    'ride_feed': 'endless event stream',
+    'logout': 'ends the benchmark session',
+}
+
+
+class QueryTimer:
+    """``execute_wrapper`` hook counting queries and their wall time."""
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive every URL in rides/urls.py, accounts/urls.py and dashboard/urls.py "
+        "through the test client as a customer, rider or staff user and record "
+        "p50/p95/p99 latency, SQL query count and SQL time per scenario. Run it "
+        "against data from generate_data. Results are written as JSON so runs "
+        "from different commits can be diffed with --compare."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', nargs='*', help='Scenario names to run (default: all)')
+        parser.add_argument('--output', help='Write results to this JSON file')
+        parser.add_argument('--compare', help='Earlier results JSON to diff against')
+
+    def handle(self, *args, **options):
+        self.users = {role: self._user(role) for role in ('customer', 'rider', 'staff')}
+        self.clients = {}
+        self.covered = set()
+        scenarios = self._scenarios()
+
+        if options['only']:
+            unknown = set(options['only']) - {s[0] for s in scenarios}
+            if unknown:
+                raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+            scenarios = [s for s in scenarios if s[0] in options['only']]
+
+        results = {}
+        for name, role, request in scenarios:
+            results[name] = self._measure(role, request, options['warmup'], options['iterations'])
+            r = results[name]
+            self.stdout.write(
+                f"{name:<28} {r['status']:>3}  p50 {r['p50_ms']:8.2f}ms  p95 {r['p95_ms']:8.2f}ms  "
+                f"p99 {r['p99_ms']:8.2f}ms  queries {r['queries']:4}  sql {r['sql_ms']:7.2f}ms"
+            )
+
+        if not options['only']:
+            self._check_coverage()
+
+        report = {'meta': self._meta(options), 'results': results}
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        if options['compare']:
+            self._compare(options['compare'], results)
+
+    def _user(self, role):
+        user = CustomUser.objects.filter(user_role=role).order_by('pk').first()
+        if user is None:
+            raise CommandError(f"No '{role}' user found; run generate_data first")
+        return user
+
+    def _client(self, role):
+        if role not in self.clients:
+            client = Client(SERVER_NAME='localhost')
+            client.force_login(self.users[role])
+            self.clients[role] = client
+        return self.clients[role]
+
+    def _open_ride(self):
+        ride = Ride.objects.filter(status='created').order_by('-pk').first()
+        if ride is None:
+            raise CommandError('No open rides left to accept; generate more data')
+        return ride.pk
+
+    def _scenarios(self):
+        """``(name, role, request)`` triples; ``request`` returns (method, url,
+        data) or (method, url, data, extra client kwargs)."""
+        customer_ride = Ride.objects.filter(customer=self.users['customer']).order_by('-pk').first()
+        if customer_ride is None:
+            raise CommandError('The first customer has no rides; run generate_data first')
+        fare = {'pickup_location': 'Makati', 'destination': 'BGC', 'price': '10.00',
+                'total_distance': str(route_distance('Makati', 'BGC'))}
+
+        def accept():
+            return 'post', reverse('accept_ride', args=[self._open_ride()]), None
+
+        def complete():
+            pk = self._open_ride()
+            Ride.objects.claim(pk, self.users['rider'])
+            return 'post', reverse('complete_ride', args=[pk]), None
+
+        def get(name, *args):
+            return lambda: ('get', reverse(name, args=args), None)
+
+        def post(name, data):
+            return lambda: ('post', reverse(name), data)
+
+        # Every ordered pair of gazetteer places, as a partner's pricing job sends them
+        quote_body = json.dumps({'pairs': [[a, b] for a in GAZETTEER for b in GAZETTEER if a != b]})
+        top_ups = 'username,amount\n' + ''.join(
+            f'{username},0.01\n'
+            for username in CustomUser.objects.filter(user_role='customer').order_by('pk')
+            .values_list('username', flat=True)[:500]
+        )
+
+        def bulk_top_up():
+            # An upload is consumed by the request, so each one needs a fresh file
+            upload = SimpleUploadedFile('top_ups.csv', top_ups.encode(), content_type='text/csv')
+            return 'post', reverse('dashboard:bulk_add_balance'), {'file': upload, 'format': 'csv'}
+
+        return [
+            ('create_ride:get', 'customer', get('create_ride')),
+            ('create_ride:post', 'customer', post('create_ride', fare)),
+            ('ride_list:customer', 'customer', get('ride_list')),
+            ('ride_list:rider', 'rider', get('ride_list')),
+            ('ride_list:staff', 'staff', get('ride_list')),
+            ('ride_detail', 'customer', get('ride_detail', customer_ride.pk)),
+            ('accept_ride', 'rider', accept),
+            ('complete_ride', 'rider', complete),
+            ('nearby_rides', 'rider', lambda: ('get', reverse('nearby_rides') + '?lat=14.5547&lng=121.0244', None)),
+            ('calculate_distance', 'customer', post('calculate_distance', {'pickup': 'Makati', 'destination': 'BGC'})),
+            # Staff may quote without a partner token
+            ('quote_rides', 'staff', lambda: ('post', reverse('quote_rides'), quote_body,
+                                              {'content_type': 'application/json'})),
+            ('signup', 'customer', get('accounts:signup')),
+            ('login:get', 'customer', get('accounts:login')),
+            ('profile:customer', 'customer', get('accounts:profile')),
+            ('profile:rider', 'rider', get('accounts:profile')),
+            ('add_funds:get', 'customer', get('accounts:add_funds')),
+            ('add_funds:post', 'customer', post('accounts:add_funds', {'amount': '1.00'})),
+            ('staff_add_balance', 'staff', get('accounts:staff_add_balance')),
+            ('dashboard:home', 'staff', get('dashboard:home')),
+            ('dashboard:user_list', 'staff', get('dashboard:user_list')),
+            ('dashboard:user_search', 'staff', lambda: ('get', reverse('dashboard:user_search') + '?q=cust', None)),
+            ('dashboard:bulk_add_balance', 'staff', bulk_top_up),
+            ('dashboard:create_user', 'staff', get('dashboard:create_user')),
+            ('dashboard:add_balance', 'staff', get('dashboard:add_balance')),
+            ('dashboard:ride_statistics', 'staff', get('dashboard:ride_statistics')),
+        ]
+
+    def _check_coverage(self):
+        for module in URL_MODULES:
+            for pattern in import_module(module).urlpatterns:
+                if pattern.name not in self.covered and pattern.name not in SKIPPED:
+                    self.stdout.write(self.style.WARNING(f"No benchmark scenario for {module}:{pattern.name}"))
+
+    def _measure(self, role, request, warmup, iterations):
+        client = self._client(role)
+        latencies, queries, sql_times, status = [], [], [], None
+        for i in range(warmup + iterations):
+            method, url, data, *extra = request()
+            self.covered.add(resolve(url.split('?')[0]).url_name)
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data=data, secure=True, **(extra[0] if extra else {}))
+                elapsed = time.perf_counter() - started
+            if i < warmup:
+                continue
+            status = response.status_code
+            latencies.append(elapsed * 1000)
+            queries.append(timer.count)
+            sql_times.append(timer.seconds * 1000)
+
+        return {
+            'status': status,
+            'iterations': iterations,
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'queries': max(queries),
+            'sql_ms': round(statistics.fmean(sql_times), 3),
+        }
+
+    def _meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': datetime.now(dt_timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'iterations': options['iterations'],
+            'rows': {
+                'users': CustomUser.objects.count(),
+                'rides': Ride.objects.count(),
+            },
+        }
+
+    def _compare(self, path, results):
+        with open(path, encoding='utf-8') as fh:
+            baseline = json.load(fh)
+        self.stdout.write(f"\nCompared with {path} (commit {baseline['meta'].get('commit')}):")
+        for name, current in results.items():
+            before = baseline['results'].get(name)
+            if before is None:
+                self.stdout.write(f"{name:<28} new scenario")
+                continue
+            change = (current['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0
+            line = (f"{name:<28} p95 {before['p95_ms']:8.2f} -> {current['p95_ms']:8.2f}ms ({change:+6.1f}%)  "
+                    f"queries {before['queries']} -> {current['queries']}")
+            if current['queries'] > before['queries'] or change > 20:
+                self.stdout.write(self.style.WARNING(line))
+            else:
+                self.stdout.write(line)
@@ -0,0 +1,57 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from ridebooking import metrics
+from rides.models import Ride
+
+
+class Command(BaseCommand):
+    help = (
+        "Print the Prometheus metrics that /metrics serves: request latency "
+        "per view and ride wait histograms, summed over every worker on this "
+        "host. --output writes them to a file instead, e.g. for the node "
+        "exporter's textfile collector. --from-db DAYS rebuilds the ride wait "
+        "histograms from the rides of the last DAYS days, archived ones included "
+        "(their created_at, accepted_at and updated_at), rather than reading "
+        "the live counters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Write to this file instead of stdout')
+        parser.add_argument('--from-db', type=int, metavar='DAYS',
+                            help='Compute ride wait histograms from the database for the last DAYS days')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rides read per query with --from-db')
+
+    def handle(self, *args, **options):
+        if options['from_db'] is not None:
+            if options['from_db'] < 1:
+                raise CommandError('--from-db takes a positive number of days')
+            text = self.from_db(timezone.now() - timedelta(days=options['from_db']), options['chunk_size'])
+        else:
+            text = metrics.render()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as fh:
+                fh.write(text)
+        else:
+            self.stdout.write(text, ending='')
+
+    def from_db(self, since, chunk_size):
+        counts = {}
+        filters = {'created_at__gte': since, 'status__in': ('assigned', 'dropped'), 'accepted_at__isnull': False}
+        last = 0
+        while True:
+            # Archived rides keep their ids, so one id order pages both tables
+            chunk = list(Ride.history.values(pk__gt=last, **filters).order_by('id')[:chunk_size])
+            if not chunk:
+                break
+            last = chunk[-1]['id']
+            for ride in chunk:
+                assigned_at = ride['accepted_at']
+                samples = [('assigned', assigned_at - ride['created_at'])]
+                if ride['status'] == 'dropped':
+                    samples.append(('dropped', ride['updated_at'] - assigned_at))
+                for stage, wait in samples:
+                    for key, amount in metrics.increments('ridebooking_ride_wait_seconds', wait.total_seconds(), stage=stage):
+                        counts[key] = counts.get(key, 0) + amount
+        return metrics.exposition(counts.items(), metrics=['ridebooking_ride_wait_seconds'])
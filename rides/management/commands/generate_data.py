@@ -0,0 +1,182 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from accounts.models import BalanceEntry, CustomUser
+from rides.models import Ride, RideEvent, RiderDailyStats
+from rides.routing import GAZETTEER, RoutingEngine
+from rides.quotes import PRICE_PER_KM
+
+USERNAME_PREFIX = 'synthetic-'
+# Share of generated rides per status
+STATUS_WEIGHTS = (('created', 0.15), ('assigned', 0.05), ('dropped', 0.80))
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk inserts carry historical created_at/updated_at values."""
+    fields = [f for m in models for f in m._meta.fields if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate synthetic customers, riders, rides and RideEvents for "
+        "benchmarking (1k to 10M rows). Rows are written in bounded batches and "
+        "usernames start with 'synthetic-' so --purge can remove them again. "
+        "Every generated user has the password 'synthetic'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=200)
+        parser.add_argument('--riders', type=int, default=50)
+        parser.add_argument('--rides', type=int, default=1000)
+        parser.add_argument('--tracking-events', type=int, default=2,
+                            help='Extra tracking events logged per assigned or dropped ride')
+        parser.add_argument('--days', type=int, default=90, help='Spread rides over this many past days')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--purge', action='store_true', help='Delete previously generated rows and exit')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        if options['purge']:
+            self._purge()
+            return
+        if options['customers'] < 1 or options['riders'] < 1:
+            raise CommandError('Need at least one customer and one rider')
+        if CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError('Synthetic data already exists; run with --purge first')
+
+        self.rng = random.Random(options['seed'])
+        self.engine = RoutingEngine()
+        self.places = list(GAZETTEER)
+        started = time.perf_counter()
+
+        customers = self._users('customer', options['customers'])
+        riders = self._users('rider', options['riders'])
+        self._users('staff', 1)
+        rides, events = self._rides(customers, riders, options['rides'], options['tracking_events'], options['days'])
+        RiderDailyStats.objects.rebuild(rider_ids=riders)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(customers) + len(riders) + 1} users, {rides} rides and "
+            f"{events} events in {elapsed:.1f}s"
+        ))
+
+    def _users(self, role, count):
+        password = make_password('synthetic')
+        ids = []
+        for start in range(0, count, self.batch_size):
+            batch = []
+            for i in range(start, min(start + self.batch_size, count)):
+                balance = Decimal(self.rng.randrange(0, 500000)) / 100 if role == 'customer' else Decimal('0.00')
+                batch.append(CustomUser(
+                    username=f'{USERNAME_PREFIX}{role}-{i}',
+                    first_name=role.title(),
+                    last_name=str(i),
+                    email=f'{role}{i}@example.com',
+                    user_role=role,
+                    balance=balance,
+                    password=password,
+                    is_staff=role == 'staff',
+                ))
+            with transaction.atomic():
+                CustomUser.objects.bulk_create(batch)
+                created = list(
+                    CustomUser.objects.filter(username__in=[u.username for u in batch]).values_list('pk', 'balance')
+                )
+                # Opening ledger entries keep reconcile_balances happy
+                BalanceEntry.objects.bulk_create([
+                    BalanceEntry(user_id=pk, amount=balance, kind='opening') for pk, balance in created if balance
+                ])
+            ids.extend(pk for pk, _ in created)
+        return ids
+
+    def _ride(self, customers, riders, now, days):
+        pickup, destination = self.rng.sample(self.places, 2)
+        lat, lng = self.engine.resolve(pickup)
+        distance = self.engine.distance(pickup, destination)
+        status = self.rng.choices([s for s, _ in STATUS_WEIGHTS], [w for _, w in STATUS_WEIGHTS])[0]
+        created_at = now - timedelta(seconds=self.rng.randrange(days * 86400))
+        updated_at = created_at
+        accepted_at = None
+        if status != 'created':
+            updated_at = min(now, created_at + timedelta(minutes=self.rng.randrange(5, 90)))
+            accepted_at = created_at + (updated_at - created_at) / 4
+        return Ride(
+            customer_id=self.rng.choice(customers),
+            rider_id=self.rng.choice(riders) if status != 'created' else None,
+            pickup_location=pickup.title(),
+            destination=destination.title(),
+            pickup_lat=lat,
+            pickup_lng=lng,
+            total_distance=distance,
+            price=(distance * PRICE_PER_KM).quantize(Decimal('0.01')),
+            status=status,
+            created_at=created_at,
+            accepted_at=accepted_at,
+            updated_at=updated_at,
+        )
+
+    def _events(self, ride, tracking):
+        steps = [(ride.created_at, 'User created a ride.')]
+        if ride.status != 'created':
+            span = ride.updated_at - ride.created_at
+            steps.append((ride.accepted_at, 'Ride accepted by a rider'))
+            steps.extend(
+                (ride.created_at + span * (i + 2) / (tracking + 3), f'Tracking update {i + 1}')
+                for i in range(tracking)
+            )
+        if ride.status == 'dropped':
+            steps.append((ride.updated_at, 'Ride completed successfully'))
+        return steps
+
+    def _rides(self, customers, riders, count, tracking, days):
+        now = timezone.now()
+        total_events = 0
+        with explicit_timestamps(Ride, RideEvent):
+            for start in range(0, count, self.batch_size):
+                batch = [self._ride(customers, riders, now, days) for _ in range(min(self.batch_size, count - start))]
+                steps = [self._events(ride, tracking) for ride in batch]
+                for ride, ride_steps in zip(batch, steps):
+                    ride.event_seq = len(ride_steps)
+                with transaction.atomic():
+                    Ride.objects.bulk_create(batch)
+                    if any(r.pk is None for r in batch):
+                        raise CommandError('This database backend does not return ids from bulk inserts')
+                    events = [
+                        RideEvent(ride_id=ride.pk, step_count=i + 1, description=text, created_at=at)
+                        for ride, ride_steps in zip(batch, steps)
+                        for i, (at, text) in enumerate(ride_steps)
+                    ]
+                    RideEvent.objects.bulk_create(events, batch_size=self.batch_size)
+                total_events += len(events)
+                self.stdout.write(f"  rides {start + len(batch)}/{count}")
+        return count, total_events
+
+    def _purge(self):
+        users = CustomUser.objects.filter(username__startswith=USERNAME_PREFIX)
+        rides = Ride.objects.filter(customer__in=users)
+        deleted = RideEvent.objects.filter(ride__in=rides).delete()[0]
+        # Chunked so the deletion collector never holds millions of rides
+        while True:
+            chunk = list(rides.values_list('pk', flat=True)[:self.batch_size])
+            if not chunk:
+                break
+            deleted += Ride.objects.filter(pk__in=chunk).delete()[0]
+        deleted += users.delete()[0]
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} synthetic rows"))
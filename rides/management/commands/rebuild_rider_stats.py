@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from rides.models import RiderDailyStats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the RiderDailyStats rollup from dropped rides, bucketed by "
+        "local day in TIME_ZONE. Normally the rollup is updated as each ride is "
+        "dropped; run this after changing TIME_ZONE or editing rides directly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rider', type=int, action='append', dest='riders', help='Only rebuild this rider id (repeatable)')
+
+    def handle(self, *args, **options):
+        rows = RiderDailyStats.objects.rebuild(rider_ids=options['riders'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {len(rows)} rider-day rows"))
@@ -0,0 +1,127 @@
+import random
+import threading
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections, transaction
+from accounts.models import CustomUser
+from rides.models import Ride
+
+USERNAME_PREFIX = 'stress-accept-'
+
+
+class Command(BaseCommand):
+    help = (
+        "Simulate N riders racing to accept M open rides and report claims/sec. "
+        "Runs against the configured database (SQLite by default, Postgres when "
+        "DATABASE_URL points at it) and verifies every ride was won exactly once. "
+        "The synthetic users and rides are removed afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--riders', type=int, default=20, help='Concurrent riders (threads)')
+        parser.add_argument('--rides', type=int, default=200, help='Open rides to race for')
+        parser.add_argument('--database', default='default', help='Database alias to run against')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for the accept order')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated rows for inspection')
+
+    def handle(self, *args, **options):
+        n_riders = options['riders']
+        n_rides = options['rides']
+        alias = options['database']
+        if n_riders < 1 or n_rides < 1:
+            raise CommandError('--riders and --rides must be positive')
+
+        rng = random.Random(options['seed'])
+        customer, riders, ride_ids = self._setup(alias, n_riders, n_rides)
+        self.stdout.write(
+            f"{connections[alias].vendor}: {n_riders} riders racing for {n_rides} rides"
+        )
+
+        # Every rider tries every ride, each in its own random order
+        orders = [rng.sample(ride_ids, len(ride_ids)) for _ in riders]
+        results = [None] * len(riders)
+        barrier = threading.Barrier(len(riders))
+
+        def race(index):
+            wins = losses = errors = 0
+            rider = riders[index]
+            try:
+                barrier.wait()
+                for pk in orders[index]:
+                    try:
+                        with transaction.atomic(using=alias):
+                            won = Ride.objects.using(alias).claim(pk, rider)
+                    except DatabaseError:
+                        errors += 1
+                        continue
+                    if won:
+                        wins += 1
+                    else:
+                        losses += 1
+            finally:
+                connections[alias].close()
+            results[index] = (wins, losses, errors)
+
+        threads = [threading.Thread(target=race, args=(i,)) for i in range(len(riders))]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        wins = sum(r[0] for r in results)
+        losses = sum(r[1] for r in results)
+        errors = sum(r[2] for r in results)
+        attempts = wins + losses + errors
+
+        assigned = Ride.objects.using(alias).filter(pk__in=ride_ids, status='assigned').count()
+        try:
+            self.stdout.write(f"elapsed: {elapsed:.3f}s")
+            self.stdout.write(f"attempts: {attempts} ({attempts / elapsed:.0f}/s)")
+            self.stdout.write(f"claims won: {wins} ({wins / elapsed:.0f}/s)")
+            self.stdout.write(f"already taken: {losses}")
+            self.stdout.write(f"database errors: {errors}")
+
+            if wins != assigned or assigned > n_rides:
+                raise CommandError(
+                    f"Claim accounting mismatch: {wins} wins for {assigned} assigned rides"
+                )
+            if errors == 0 and assigned != n_rides:
+                raise CommandError(f"Only {assigned} of {n_rides} rides were claimed")
+            self.stdout.write(self.style.SUCCESS('Every claimed ride has exactly one winner.'))
+        finally:
+            if not options['keep']:
+                self._teardown(alias, customer, riders)
+
+    def _setup(self, alias, n_riders, n_rides):
+        users = CustomUser.objects.db_manager(alias)
+        if users.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(
+                f"Found leftover '{USERNAME_PREFIX}*' users; delete them or drop --keep runs first"
+            )
+        customer = users.create(username=f'{USERNAME_PREFIX}customer', user_role='customer')
+        riders = users.bulk_create([
+            CustomUser(username=f'{USERNAME_PREFIX}rider-{i}', user_role='rider')
+            for i in range(n_riders)
+        ])
+        # bulk_create doesn't return primary keys on every backend
+        riders = list(users.filter(username__startswith=f'{USERNAME_PREFIX}rider-').order_by('id'))
+        Ride.objects.using(alias).bulk_create([
+            Ride(
+                customer=customer,
+                pickup_location='Stress test',
+                destination='Stress test',
+                total_distance=Decimal('1.00'),
+                price=Decimal('1.00'),
+            )
+            for _ in range(n_rides)
+        ], batch_size=500)
+        ride_ids = list(Ride.objects.using(alias).filter(customer=customer).values_list('pk', flat=True))
+        return customer, riders, ride_ids
+
+    def _teardown(self, alias, customer, riders):
+        # Deleting the customer cascades to the generated rides
+        customer.delete(using=alias)
+        CustomUser.objects.using(alias).filter(pk__in=[r.pk for r in riders]).delete()
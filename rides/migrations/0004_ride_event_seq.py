@@ -0,0 +1,26 @@
+# Generated by Django 4.2.15 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0003_alter_ride_customer_alter_ride_rider'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ride',
+            name='event_seq',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        # Continue each ride's sequence from the events it already has
+        migrations.RunSQL(
+            sql=(
+                "UPDATE rides_ride SET event_seq = COALESCE("
+                "(SELECT MAX(step_count) FROM rides_rideevent WHERE rides_rideevent.ride_id = rides_ride.id), 0)"
+            ),
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
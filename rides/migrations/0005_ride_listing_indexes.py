@@ -0,0 +1,25 @@
+# Generated by Django 4.2.15 on 2026-10-18 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0004_ride_event_seq'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='rides_ride_status_cbf202_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['customer', 'created_at', 'id'], name='rides_ride_custome_9e7ebd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ride',
+            index=models.Index(fields=['rider', 'status', 'updated_at'], name='rides_ride_rider_i_80b77f_idx'),
+        ),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 4.2.15 on 2026-10-18 11:38
+
+import json
+import re
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of the rides.routing gazetteer and name rules when this
+# migration was written, so later routing changes can't alter the backfill
+PLACES = {
+    'makati': (14.5547, 121.0244),
+    'bonifacio global city': (14.5509, 121.0503),
+    'ortigas center': (14.5869, 121.0614),
+    'quezon city': (14.6760, 121.0437),
+    'manila': (14.5995, 120.9842),
+    'intramuros': (14.5896, 120.9747),
+    'ermita': (14.5823, 120.9855),
+    'malate': (14.5698, 120.9920),
+    'binondo': (14.6000, 120.9740),
+    'quiapo': (14.5987, 120.9837),
+    'pasay': (14.5378, 121.0014),
+    'naia terminal 3': (14.5204, 121.0193),
+    'mall of asia': (14.5351, 120.9822),
+    'taguig': (14.5176, 121.0509),
+    'mandaluyong': (14.5794, 121.0359),
+    'san juan': (14.6019, 121.0355),
+    'greenhills': (14.6017, 121.0485),
+    'pasig': (14.5764, 121.0851),
+    'marikina': (14.6507, 121.1029),
+    'cubao': (14.6197, 121.0537),
+    'eastwood': (14.6091, 121.0776),
+    'up diliman': (14.6549, 121.0645),
+    'rockwell': (14.5649, 121.0366),
+    'caloocan': (14.6507, 120.9668),
+    'valenzuela': (14.7011, 120.9830),
+    'paranaque': (14.4793, 121.0198),
+    'las pinas': (14.4445, 120.9939),
+    'alabang': (14.4231, 121.0391),
+    'muntinlupa': (14.4081, 121.0415),
+}
+
+ALIASES = {
+    'bgc': 'bonifacio global city',
+    'fort bonifacio': 'bonifacio global city',
+    'ortigas': 'ortigas center',
+    'qc': 'quezon city',
+    'naia': 'naia terminal 3',
+    'airport': 'naia terminal 3',
+    'moa': 'mall of asia',
+    'sm mall of asia': 'mall of asia',
+    'araneta center': 'cubao',
+    'parañaque': 'paranaque',
+    'las piñas': 'las pinas',
+}
+
+COORDINATES = re.compile(r'^\s*(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$')
+
+
+def normalize(name):
+    name = re.sub(r'[^\w\s,.-]', ' ', (name or '').lower())
+    name = re.sub(r'\s+', ' ', name).strip(' ,.')
+    name = re.sub(r'(,?\s*(metro manila|ncr|philippines))+$', '', name).strip(' ,.')
+    return ALIASES.get(name, name)
+
+
+def resolve(name, places):
+    match = COORDINATES.match(name or '')
+    if match:
+        lat, lng = float(match.group(1)), float(match.group(2))
+        if -90 <= lat <= 90 and -180 <= lng <= 180:
+            return lat, lng
+    return places.get(normalize(name))
+
+
+def resolve_open_pickups(apps, schema_editor):
+    # Only open rides take part in rider matching, so only they are backfilled
+    places = dict(PLACES)
+    path = getattr(settings, 'RIDES_GAZETTEER_FILE', None)
+    if path:
+        with open(path, encoding='utf-8') as fh:
+            for name, (lat, lng) in json.load(fh).items():
+                places[normalize(name)] = (float(lat), float(lng))
+
+    Ride = apps.get_model('rides', 'Ride')
+    for ride in Ride.objects.filter(status='created').only('id', 'pickup_location').iterator(chunk_size=1000):
+        point = resolve(ride.pickup_location, places)
+        if point is not None:
+            Ride.objects.filter(pk=ride.pk).update(pickup_lat=point[0], pickup_lng=point[1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0005_ride_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ride',
+            name='pickup_lat',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='pickup_lng',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(resolve_open_pickups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.15 on 2026-10-18 11:46
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+import django.db.models.deletion
+
+
+def backfill_daily_stats(apps, schema_editor):
+    Ride = apps.get_model('rides', 'Ride')
+    RiderDailyStats = apps.get_model('rides', 'RiderDailyStats')
+    totals = (
+        Ride.objects.filter(status='dropped', rider__isnull=False)
+        .annotate(day=TruncDate('updated_at'))
+        .values('rider_id', 'day')
+        .annotate(count=models.Count('id'), km=models.Sum('total_distance'), fare=models.Sum('price'))
+        .order_by()
+    )
+    RiderDailyStats.objects.bulk_create([
+        RiderDailyStats(rider_id=row['rider_id'], day=row['day'], rides=row['count'],
+                        distance=row['km'] or 0, earnings=row['fare'] or 0)
+        for row in totals.iterator(chunk_size=2000)
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rides', '0006_ride_pickup_point'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiderDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('rides', models.PositiveIntegerField(default=0)),
+                ('distance', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('earnings', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('rider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-day'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='riderdailystats',
+            constraint=models.UniqueConstraint(fields=('rider', 'day'), name='unique_rider_day'),
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.15 on 2026-10-18 11:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rides', '0007_rider_daily_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRide',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('pickup_location', models.CharField(max_length=255)),
+                ('destination', models.CharField(max_length=255)),
+                ('total_distance', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('created', 'Created'), ('assigned', 'Assigned'), ('dropped', 'Dropped')], max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('pickup_lat', models.FloatField(blank=True, null=True)),
+                ('pickup_lng', models.FloatField(blank=True, null=True)),
+                ('event_seq', models.PositiveIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_rides_as_customer', to=settings.AUTH_USER_MODEL)),
+                ('rider', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_rides_as_rider', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedRideEvent',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('step_count', models.PositiveIntegerField()),
+                ('description', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('ride', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='rides.archivedride')),
+            ],
+            options={
+                'ordering': ['step_count', 'created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedride',
+            index=models.Index(fields=['customer', 'created_at', 'id'], name='rides_archi_custome_ff8f81_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedride',
+            index=models.Index(fields=['rider', 'updated_at'], name='rides_archi_rider_i_e03415_idx'),
+        ),
+    ]
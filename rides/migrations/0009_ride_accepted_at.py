@@ -0,0 +1,36 @@
+# Generated by Django 4.2.15 on 2026-10-18 12:29
+
+from django.db import migrations, models
+
+
+def backfill_accepted_at(apps, schema_editor):
+    # Until now the assignment was only recorded by accept_ride's event
+    for ride_model, event_model in (('Ride', 'RideEvent'), ('ArchivedRide', 'ArchivedRideEvent')):
+        Ride = apps.get_model('rides', ride_model)
+        Event = apps.get_model('rides', event_model)
+        accepted = (
+            Event.objects.filter(ride=models.OuterRef('pk'), description__startswith='Ride accepted')
+            .order_by().values('ride').annotate(first=models.Min('created_at')).values('first')
+        )
+        Ride.objects.exclude(status='created').update(accepted_at=models.Subquery(accepted))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rides', '0008_ride_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedride',
+            name='accepted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='ride',
+            name='accepted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_accepted_at, migrations.RunPython.noop),
+    ]
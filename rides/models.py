@@ -1,7 +1,97 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import TruncDate
 from django.conf import settings
 from decimal import Decimal
 from django.core.validators import MinValueValidator
+from django.utils import timezone
+
+
+class RideQuerySet(models.QuerySet):
+    def claim(self, pk, rider):
+        """Atomically assign an open ride to ``rider``.
+
+        A single conditional UPDATE acts as a compare-and-set on ``status``,
+        so when several riders race for the same ride exactly one of them
+        gets a row count of 1. Returns True for the winner.
+        """
+        now = timezone.now()
+        return self.filter(pk=pk, status='created').update(
+            rider=rider,
+            status='assigned',
+            accepted_at=now,
+            updated_at=now,
+        ) == 1
+
+    def complete(self, pk, rider):
+        """Atomically move an assigned ride to ``dropped``; True if this call did it."""
+        return self.filter(pk=pk, rider=rider, status='assigned').update(
+            status='dropped',
+            updated_at=timezone.now(),
+        ) == 1
+
+    def append_events(self, pk, descriptions):
+        """Append ``RideEvent`` rows to a ride, numbered from its own sequence.
+
+        ``Ride.event_seq`` is bumped once for the whole batch with an ``F()``
+        update, which also locks the ride row until the transaction ends, so
+        concurrent appends get disjoint step numbers without scanning events.
+        """
+        descriptions = list(descriptions)
+        if not descriptions:
+            return []
+        with transaction.atomic(using=self.db, savepoint=False):
+            rides = self.filter(pk=pk)
+            rides.update(event_seq=models.F('event_seq') + len(descriptions))
+            last = rides.values_list('event_seq', flat=True).get()
+            first = last - len(descriptions) + 1
+            return RideEvent.objects.using(self.db).bulk_create([
+                RideEvent(ride_id=pk, step_count=first + i, description=description)
+                for i, description in enumerate(descriptions)
+            ], batch_size=500)
+
+
+# Columns live and archived rides share, for Ride.history.values()
+HISTORY_FIELDS = (
+    'id', 'rider_id', 'customer_id', 'pickup_location', 'destination',
+    'total_distance', 'price', 'status', 'created_at', 'accepted_at', 'updated_at',
+)
+
+
+class RideHistoryManager(models.Manager):
+    """``Ride.history``: live and archived rides behind one explicit interface.
+
+    ``Ride.objects`` only ever sees the hot table. Reach for ``Ride.history``
+    when a lookup must also find rides that ``archive_rides`` has moved out.
+    """
+    def get_ride(self, pk):
+        """The live ride with ``pk``, else its archived copy."""
+        for model in (Ride, ArchivedRide):
+            ride = model.objects.select_related('customer', 'rider').filter(pk=pk).first()
+            if ride is not None:
+                return ride
+        raise Ride.DoesNotExist(f'No ride with id {pk}')
+
+    async def aget_ride(self, pk):
+        for model in (Ride, ArchivedRide):
+            ride = await model.objects.select_related('customer', 'rider').filter(pk=pk).afirst()
+            if ride is not None:
+                return ride
+        raise Ride.DoesNotExist(f'No ride with id {pk}')
+
+    def values(self, *args, **filters):
+        """Matching rows from both tables as dicts with an ``archived`` flag.
+
+        Returns a ``UNION ALL`` queryset, so ordering, slicing and ``count()``
+        run in the database.
+        """
+        live = Ride.objects.filter(*args, **filters).annotate(
+            archived=models.Value(False, output_field=models.BooleanField())
+        ).values(*HISTORY_FIELDS, 'archived').order_by()
+        archived = ArchivedRide.objects.filter(*args, **filters).annotate(
+            archived=models.Value(True, output_field=models.BooleanField())
+        ).values(*HISTORY_FIELDS, 'archived').order_by()
+        return live.union(archived, all=True)
+
 
 class Ride(models.Model):
     STATUS_CHOICES = (
@@ -41,10 +131,38 @@ class Ride(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # When a rider claimed the ride; set by RideQuerySet.claim
+    accepted_at = models.DateTimeField(null=True, blank=True)
+    # Resolved pickup point, used to match riders to nearby open rides
+    pickup_lat = models.FloatField(null=True, blank=True)
+    pickup_lng = models.FloatField(null=True, blank=True)
+    # Last step_count handed out to this ride's events
+    event_seq = models.PositiveIntegerField(default=0)
+
+    objects = RideQuerySet.as_manager()
+    history = RideHistoryManager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination: open rides for riders, a customer's own rides
+            models.Index(fields=['status', 'created_at', 'id']),
+            models.Index(fields=['customer', 'created_at', 'id']),
+            # A rider's rides by status and last change (profile, history)
+            models.Index(fields=['rider', 'status', 'updated_at']),
+        ]
 
     def __str__(self):
         return f"Ride from {self.pickup_location} to {self.destination}"
 
+    def log_events(self, descriptions):
+        events = Ride.objects.append_events(self.pk, descriptions)
+        if events:
+            self.event_seq = events[-1].step_count
+        return events
+
+    def log_event(self, description):
+        return self.log_events([description])[0]
+
 class RideEvent(models.Model):
     ride = models.ForeignKey(
         Ride,
@@ -60,3 +178,140 @@ class RideEvent(models.Model):
 
     def __str__(self):
         return f"Step {self.step_count}: {self.description}"
+
+
+class RiderDailyStatsQuerySet(models.QuerySet):
+    def record_drop(self, rider_id, day, distance, earnings):
+        """Add one dropped ride to the rider's row for ``day``.
+
+        An ``F()`` increment on the existing row, or an insert for the first
+        ride of the day; a concurrent insert that wins the race is retried as
+        an increment, so no ride is ever counted twice or lost.
+        """
+        increments = {
+            'rides': models.F('rides') + 1,
+            'distance': models.F('distance') + distance,
+            'earnings': models.F('earnings') + earnings,
+        }
+        if self.filter(rider_id=rider_id, day=day).update(**increments):
+            return
+        try:
+            with transaction.atomic(using=self.db):
+                self.create(rider_id=rider_id, day=day, rides=1, distance=distance, earnings=earnings)
+        except IntegrityError:
+            self.filter(rider_id=rider_id, day=day).update(**increments)
+
+    def rebuild(self, rider_ids=None):
+        """Recompute rows from the dropped rides, live and archived, in the current time zone's days."""
+        totals = {}
+        # Archived rides are part of every rider's history too
+        for model in (Ride, ArchivedRide):
+            rides = model.objects.filter(status='dropped', rider__isnull=False)
+            if rider_ids is not None:
+                rides = rides.filter(rider_id__in=rider_ids)
+            rows = (
+                rides.annotate(day=TruncDate('updated_at'))
+                .values('rider_id', 'day')
+                .annotate(count=models.Count('id'), km=models.Sum('total_distance'), fare=models.Sum('price'))
+                .order_by()
+            )
+            for row in rows.iterator(chunk_size=2000):
+                count, km, fare = totals.get((row['rider_id'], row['day']), (0, 0, 0))
+                totals[row['rider_id'], row['day']] = (
+                    count + row['count'], km + (row['km'] or 0), fare + (row['fare'] or 0),
+                )
+        with transaction.atomic(using=self.db):
+            stale = self.all() if rider_ids is None else self.filter(rider_id__in=rider_ids)
+            stale.delete()
+            return self.bulk_create([
+                RiderDailyStats(rider_id=rider_id, day=day, rides=count, distance=km, earnings=fare)
+                for (rider_id, day), (count, km, fare) in totals.items()
+            ], batch_size=1000)
+
+
+class RiderDailyStats(models.Model):
+    """Per-rider, per-day totals of dropped rides, kept up to date on each drop.
+
+    Days are local dates in ``TIME_ZONE``, so a rider's profile and history
+    read one row per day instead of aggregating every ride they ever drove.
+    """
+    rider = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='daily_stats'
+    )
+    day = models.DateField()
+    rides = models.PositiveIntegerField(default=0)
+    distance = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    earnings = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    objects = RiderDailyStatsQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-day']
+        constraints = [
+            models.UniqueConstraint(fields=['rider', 'day'], name='unique_rider_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.rider_id} on {self.day}: {self.rides} rides"
+
+
+class ArchivedRide(models.Model):
+    """A dropped ride moved out of the hot ``Ride`` table (see ``rides.archive``).
+
+    Keeps the original primary key and field names, so templates written for
+    ``Ride`` render an archived ride unchanged.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    rider = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='archived_rides_as_rider'
+    )
+    customer = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='archived_rides_as_customer'
+    )
+    pickup_location = models.CharField(max_length=255)
+    destination = models.CharField(max_length=255)
+    total_distance = models.DecimalField(max_digits=5, decimal_places=2)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=10, choices=Ride.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    accepted_at = models.DateTimeField(null=True, blank=True)
+    pickup_lat = models.FloatField(null=True, blank=True)
+    pickup_lng = models.FloatField(null=True, blank=True)
+    event_seq = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'created_at', 'id']),
+            models.Index(fields=['rider', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"Ride from {self.pickup_location} to {self.destination} (archived)"
+
+
+class ArchivedRideEvent(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    ride = models.ForeignKey(
+        ArchivedRide,
+        on_delete=models.CASCADE,
+        related_name='events'
+    )
+    step_count = models.PositiveIntegerField()
+    description = models.TextField()
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['step_count', 'created_at']
+
+    def __str__(self):
+        return f"Step {self.step_count}: {self.description}"
@@ -0,0 +1,67 @@
+"""Distance and suggested fare quotes, one pair or many at a time.
+
+``quote_pairs`` is the batch API behind ``/rides/quotes/`` and the pricing
+jobs: it takes ``(pickup, destination)`` pairs and returns one result per
+pair, in input order, from a single ``route_distances`` pass, and prices
+the whole batch at once with ``fares_for``. Places are gazetteer names or
+literal ``lat,lng`` text, as for ``route_distance``.
+"""
+from decimal import Decimal
+from .routing import UnknownLocation, get_engine, route_distance, route_distances
+
+try:
+    import numpy
+except ImportError:  # batches fall back to a pure-Python loop
+    numpy = None
+
+PRICE_PER_KM = Decimal('20.00')  # PHP
+
+
+def fare_for(distance):
+    """Suggested fare for a distance in km, to the centavo."""
+    return (Decimal(distance) * PRICE_PER_KM).quantize(Decimal('0.01'))
+
+
+def fares_for(distances):
+    """``fare_for`` over a list of distances (floats with 2 places); returns floats.
+
+    Works in whole centavos, so every fare equals ``float(fare_for(km))``:
+    km and price are exact integers of centavos, and their product is
+    rounded back to centavos half-to-even, as ``Decimal.quantize`` does.
+    """
+    if numpy is None:
+        return [float(fare_for(str(km))) for km in distances]
+    price = int(PRICE_PER_KM * 100)
+    cents = numpy.rint(numpy.asarray(distances, dtype=float) * 100).astype(numpy.int64) * price
+    whole, rest = numpy.divmod(cents, 100)
+    whole += (rest > 50) | ((rest == 50) & (whole % 2 == 1))
+    return (whole / 100).tolist()
+
+
+def quote(pickup, destination):
+    """``{'distance', 'fare'}`` for one pair; raises ``UnknownLocation``."""
+    distance = route_distance(pickup, destination)
+    return {'distance': float(distance), 'fare': float(fare_for(distance))}
+
+
+def quote_pairs(pairs):
+    """A ``{'distance', 'fare'}`` dict per pair, or ``{'error'}`` naming an unknown place."""
+    pairs = list(pairs)
+    distances = route_distances(pairs)
+    fares = iter(fares_for([km for km in distances if km is not None]))
+    results = []
+    for (pickup, destination), km in zip(pairs, distances):
+        if km is None:
+            results.append({'error': _unknown(pickup, destination)})
+        else:
+            results.append({'distance': km, 'fare': next(fares)})
+    return results
+
+
+def _unknown(pickup, destination):
+    engine = get_engine()
+    try:
+        engine.resolve(pickup)
+        engine.resolve(destination)
+    except UnknownLocation as exc:
+        return str(exc)
@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from .fragments import bump_ride_lists
+from ridebooking import metrics
+from .models import Ride
+from .signals import ride_status_changed
+
+
+def _observe_wait(status, ride):
+    if ride['accepted_at'] is None:
+        return
+    if status == 'assigned':
+        metrics.observe('ridebooking_ride_wait_seconds', (ride['accepted_at'] - ride['created_at']).total_seconds(),
+                        stage='assigned')
+    elif status == 'dropped':
+        # The drop is the last update
+        metrics.observe('ridebooking_ride_wait_seconds', (ride['updated_at'] - ride['accepted_at']).total_seconds(),
+                        stage='dropped')
+
+
+@receiver(ride_status_changed)
+def ride_status_changed_handler(sender, ride_id, status, **kwargs):
+    # Transitions are bare UPDATEs, so look up whose lists the ride is on
+    ride = Ride.objects.filter(pk=ride_id).values(
+        'customer_id', 'rider_id', 'created_at', 'accepted_at', 'updated_at',
+    ).first()
+    if ride is not None:
+        # Created and just-claimed rides enter or leave the open list
+        bump_ride_lists(ride['customer_id'], ride['rider_id'], open_rides=status in ('created', 'assigned'))
+        _observe_wait(status, ride)
+
+
+@receiver(post_save, sender=Ride)
+def ride_saved(sender, instance, **kwargs):
+    # Bumping before commit would let a reader cache the old rows under the new version
+    transaction.on_commit(lambda: bump_ride_lists(
+        instance.customer_id, instance.rider_id, open_rides=instance.status == 'created'
+    ))
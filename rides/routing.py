@@ -0,0 +1,245 @@
+"""Offline distance engine for ride quotes.
+
+Places are resolved from a built-in gazetteer (extendable with a JSON file
+named by the ``RIDES_GAZETTEER_FILE`` setting) or from literal ``lat,lng``
+text. Road distance is estimated as the great-circle distance scaled by a
+detour factor, and results are memoized in a bounded LRU/TTL cache keyed by
+the normalized place pair. Nothing here touches the network.
+
+``RoutingEngine.distances`` answers many pairs at once: each distinct place
+is resolved once and the great-circle distances are computed in one pass
+over coordinate arrays with numpy (in requirements.txt), falling back to a
+plain loop where it isn't installed.
+"""
+import json
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from django.conf import settings
+
+try:
+    import numpy
+except ImportError:  # batches fall back to a pure-Python loop
+    numpy = None
+
+EARTH_RADIUS_KM = 6371.0088
+# Roads are longer than the straight line; ~1.3 is typical for city grids
+DEFAULT_DETOUR_FACTOR = 1.3
+
+# Metro Manila landmarks and districts (lat, lng)
+GAZETTEER = {
+    'makati': (14.5547, 121.0244),
+    'bonifacio global city': (14.5509, 121.0503),
+    'ortigas center': (14.5869, 121.0614),
+    'quezon city': (14.6760, 121.0437),
+    'manila': (14.5995, 120.9842),
+    'intramuros': (14.5896, 120.9747),
+    'ermita': (14.5823, 120.9855),
+    'malate': (14.5698, 120.9920),
+    'binondo': (14.6000, 120.9740),
+    'quiapo': (14.5987, 120.9837),
+    'pasay': (14.5378, 121.0014),
+    'naia terminal 3': (14.5204, 121.0193),
+    'mall of asia': (14.5351, 120.9822),
+    'taguig': (14.5176, 121.0509),
+    'mandaluyong': (14.5794, 121.0359),
+    'san juan': (14.6019, 121.0355),
+    'greenhills': (14.6017, 121.0485),
+    'pasig': (14.5764, 121.0851),
+    'marikina': (14.6507, 121.1029),
+    'cubao': (14.6197, 121.0537),
+    'eastwood': (14.6091, 121.0776),
+    'up diliman': (14.6549, 121.0645),
+    'rockwell': (14.5649, 121.0366),
+    'caloocan': (14.6507, 120.9668),
+    'valenzuela': (14.7011, 120.9830),
+    'paranaque': (14.4793, 121.0198),
+    'las pinas': (14.4445, 120.9939),
+    'alabang': (14.4231, 121.0391),
+    'muntinlupa': (14.4081, 121.0415),
+}
+
+ALIASES = {
+    'bgc': 'bonifacio global city',
+    'fort bonifacio': 'bonifacio global city',
+    'ortigas': 'ortigas center',
+    'qc': 'quezon city',
+    'naia': 'naia terminal 3',
+    'airport': 'naia terminal 3',
+    'moa': 'mall of asia',
+    'sm mall of asia': 'mall of asia',
+    'araneta center': 'cubao',
+    'parañaque': 'paranaque',
+    'las piñas': 'las pinas',
+}
+
+_COORDINATES = re.compile(r'^\s*(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$')
+
+
+class UnknownLocation(ValueError):
+    pass
+
+
+def normalize(name):
+    """Canonical form of a place name, used for lookups and cache keys."""
+    name = re.sub(r'[^\w\s,.-]', ' ', (name or '').lower())
+    name = re.sub(r'\s+', ' ', name).strip(' ,.')
+    # Drop trailing region qualifiers people tend to type
+    name = re.sub(r'(,?\s*(metro manila|ncr|philippines))+$', '', name).strip(' ,.')
+    return ALIASES.get(name, name)
+
+
+class PairCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds."""
+    def __init__(self, maxsize=4096, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def haversine_km_many(lat1, lng1, lat2, lng2):
+    """``haversine_km`` over equal-length sequences of coordinates; returns a list."""
+    if numpy is None:
+        return [haversine_km(*point) for point in zip(lat1, lng1, lat2, lng2)]
+    lat1, lng1, lat2, lng2 = (numpy.radians(numpy.asarray(v, dtype=float)) for v in (lat1, lng1, lat2, lng2))
+    a = (numpy.sin((lat2 - lat1) / 2) ** 2
+         + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lng2 - lng1) / 2) ** 2)
+    return (2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(a))).tolist()
+
+
+class RoutingEngine:
+    def __init__(self, places=None, detour_factor=DEFAULT_DETOUR_FACTOR, cache=None):
+        self.places = dict(GAZETTEER if places is None else places)
+        self.detour_factor = detour_factor
+        self.cache = cache if cache is not None else PairCache()
+
+    def resolve(self, name):
+        """Return ``(lat, lng)`` for a place name or literal coordinates."""
+        match = _COORDINATES.match(name or '')
+        if match:
+            lat, lng = float(match.group(1)), float(match.group(2))
+            if -90 <= lat <= 90 and -180 <= lng <= 180:
+                return lat, lng
+        point = self.places.get(normalize(name))
+        if point is None:
+            raise UnknownLocation(f'Unknown location: {name}')
+        return point
+
+    def distance(self, pickup, destination):
+        """Estimated road distance in km, rounded to 0.01, between two places."""
+        a, b = normalize(pickup), normalize(destination)
+        # Distances are symmetric, so both directions share one cache entry
+        key = (a, b) if a <= b else (b, a)
+        km = self.cache.get(key)
+        if km is None:
+            lat1, lng1 = self.resolve(pickup)
+            lat2, lng2 = self.resolve(destination)
+            km = Decimal(str(round(haversine_km(lat1, lng1, lat2, lng2) * self.detour_factor, 2)))
+            self.cache.set(key, km)
+        return km
+
+    def distances(self, pairs):
+        """Road distances in km, rounded to 0.01, for many ``(pickup, destination)``
+        pairs in input order; ``None`` where either place is unknown.
+
+        Skips the pair cache: a batch would only evict the entries that
+        single quotes keep hitting.
+        """
+        pairs = list(pairs)
+        points = {}
+        indexes, lat1, lng1, lat2, lng2 = [], [], [], [], []
+        for i, (pickup, destination) in enumerate(pairs):
+            for name in (pickup, destination):
+                if name not in points:
+                    try:
+                        points[name] = self.resolve(name)
+                    except UnknownLocation:
+                        points[name] = None
+            a, b = points[pickup], points[destination]
+            if a is not None and b is not None:
+                indexes.append(i)
+                lat1.append(a[0])
+                lng1.append(a[1])
+                lat2.append(b[0])
+                lng2.append(b[1])
+
+        result = [None] * len(pairs)
+        detour = self.detour_factor
+        for i, km in zip(indexes, haversine_km_many(lat1, lng1, lat2, lng2)):
+            result[i] = round(km * detour, 2)
+        return result
+
+
+def _load_places():
+    places = dict(GAZETTEER)
+    path = getattr(settings, 'RIDES_GAZETTEER_FILE', None)
+    if path:
+        with open(path, encoding='utf-8') as fh:
+            for name, (lat, lng) in json.load(fh).items():
+                places[normalize(name)] = (float(lat), float(lng))
+    return places
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RoutingEngine(
+                    places=_load_places(),
+                    detour_factor=getattr(settings, 'RIDES_DETOUR_FACTOR', DEFAULT_DETOUR_FACTOR),
+                    cache=PairCache(
+                        maxsize=getattr(settings, 'RIDES_DISTANCE_CACHE_SIZE', 4096),
+                        ttl=getattr(settings, 'RIDES_DISTANCE_CACHE_TTL', 3600),
+                    ),
+                )
+    return _engine
+
+
+def route_distance(pickup, destination):
+    return get_engine().distance(pickup, destination)
+
+
+def route_distances(pairs):
+    return get_engine().distances(pairs)
@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent after commit whenever a ride changes status through the ride views
+# (creation included). Arguments: ride_id, status.
+# Status transitions are conditional UPDATEs, which don't fire post_save.
+ride_status_changed = Signal()
@@ -0,0 +1,174 @@
+"""In-memory grid index of open rides, for matching riders to nearby pickups.
+
+Open rides are bucketed into fixed-size lat/lng cells. A radius or k-nearest
+query only visits the cells around the rider, so it costs microseconds and
+never scans the rides table. The index lives in each process: it is updated
+by the ride views after commit, catches up on rides created elsewhere by
+primary key at most every ``RIDES_SPATIAL_SYNC_SECONDS``, and is rebuilt
+from the database every ``RIDES_SPATIAL_REFRESH_SECONDS``; queries in
+between touch no table. Results are re-checked against the database by
+primary key, so a ride taken by another worker never leaks out.
+"""
+import math
+import threading
+import time
+from django.conf import settings
+from .routing import haversine_km
+
+# ~1.1 km of latitude per cell
+DEFAULT_CELL_DEGREES = 0.01
+KM_PER_DEGREE = 111.32
+
+
+class GridIndex:
+    def __init__(self, cell_degrees=DEFAULT_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self._cells = {}
+        self._points = {}
+        self._lock = threading.RLock()
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    def add(self, ride_id, lat, lng):
+        with self._lock:
+            self.remove(ride_id)
+            cell = self._cell(lat, lng)
+            self._cells.setdefault(cell, {})[ride_id] = (lat, lng)
+            self._points[ride_id] = cell
+
+    def remove(self, ride_id):
+        with self._lock:
+            cell = self._points.pop(ride_id, None)
+            if cell is not None:
+                bucket = self._cells[cell]
+                del bucket[ride_id]
+                if not bucket:
+                    del self._cells[cell]
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._points.clear()
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, ride_id):
+        return ride_id in self._points
+
+    def _ring(self, center, r):
+        ci, cj = center
+        if r == 0:
+            yield center
+            return
+        for i in range(ci - r, ci + r + 1):
+            yield (i, cj - r)
+            yield (i, cj + r)
+        for j in range(cj - r + 1, cj + r):
+            yield (ci - r, j)
+            yield (ci + r, j)
+
+    def nearest(self, lat, lng, k=10, radius_km=None):
+        """Return up to ``k`` ``(distance_km, ride_id)`` pairs, closest first.
+
+        Rings of cells are visited outwards until the next ring can't hold
+        anything closer than the k-th hit (or lies beyond ``radius_km``).
+        When the rings would outnumber the occupied cells, e.g. a rider far
+        from every ride, the remaining points are simply scanned instead.
+        """
+        center = self._cell(lat, lng)
+        # The narrowest cell side, since longitude degrees shrink away from the equator
+        cos_lat = max(math.cos(math.radians(lat)), 0.01)
+        cell_km = self.cell_degrees * KM_PER_DEGREE * cos_lat
+        hits = []
+        visited = set()
+        with self._lock:
+            r = 0
+            while len(visited) < len(self._cells):
+                # Anything in ring r is at least (r - 1) cell widths away
+                floor_km = max(r - 1, 0) * cell_km
+                if radius_km is not None and floor_km > radius_km:
+                    break
+                if len(hits) >= k and floor_km > hits[k - 1][0]:
+                    break
+                if 8 * r > len(self._cells):
+                    cells = [c for c in self._cells if c not in visited]
+                else:
+                    cells = [c for c in self._ring(center, r) if c in self._cells]
+                for cell in cells:
+                    visited.add(cell)
+                    for ride_id, (plat, plng) in self._cells[cell].items():
+                        # Flat-earth distance is plenty to rank points a few km apart
+                        d = math.hypot(plat - lat, (plng - lng) * cos_lat) * KM_PER_DEGREE
+                        if radius_km is None or d <= radius_km:
+                            hits.append((d, ride_id))
+                hits.sort()
+                r += 1
+            # Report true great-circle distances for the winners
+            return [(haversine_km(lat, lng, *self._cells[self._points[i]][i]), i) for _, i in hits[:k]]
+
+    def within(self, lat, lng, radius_km, limit=None):
+        """All rides within ``radius_km``, closest first."""
+        return self.nearest(lat, lng, k=limit or len(self._points) or 1, radius_km=radius_km)
+
+
+class OpenRideIndex(GridIndex):
+    """Grid index kept in step with the ``status='created'`` rides."""
+    def __init__(self, refresh_seconds=60, sync_seconds=5, **kwargs):
+        super().__init__(**kwargs)
+        self.refresh_seconds = refresh_seconds
+        self.sync_seconds = sync_seconds
+        self._loaded_at = None
+        self._synced_at = None
+        self._last_id = 0
+
+    def _open_rides(self):
+        from .models import Ride
+        return Ride.objects.filter(status='created', pickup_lat__isnull=False, pickup_lng__isnull=False)
+
+    def sync(self):
+        """Rebuild when stale, otherwise pull in rides created since the last
+        sync. Does nothing within ``sync_seconds`` of the last one."""
+        now = time.monotonic()
+        with self._lock:
+            if self._synced_at is not None and now - self._synced_at < self.sync_seconds:
+                return
+            self._synced_at = now
+            if self._loaded_at is None or now - self._loaded_at > self.refresh_seconds:
+                self.clear()
+                rides = self._open_rides()
+                self._loaded_at = now
+            else:
+                rides = self._open_rides().filter(pk__gt=self._last_id)
+            for pk, lat, lng in rides.values_list('pk', 'pickup_lat', 'pickup_lng').iterator(chunk_size=2000):
+                self.add(pk, lat, lng)
+                self._last_id = max(self._last_id, pk)
+
+    def nearby(self, lat, lng, k=10, radius_km=None):
+        """Open rides near a point as ``[(distance_km, ride), ...]``, closest first."""
+        self.sync()
+        hits = self.nearest(lat, lng, k=k, radius_km=radius_km)
+        rides = self._open_rides().select_related('customer').in_bulk([pk for _, pk in hits])
+        for _, pk in hits:
+            if pk not in rides:
+                # Taken by a request served elsewhere
+                self.remove(pk)
+        return [(d, rides[pk]) for d, pk in hits if pk in rides]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_open_ride_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = OpenRideIndex(
+                    refresh_seconds=getattr(settings, 'RIDES_SPATIAL_REFRESH_SECONDS', 60),
+                    sync_seconds=getattr(settings, 'RIDES_SPATIAL_SYNC_SECONDS', 5),
+                    cell_degrees=getattr(settings, 'RIDES_SPATIAL_CELL_DEGREES', DEFAULT_CELL_DEGREES),
+                )
+    return _index
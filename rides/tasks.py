@@ -0,0 +1,25 @@
+"""Deferred ride work, run by the ``tasks`` queue after the request commits."""
+from django.db import transaction
+from django.utils import timezone
+from tasks.queue import task
+from .models import Ride, RiderDailyStats
+from .signals import ride_status_changed
+
+
+@task
+def record_ride_drop(ride_id):
+    """Log the completion event and add the ride to its rider's daily rollup."""
+    ride = Ride.objects.get(pk=ride_id)
+    ride.log_event("Ride completed successfully")
+    # The day the ride was dropped, however late the task runs
+    day = timezone.localdate(ride.updated_at)
+    RiderDailyStats.objects.record_drop(ride.rider_id, day, ride.total_distance, ride.price)
+    transaction.on_commit(lambda: ride_status_changed.send(Ride, ride_id=ride_id, status='dropped'))
+
+
+@task
+def record_manual_distance(ride_id):
+    """Finish a profile demo ride: its event and the rider's rollup."""
+    ride = Ride.objects.get(pk=ride_id)
+    ride.log_event('Manual distance added from profile (demo)')
+    RiderDailyStats.objects.record_drop(ride.rider_id, timezone.localdate(ride.updated_at), ride.total_distance, 0)
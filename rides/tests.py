@@ -1,3 +1,616 @@
-from django.test import TestCase
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
+from decimal import Decimal
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from accounts.models import BalanceEntry, CustomUser
+from ridebooking.sqlite.base import DatabaseWrapper as SQLiteWrapper
+from .archive import archive_batch, archive_cutoff
+from .home_view import home_view, home_view_async
+from .models import ArchivedRide, Ride, RiderDailyStats, RiderDailyStatsQuerySet
+from .pagination import akeyset_paginate, keyset_paginate
+from .quotes import fare_for, fares_for, quote, quote_pairs
+from .routing import GAZETTEER, PairCache, RoutingEngine, UnknownLocation, route_distance
+from .spatial import OpenRideIndex
+from .views import ride_detail, ride_detail_async, ride_list, ride_list_async
 
-# Create your tests here.
+
+def make_user(username, role, balance='0.00'):
+    return CustomUser.objects.create_user(username=username, password='pw', user_role=role, balance=Decimal(balance))
+
+
+def make_ride(customer, rider=None, status='created'):
+    ride = Ride.objects.create(
+        customer=customer, rider=rider, status=status,
+        pickup_location='Makati', destination='BGC',
+        total_distance=route_distance('Makati', 'BGC'), price=Decimal('50.00'),
+        pickup_lat=14.5547, pickup_lng=121.0244,
+    )
+    ride.log_events(['Ride requested', 'Looking for a rider'])
+    return ride
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, TASKS_RUNNER='immediate')
+class QueryBudgetTests(TransactionTestCase):
+    """Each budgeted rides view stays inside ``QUERY_BUDGETS`` on a cold cache.
+
+    A ``TransactionTestCase``, so requests really commit and the tasks and
+    receivers that run on commit count towards the view, as they do with
+    the immediate runner. ``QUERY_BUDGET_STRICT`` makes the middleware raise
+    on a blown budget; the count from ``Server-Timing`` is checked as well
+    so a failure says by how much.
+    """
+    def setUp(self):
+        cache.clear()
+        self.customer = make_user('customer', 'customer', '1000.00')
+        self.rider = make_user('rider', 'rider')
+        self.staff = make_user('staff', 'staff')
+        for status in ['created'] * 8 + ['assigned'] * 4 + ['dropped'] * 8:
+            make_ride(self.customer, None if status == 'created' else self.rider, status)
+
+    def assertWithinBudget(self, response, view_name):
+        queries = int(re.search(r'"(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertLessEqual(queries, settings.QUERY_BUDGETS[view_name], f'{view_name} ran {queries} queries')
+
+    def request(self, user, method, url, view_name, **kwargs):
+        self.client.force_login(user)
+        response = getattr(self.client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400)
+        self.assertWithinBudget(response, view_name)
+        return response
+
+    def test_home(self):
+        for user in (self.customer, self.rider, self.staff):
+            with self.subTest(user=user.username):
+                self.request(user, 'get', reverse('home'), 'home')
+
+    def test_ride_list(self):
+        for user in (self.customer, self.rider, self.staff):
+            with self.subTest(user=user.username):
+                self.request(user, 'get', reverse('ride_list'), 'ride_list')
+
+    def test_ride_detail(self):
+        ride = Ride.objects.filter(status='dropped').first()
+        for user in (self.customer, self.rider):
+            with self.subTest(user=user.username):
+                self.request(user, 'get', reverse('ride_detail', args=[ride.pk]), 'ride_detail')
+
+    def test_nearby_rides(self):
+        response = self.request(self.rider, 'get', reverse('nearby_rides'), 'nearby_rides',
+                                data={'lat': '14.55', 'lng': '121.02'})
+        self.assertTrue(response.json()['rides'])
+
+    def test_create_ride(self):
+        self.request(self.customer, 'post', reverse('create_ride'), 'create_ride', data={
+            'pickup_location': 'Makati', 'destination': 'BGC', 'price': '50.00',
+            'total_distance': str(route_distance('Makati', 'BGC')),
+        })
+        self.assertEqual(Ride.objects.filter(status='created').count(), 9)
+
+    def test_accept_ride(self):
+        ride = Ride.objects.filter(status='created').first()
+        self.request(self.rider, 'post', reverse('accept_ride', args=[ride.pk]), 'accept_ride')
+        ride.refresh_from_db()
+        self.assertEqual(ride.status, 'assigned')
+
+    def test_complete_ride(self):
+        ride = Ride.objects.filter(status='assigned').first()
+        self.request(self.rider, 'post', reverse('complete_ride', args=[ride.pk]), 'complete_ride')
+        ride.refresh_from_db()
+        self.assertEqual(ride.status, 'dropped')
+
+
+
+@override_settings(TASKS_RUNNER='immediate', RIDE_LIST_CACHE_TIMEOUT=300)
+class RideListCacheTests(TransactionTestCase):
+    """Accepting or completing a ride retires every cached list it is on."""
+    def setUp(self):
+        cache.clear()
+        self.customer = make_user('customer', 'customer', '100.00')
+        self.rider = make_user('rider', 'rider')
+        self.ride = make_ride(self.customer)
+
+    def listed(self, user, url_name, context_name):
+        self.client.force_login(user)
+        response = self.client.get(reverse(url_name))
+        return {ride.pk: ride.status for ride in response.context[context_name]}
+
+    def rendered(self, user):
+        self.client.force_login(user)
+        return self.client.get(reverse('home')).content.decode()
+
+    def test_transitions_retire_cached_lists(self):
+        self.assertEqual(self.listed(self.customer, 'ride_list', 'rides'), {self.ride.pk: 'created'})
+        self.assertIn(self.ride.pk, self.listed(self.rider, 'ride_list', 'rides'))
+        self.assertNotIn(self.ride.pk, self.listed(self.rider, 'accounts:profile', 'day_rides'))
+        self.assertIn('status-created', self.rendered(self.customer))
+
+        self.client.force_login(self.rider)
+        self.client.post(reverse('accept_ride', args=[self.ride.pk]))
+        self.assertEqual(self.listed(self.customer, 'ride_list', 'rides'), {self.ride.pk: 'assigned'})
+        self.assertNotIn(self.ride.pk, self.listed(self.rider, 'ride_list', 'rides'))
+        self.assertIn('status-assigned', self.rendered(self.customer))
+
+        self.client.force_login(self.rider)
+        self.client.post(reverse('complete_ride', args=[self.ride.pk]))
+        self.assertEqual(self.listed(self.customer, 'ride_list', 'rides'), {self.ride.pk: 'dropped'})
+        self.assertIn(self.ride.pk, self.listed(self.rider, 'accounts:profile', 'day_rides'))
+
+
+def concurrent(test):
+    """Skip on an in-memory SQLite test database, which threads can't share."""
+    def wrapper(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('needs a test database that several connections can open')
+        test(self)
+    wrapper.__name__ = test.__name__
+    wrapper.__doc__ = test.__doc__
+    return wrapper
+
+
+def race(func, *args_per_thread):
+    """Run ``func`` once per argument tuple, all released at the same moment."""
+    barrier = threading.Barrier(len(args_per_thread))
+    results = [None] * len(args_per_thread)
+
+    def run(i, args):
+        try:
+            barrier.wait()
+            results[i] = func(*args)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=run, args=(i, args)) for i, args in enumerate(args_per_thread)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+@override_settings(TASKS_RUNNER='immediate')
+class RideClaimTests(TransactionTestCase):
+    """``claim`` and ``complete`` are compare-and-set: one caller wins, money moves once."""
+    def setUp(self):
+        cache.clear()
+        self.customer = make_user('customer', 'customer', '100.00')
+        self.riders = [make_user(f'rider{i}', 'rider') for i in range(4)]
+        self.ride = make_ride(self.customer)
+
+    def assertChargedOnce(self, rider):
+        self.customer.refresh_from_db()
+        rider.refresh_from_db()
+        self.assertEqual(self.customer.balance, Decimal('50.00'))
+        self.assertEqual(rider.balance, Decimal('50.00'))
+        self.assertEqual(BalanceEntry.objects.filter(reference=f'ride:{self.ride.pk}').count(), 2)
+
+    def test_second_claim_loses(self):
+        self.assertTrue(Ride.objects.claim(self.ride.pk, self.riders[0]))
+        self.assertFalse(Ride.objects.claim(self.ride.pk, self.riders[1]))
+        self.ride.refresh_from_db()
+        self.assertEqual((self.ride.status, self.ride.rider_id), ('assigned', self.riders[0].pk))
+        self.assertEqual(self.ride.accepted_at, self.ride.updated_at)
+
+    def test_second_rider_accepting_is_turned_away(self):
+        for rider in self.riders[:2]:
+            self.client.force_login(rider)
+            self.client.post(reverse('accept_ride', args=[self.ride.pk]))
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.rider_id, self.riders[0].pk)
+        self.assertEqual(self.ride.events.filter(description__startswith='Ride accepted').count(), 1)
+
+    def test_double_complete_charges_once(self):
+        rider = self.riders[0]
+        Ride.objects.claim(self.ride.pk, rider)
+        self.client.force_login(rider)
+        for _ in range(2):
+            self.client.post(reverse('complete_ride', args=[self.ride.pk]))
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.status, 'dropped')
+        self.assertChargedOnce(rider)
+        self.assertFalse(Ride.objects.complete(self.ride.pk, rider))
+
+    def test_only_the_assigned_rider_completes(self):
+        Ride.objects.claim(self.ride.pk, self.riders[0])
+        self.assertFalse(Ride.objects.complete(self.ride.pk, self.riders[1]))
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.status, 'assigned')
+
+    @concurrent
+    def test_concurrent_claims_have_one_winner(self):
+        results = race(Ride.objects.claim, *[(self.ride.pk, rider) for rider in self.riders])
+        self.assertEqual(results.count(True), 1)
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.rider_id, self.riders[results.index(True)].pk)
+
+    @concurrent
+    def test_two_riders_accepting_at_once_have_one_winner(self):
+        clients = [Client(), Client()]
+        for client, rider in zip(clients, self.riders):
+            client.force_login(rider)
+        race(lambda client: client.post(reverse('accept_ride', args=[self.ride.pk])), *[(c,) for c in clients])
+        self.ride.refresh_from_db()
+        self.assertIn(self.ride.rider_id, [rider.pk for rider in self.riders[:2]])
+        self.assertEqual(self.ride.events.filter(description__startswith='Ride accepted').count(), 1)
+
+    @concurrent
+    def test_concurrent_completes_charge_once(self):
+        rider = self.riders[0]
+        Ride.objects.claim(self.ride.pk, rider)
+        clients = [Client(), Client()]
+        for client in clients:
+            client.force_login(rider)
+        race(lambda client: client.post(reverse('complete_ride', args=[self.ride.pk])), *[(c,) for c in clients])
+        self.assertChargedOnce(rider)
+
+
+class RecordDropRaceTests(TransactionTestCase):
+    """Concurrent first drops of a day collide on the insert; the losers retry as increments."""
+    @concurrent
+    def test_first_drops_of_the_day_racing_are_all_counted(self):
+        rider, day = make_user('rider', 'rider'), timezone.localdate()
+        # Every thread finds no row to update before any of them inserts one
+        barrier = threading.Barrier(8, timeout=10)
+        create = RiderDailyStatsQuerySet.create
+
+        def create_together(queryset, **kwargs):
+            barrier.wait()
+            return create(queryset, **kwargs)
+
+        with mock.patch.object(RiderDailyStatsQuerySet, 'create', create_together):
+            race(RiderDailyStats.objects.record_drop, *[(rider.pk, day, Decimal('1.50'), Decimal('10.00'))] * 8)
+        row = RiderDailyStats.objects.get()
+        self.assertEqual((row.rides, row.distance, row.earnings), (8, Decimal('12.00'), Decimal('80.00')))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite only')
+class ConcurrentSQLiteTests(SimpleTestCase):
+    """``ridebooking.sqlite`` applies its pragmas and takes the write lock at BEGIN."""
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'db.sqlite3')
+        self.db = SQLiteWrapper({
+            **connection.settings_dict, 'NAME': self.path,
+            'OPTIONS': {'transaction_mode': 'immediate', 'pragmas': {'journal_mode': 'WAL', 'busy_timeout': 1234}},
+        }, alias='concurrent-sqlite')
+        connections[self.db.alias] = self.db
+        self.addCleanup(connections.__delitem__, self.db.alias)
+        self.addCleanup(self.db.close)
+
+    def pragma(self, name):
+        with self.db.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_apply_to_each_connection(self):
+        self.assertEqual((self.pragma('journal_mode'), self.pragma('busy_timeout')), ('wal', 1234))
+        self.db.close()
+        self.assertEqual(self.pragma('busy_timeout'), 1234)
+
+    def test_atomic_takes_the_write_lock_up_front(self):
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with transaction.atomic(using=self.db.alias):
+            # Nothing written yet, and still another writer can't start
+            with self.assertRaisesRegex(sqlite3.OperationalError, 'locked'):
+                other.execute('BEGIN IMMEDIATE')
+        other.execute('BEGIN IMMEDIATE')
+        other.rollback()
+
+
+class RideEventTests(TransactionTestCase):
+    """Events are numbered from the ride's own ``event_seq``, with no gaps or repeats."""
+    def setUp(self):
+        self.ride = make_ride(make_user('customer', 'customer'))
+
+    def steps(self):
+        return list(self.ride.events.values_list('step_count', flat=True))
+
+    def test_batches_continue_the_sequence(self):
+        events = self.ride.log_events(['Rider on the way', 'Rider arrived'])
+        self.assertEqual([event.step_count for event in events], [3, 4])
+        self.assertEqual(self.ride.log_event('Picked up').step_count, 5)
+        self.assertEqual(self.ride.log_events([]), [])
+        self.assertEqual(self.steps(), [1, 2, 3, 4, 5])
+        self.ride.refresh_from_db()
+        self.assertEqual(self.ride.event_seq, 5)
+
+    @concurrent
+    def test_concurrent_appends_get_disjoint_steps(self):
+        race(Ride.objects.append_events, *[(self.ride.pk, [f'note {i}a', f'note {i}b']) for i in range(4)])
+        self.assertEqual(self.steps(), list(range(1, 11)))
+
+
+class KeysetPaginationTests(TestCase):
+    """Walking the cursors visits every row once, even across runs of equal sort keys."""
+    def setUp(self):
+        customer = make_user('customer', 'customer')
+        for _ in range(7):
+            make_ride(customer)
+        # Three pages of three with ties straddling both page boundaries
+        stamps = [timezone.now() - timedelta(minutes=m) for m in (0, 1, 1, 1, 1, 2, 2)]
+        for ride, stamp in zip(Ride.objects.order_by('id'), stamps):
+            Ride.objects.filter(pk=ride.pk).update(created_at=stamp)
+
+    def walk(self, paginate=keyset_paginate, **kwargs):
+        pages, cursor = [], None
+        while True:
+            page = paginate(Ride.objects.all(), cursor, page_size=3, **kwargs)
+            pages.append([ride.pk for ride in page])
+            self.assertEqual(page.is_first, cursor is None)
+            if not page.has_next:
+                return pages
+            cursor = page.next_cursor
+
+    def test_pages_have_no_gaps_or_repeats(self):
+        expected = list(Ride.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+        pages = self.walk()
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+        expected.reverse()
+        self.assertEqual(sum(self.walk(descending=False), []), expected)
+
+    def test_async_pages_match(self):
+        self.assertEqual(self.walk(async_to_sync(akeyset_paginate)), self.walk())
+
+    def test_bad_cursor_falls_back_to_the_first_page(self):
+        first = keyset_paginate(Ride.objects.all(), page_size=3)
+        for cursor in ('garbage', 'WzFd', first.next_cursor[:-2]):
+            page = keyset_paginate(Ride.objects.all(), cursor, page_size=3)
+            self.assertTrue(page.is_first)
+            self.assertEqual(list(page), list(first))
+
+
+class RiderDailyStatsTests(TestCase):
+    """``record_drop`` keeps the rollup that ``rebuild`` would compute from the rides."""
+    def setUp(self):
+        customer = make_user('customer', 'customer')
+        self.riders = [make_user('rider0', 'rider'), make_user('rider1', 'rider')]
+        yesterday = timezone.now() - timedelta(days=1)
+        for rider, when in [(self.riders[0], yesterday), (self.riders[0], None), (self.riders[0], None),
+                            (self.riders[1], yesterday)]:
+            ride = make_ride(customer)
+            Ride.objects.claim(ride.pk, rider)
+            Ride.objects.complete(ride.pk, rider)
+            if when is not None:
+                Ride.objects.filter(pk=ride.pk).update(updated_at=when)
+            ride.refresh_from_db()
+            RiderDailyStats.objects.record_drop(rider.pk, timezone.localdate(ride.updated_at),
+                                                ride.total_distance, ride.price)
+        # Still open, so not counted
+        make_ride(customer)
+
+    def rows(self):
+        return sorted(RiderDailyStats.objects.values_list('rider_id', 'day', 'rides', 'distance', 'earnings'))
+
+    def test_rebuild_matches_the_recorded_drops(self):
+        recorded = self.rows()
+        self.assertEqual([row[2] for row in recorded], [1, 2, 1])
+        # Archived rides still count towards a rebuild
+        archive_batch(timezone.now() - timedelta(hours=1))
+        self.assertEqual(ArchivedRide.objects.count(), 2)
+        RiderDailyStats.objects.rebuild()
+        self.assertEqual(self.rows(), recorded)
+
+    def test_rebuild_limited_to_some_riders(self):
+        recorded = self.rows()
+        RiderDailyStats.objects.update(rides=0)
+        RiderDailyStats.objects.rebuild(rider_ids=[self.riders[1].pk])
+        self.assertEqual(
+            [row for row in self.rows() if row[0] == self.riders[1].pk],
+            [row for row in recorded if row[0] == self.riders[1].pk],
+        )
+        self.assertFalse([row for row in self.rows() if row[0] == self.riders[0].pk and row[2]])
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.customer, self.rider = make_user('customer', 'customer'), make_user('rider', 'rider')
+        self.old = []
+        for status in ['dropped', 'dropped', 'dropped', 'created']:
+            ride = make_ride(self.customer)
+            if status == 'dropped':
+                Ride.objects.claim(ride.pk, self.rider)
+                Ride.objects.complete(ride.pk, self.rider)
+                ride.log_event('Ride completed successfully')
+            Ride.objects.filter(pk=ride.pk).update(updated_at=timezone.now() - timedelta(days=200))
+            self.old.append(ride.pk)
+        self.recent = make_ride(self.customer, self.rider, 'dropped').pk
+
+    def test_moves_old_dropped_rides_with_their_events(self):
+        out = StringIO()
+        call_command('archive_rides', dry_run=True, stdout=out)
+        self.assertIn('3 dropped rides', out.getvalue())
+
+        call_command('archive_rides', batch_size=2, stdout=out)
+        self.assertIn('Archived 3 rides and 9 events', out.getvalue())
+        self.assertEqual(set(Ride.objects.values_list('pk', flat=True)), {self.old[3], self.recent})
+        self.assertEqual(set(ArchivedRide.objects.values_list('pk', flat=True)), set(self.old[:3]))
+
+        ride = Ride.history.get_ride(self.old[0])
+        self.assertIsInstance(ride, ArchivedRide)
+        self.assertEqual(list(ride.events.values_list('step_count', flat=True)), [1, 2, 3])
+        self.assertIsInstance(Ride.history.get_ride(self.recent), Ride)
+        with self.assertRaises(Ride.DoesNotExist):
+            Ride.history.get_ride(0)
+        self.assertEqual(Ride.history.values(customer=self.customer).count(), 5)
+        archived = sorted(row['archived'] for row in Ride.history.values(status='dropped'))
+        self.assertEqual(archived, [False, True, True, True])
+
+        # Nothing left to move
+        self.assertEqual(archive_batch(archive_cutoff()), (0, 0))
+
+
+class AsyncViewTests(TestCase):
+    """The ``ASYNC_VIEWS`` variants list the same rides as the sync views."""
+    def setUp(self):
+        cache.clear()
+        self.customer, self.rider = make_user('customer', 'customer'), make_user('rider', 'rider')
+        self.staff = make_user('staff', 'staff')
+        for i in range(25):
+            make_ride(self.customer, self.rider if i % 3 else None, 'assigned' if i % 3 else 'created')
+        self.factory = RequestFactory()
+
+    def get(self, view, user, path='/', params=None, **kwargs):
+        request = self.factory.get(path, params)
+        request.user = user
+        return view(request, **kwargs)
+
+    def listed(self, view, user, **params):
+        response = self.get(view, user, params=params)
+        self.assertEqual(response.status_code, 200)
+        return re.findall(r'href="/rides/(\d+)/"', response.content.decode())
+
+    def test_lists_match(self):
+        # A cursor into the middle of the (created_at, id) ordering
+        cursor = keyset_paginate(Ride.objects.all(), page_size=10).next_cursor
+        for sync_view, async_view in [(ride_list, ride_list_async), (home_view, home_view_async)]:
+            for user in (self.customer, self.rider, self.staff):
+                with self.subTest(view=sync_view.__name__, user=user.username):
+                    self.assertEqual(self.listed(async_to_sync(async_view), user), self.listed(sync_view, user))
+                    self.assertEqual(self.listed(async_to_sync(async_view), user, cursor=cursor),
+                                     self.listed(sync_view, user, cursor=cursor))
+        self.assertEqual(len(self.listed(ride_list, self.customer)), 20)
+
+    def test_detail_and_login_match(self):
+        ride = Ride.objects.first()
+        for view in (ride_detail, async_to_sync(ride_detail_async)):
+            self.assertContains(self.get(view, self.customer, pk=ride.pk), ride.pickup_location)
+
+        response = self.get(async_to_sync(ride_list_async), AnonymousUser(), '/rides/')
+        self.assertRedirects(response, reverse('accounts:login') + '?next=/rides/', fetch_redirect_response=False)
+
+
+class RoutingTests(SimpleTestCase):
+    def test_pair_cache_evicts_least_recently_used(self):
+        pairs = PairCache(maxsize=2)
+        pairs.set('a', 1)
+        pairs.set('b', 2)
+        pairs.get('a')
+        pairs.set('c', 3)
+        self.assertEqual((pairs.get('a'), pairs.get('b'), pairs.get('c')), (1, None, 3))
+        self.assertEqual(len(pairs), 2)
+
+    def test_pair_cache_entries_expire(self):
+        pairs = PairCache(ttl=60)
+        with mock.patch('rides.routing.time.monotonic', return_value=1000.0):
+            pairs.set('a', 1)
+        with mock.patch('rides.routing.time.monotonic', return_value=1060.0):
+            self.assertEqual(pairs.get('a'), 1)
+        with mock.patch('rides.routing.time.monotonic', return_value=1060.5):
+            self.assertIsNone(pairs.get('a'))
+        self.assertEqual(len(pairs), 0)
+
+    def test_both_directions_and_spellings_share_an_entry(self):
+        engine = RoutingEngine(cache=PairCache())
+        km = engine.distance('Makati', 'BGC')
+        self.assertEqual(engine.distance('bonifacio global city, Metro Manila', 'makati'), km)
+        self.assertEqual(len(engine.cache), 1)
+        self.assertEqual(engine.distances([('BGC', 'Makati'), ('Makati', 'Atlantis')]), [float(km), None])
+        with self.assertRaises(UnknownLocation):
+            engine.distance('Makati', 'Atlantis')
+
+
+@override_settings(RIDES_QUOTE_TOKENS=['partner-token'], RIDES_QUOTE_MAX_PAIRS=5, RIDES_QUOTE_MAX_BYTES=400)
+class QuoteTests(TestCase):
+    pairs = [['Makati', 'BGC'], ['qc', 'moa'], ['14.55,121.02', 'Ortigas'], ['Makati', 'Atlantis']]
+
+    def post(self, pairs, **headers):
+        return self.client.post(reverse('quote_rides'), json.dumps({'pairs': pairs}),
+                                content_type='application/json', **headers)
+
+    def test_batch_matches_single_quotes_in_order(self):
+        results = self.post(self.pairs, HTTP_AUTHORIZATION='Bearer partner-token').json()['results']
+        self.assertEqual(len(results), len(self.pairs))
+        for (pickup, destination), result in zip(self.pairs[:3], results):
+            with self.subTest(pickup=pickup, destination=destination):
+                self.assertEqual(result, quote(pickup, destination))
+        self.assertEqual(results[3], {'error': 'Unknown location: Atlantis'})
+
+    def test_fares_agree_for_every_gazetteer_pair(self):
+        pairs = [(a, b) for a in GAZETTEER for b in GAZETTEER]
+        self.assertEqual(quote_pairs(pairs), [quote(a, b) for a, b in pairs])
+
+    def test_batch_fares_match_decimal_fares(self):
+        distances = [0.0, 0.01, 3.67, 12.35, 999.99] + [i / 100 for i in range(1, 5000, 7)]
+        self.assertEqual(fares_for(distances), [float(fare_for(str(km))) for km in distances])
+
+    def test_needs_a_partner_token_or_staff(self):
+        self.assertEqual(self.post(self.pairs).status_code, 403)
+        self.assertEqual(self.post(self.pairs, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        self.client.force_login(make_user('customer', 'customer'))
+        self.assertEqual(self.post(self.pairs).status_code, 403)
+        self.client.force_login(make_user('staff', 'staff'))
+        self.assertEqual(self.post(self.pairs).status_code, 200)
+
+    def test_limits(self):
+        auth = {'HTTP_AUTHORIZATION': 'Bearer partner-token'}
+        self.assertEqual(self.post([['Makati', 'BGC']] * 6, **auth).status_code, 400)
+        self.assertEqual(self.post([['Makati' * 20, 'BGC']] * 3, **auth).status_code, 413)
+
+
+class OpenRideIndexTests(TestCase):
+    def setUp(self):
+        self.customer = make_user('customer', 'customer')
+        self.rides = [make_ride(self.customer) for _ in range(3)]
+        self.index = OpenRideIndex(refresh_seconds=60, sync_seconds=60)
+
+    def test_syncs_on_a_timer_not_per_query(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.index.nearby(14.55, 121.02)), 3)
+        make_ride(self.customer)
+        # Only the re-check of the hits against the table
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.index.nearby(14.55, 121.02)), 3)
+        self.index._synced_at -= 60
+        self.assertEqual(len(self.index.nearby(14.55, 121.02)), 4)
+
+    def test_taken_rides_are_dropped(self):
+        self.index.nearby(14.55, 121.02)
+        Ride.objects.claim(self.rides[0].pk, make_user('rider', 'rider'))
+        self.assertNotIn(self.rides[0].pk, [ride.pk for _, ride in self.index.nearby(14.55, 121.02)])
+        self.assertNotIn(self.rides[0].pk, self.index)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        store = tempfile.NamedTemporaryFile(suffix='.sqlite3', delete=False)
+        store.close()
+        self.addCleanup(os.unlink, store.name)
+        override = override_settings(METRICS_STORE=store.name, METRICS_TOKEN='scrape-token')
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_scrape_needs_the_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-tokeN').status_code, 403)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-token').status_code, 200)
+
+    def test_from_db_counts_archived_rides(self):
+        customer, rider = make_user('customer', 'customer', '100.00'), make_user('rider', 'rider')
+        for _ in range(2):
+            ride = make_ride(customer)
+            Ride.objects.claim(ride.pk, rider)
+            Ride.objects.complete(ride.pk, rider)
+        archive_batch(timezone.now() + timedelta(seconds=1), batch_size=1)
+        self.assertEqual((Ride.objects.count(), ArchivedRide.objects.count()), (1, 1))
+
+        out = StringIO()
+        call_command('export_metrics', from_db=1, stdout=out)
+        self.assertIn('ridebooking_ride_wait_seconds_count{stage="dropped"} 2', out.getvalue())
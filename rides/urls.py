@@ -1,11 +1,17 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
 urlpatterns = [
     path('create/', views.create_ride, name='create_ride'),
-    path('', views.ride_list, name='ride_list'),
-    path('<int:pk>/', views.ride_detail, name='ride_detail'),
+    path('', views.ride_list_async if settings.ASYNC_VIEWS else views.ride_list, name='ride_list'),
+    path('<int:pk>/', views.ride_detail_async if settings.ASYNC_VIEWS else views.ride_detail, name='ride_detail'),
     path('<int:pk>/accept/', views.accept_ride, name='accept_ride'),
     path('<int:pk>/complete/', views.complete_ride, name='complete_ride'),
+    path('nearby/', views.nearby_rides, name='nearby_rides'),
     path('calculate-distance/', views.calculate_distance, name='calculate_distance'),
+    path('quotes/', views.quote_rides, name='quote_rides'),
 ]
+
+if settings.RIDE_FEED_ENABLED:
+    urlpatterns.append(path('feed/', views.ride_feed, name='ride_feed'))
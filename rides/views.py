@@ -2,16 +2,40 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
-from django.http import JsonResponse, HttpResponseNotAllowed
+from django.urls import reverse
+from django.conf import settings
+from django.views.decorators.csrf import csrf_exempt
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse, HttpResponseNotAllowed, StreamingHttpResponse
 from .models import Ride, RideEvent
 from .forms import RideForm
-import random
+from .pagination import akeyset_paginate, keyset_paginate
+from .fragments import (
+    OPEN_RIDES, acached_list, alist_cache_key, bump_ride_lists, cached_list, list_cache_key, user_scope,
+)
+from .broker import RIDES_CHANNEL, get_broker, publish_ride
+from .quotes import PRICE_PER_KM, quote, quote_pairs
+from .routing import UnknownLocation
+from .spatial import get_open_ride_index
+from .signals import ride_status_changed
+from .tasks import record_ride_drop
+import asyncio
+import hmac
+import json
 from decimal import Decimal, InvalidOperation
-from django.db.models import Max
+from accounts.ledger import InsufficientFunds, transfer
+from ridebooking.decorators import async_login_required
+from ridebooking.idempotency import idempotent
+from tasks.queue import enqueue
 
-PRICE_PER_KM = Decimal('20.00')  # 20 PHP per km (not used here but kept)
+# Rider matching defaults (km / number of rides)
+NEARBY_RADIUS_KM = 5.0
+MAX_NEARBY_RADIUS_KM = 50.0
+NEARBY_LIMIT = 20
+MAX_NEARBY_LIMIT = 100
 
 @login_required
+@idempotent
 def create_ride(request):
     if request.user.user_role != 'customer':
         messages.error(request, 'Only customers can create rides')
@@ -41,14 +65,26 @@ def create_ride(request):
             ride.price = price
             ride.customer = request.user
             ride.status = 'created'
+            # A new ride starts its event sequence at the creation event
+            ride.event_seq = 1
             ride.save()
 
-            # Create initial ride event with dynamic step_count
             RideEvent.objects.create(
                 ride=ride,
                 step_count=1,
                 description="User created a ride."
             )
+            transaction.on_commit(lambda: ride_status_changed.send(Ride, ride_id=ride.pk, status='created'))
+            transaction.on_commit(lambda: publish_ride(
+                'ride.created', ride.pk, ride.status,
+                pickup_location=ride.pickup_location,
+                destination=ride.destination,
+                total_distance=str(ride.total_distance),
+                price=str(ride.price),
+                url=reverse('ride_detail', args=[ride.pk]),
+            ))
+            if ride.pickup_lat is not None:
+                transaction.on_commit(lambda: get_open_ride_index().add(ride.pk, ride.pickup_lat, ride.pickup_lng))
 
             messages.success(request, 'Ride created successfully!')
             return redirect('ride_detail', pk=ride.pk)
@@ -58,26 +94,125 @@ def create_ride(request):
     return render(request, 'rides/create_ride.html', {'form': form})
 
 
+def _ride_list_query(user):
+    """The rides ``user`` may browse, the keyset fields to page them by and
+    the ``rides.fragments`` scope caching them (None: not cached)."""
+    if user.user_role == 'customer':
+        rides, scope = Ride.objects.filter(customer=user), user_scope(user.pk)
+    elif user.user_role == 'rider':
+        rides, scope = Ride.objects.filter(status='created'), OPEN_RIDES
+    else:  # staff
+        # The primary key follows creation order and needs no extra index
+        return Ride.objects.all().select_related('customer', 'rider'), ('id',), None
+    return rides.select_related('customer', 'rider'), ('created_at', 'id'), scope
+
+
 @login_required
 def ride_list(request):
-    if request.user.user_role == 'customer':
-        rides = Ride.objects.filter(customer=request.user)
-    elif request.user.user_role == 'rider':
-        rides = Ride.objects.filter(status='created')
-    else:  # staff
-        rides = Ride.objects.all()
+    if request.user.user_role == 'rider':
+        point = _point(request)
+        if point is not None:
+            # Closest open rides to the rider instead of the newest ones
+            nearby = get_open_ride_index().nearby(*point, k=NEARBY_LIMIT, radius_km=_radius(request))
+            return render(request, 'rides/ride_list.html', {'rides': [ride for _, ride in nearby]})
+
+    rides, fields, scope = _ride_list_query(request.user)
+    cursor = request.GET.get('cursor')
+    if scope is None:
+        page = keyset_paginate(rides, cursor=cursor, fields=fields)
+    else:
+        key = list_cache_key(scope, 'ride_list', cursor or '')
+        page = cached_list(key, lambda: keyset_paginate(rides, cursor=cursor, fields=fields))
+    return render(request, 'rides/ride_list.html', {'rides': page.object_list, 'page': page})
+
+
+@async_login_required
+async def ride_list_async(request):
+    """``ride_list`` on the async ORM, for ``ASYNC_VIEWS`` under ASGI."""
+    if request.user.user_role == 'rider':
+        point = _point(request)
+        if point is not None:
+            index = get_open_ride_index()
+            nearby = await sync_to_async(index.nearby)(*point, k=NEARBY_LIMIT, radius_km=_radius(request))
+            return render(request, 'rides/ride_list.html', {'rides': [ride for _, ride in nearby]})
+
+    rides, fields, scope = _ride_list_query(request.user)
+    cursor = request.GET.get('cursor')
+    if scope is None:
+        page = await akeyset_paginate(rides, cursor=cursor, fields=fields)
+    else:
+        key = await alist_cache_key(scope, 'ride_list', cursor or '')
+        page = await acached_list(key, lambda: akeyset_paginate(rides, cursor=cursor, fields=fields))
+    return render(request, 'rides/ride_list.html', {'rides': page.object_list, 'page': page})
+
+
+def _point(request):
+    try:
+        lat, lng = float(request.GET['lat']), float(request.GET['lng'])
+    except (KeyError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def _radius(request):
+    try:
+        radius = float(request.GET.get('radius', NEARBY_RADIUS_KM))
+    except ValueError:
+        radius = NEARBY_RADIUS_KM
+    return min(max(radius, 0.1), MAX_NEARBY_RADIUS_KM)
 
-    return render(request, 'rides/ride_list.html', {'rides': rides})
+
+@login_required
+def nearby_rides(request):
+    """JSON list of the open rides closest to ``lat``/``lng`` (within ``radius`` km)"""
+    if request.user.user_role not in ('rider', 'staff'):
+        return JsonResponse({'error': 'Riders only'}, status=403)
+    point = _point(request)
+    if point is None:
+        return JsonResponse({'error': 'Valid lat and lng are required'}, status=400)
+    try:
+        k = min(max(int(request.GET.get('k', NEARBY_LIMIT)), 1), MAX_NEARBY_LIMIT)
+    except ValueError:
+        k = NEARBY_LIMIT
+
+    nearby = get_open_ride_index().nearby(*point, k=k, radius_km=_radius(request))
+    return JsonResponse({'rides': [{
+        'id': ride.pk,
+        'distance_km': round(distance, 3),
+        'pickup_location': ride.pickup_location,
+        'destination': ride.destination,
+        'total_distance': str(ride.total_distance),
+        'price': str(ride.price),
+        'url': reverse('ride_detail', args=[ride.pk]),
+    } for distance, ride in nearby]})
 
 
 @login_required
 def ride_detail(request, pk):
-    ride = get_object_or_404(Ride, pk=pk)
+    # Old rides may have been archived; their links keep working
+    try:
+        ride = Ride.history.get_ride(pk)
+    except Ride.DoesNotExist:
+        raise Http404('No Ride matches the given query.')
     events = ride.events.all().order_by('step_count')
     return render(request, 'rides/ride_detail.html', {'ride': ride, 'events': events})
 
 
+@async_login_required
+async def ride_detail_async(request, pk):
+    """``ride_detail`` on the async ORM, for ``ASYNC_VIEWS`` under ASGI."""
+    try:
+        ride = await Ride.history.aget_ride(pk)
+    except Ride.DoesNotExist:
+        raise Http404('No Ride matches the given query.')
+    events = [event async for event in ride.events.all().order_by('step_count')]
+    return render(request, 'rides/ride_detail.html', {'ride': ride, 'events': events})
+
+
 @login_required
+@idempotent
 def accept_ride(request, pk):
     # Accepting a ride must be a POST action
     if request.method != 'POST':
@@ -87,30 +222,25 @@ def accept_ride(request, pk):
         messages.error(request, 'Only riders can accept rides')
         return redirect('home')
 
-    ride = get_object_or_404(Ride, pk=pk)
-
-    if ride.status != 'created':
-        messages.error(request, 'This ride is no longer available')
-        return redirect('ride_list')
-
     with transaction.atomic():
-        ride.rider = request.user
-        ride.status = 'assigned'
-        ride.save()
-
-        # compute next step_count
-        last_step = ride.events.aggregate(max_step=Max('step_count'))['max_step'] or 0
-        RideEvent.objects.create(
-            ride=ride,
-            step_count=last_step + 1,
-            description=f"Ride accepted by {request.user.get_full_name()}"
-        )
+        if not Ride.objects.claim(pk, request.user):
+            # Lost the race (or the ride never existed): answer without locking anything
+            if not Ride.objects.filter(pk=pk).exists():
+                raise Http404('No Ride matches the given query.')
+            messages.error(request, 'This ride is no longer available')
+            return redirect('ride_list')
+
+        Ride.objects.append_events(pk, [f"Ride accepted by {request.user.get_full_name()}"])
+        transaction.on_commit(lambda: ride_status_changed.send(Ride, ride_id=pk, status='assigned'))
+        transaction.on_commit(lambda: publish_ride('ride.taken', pk, 'assigned'))
+        transaction.on_commit(lambda: get_open_ride_index().remove(pk))
 
     messages.success(request, 'Ride accepted successfully!')
     return redirect('ride_detail', pk=pk)
 
 
 @login_required
+@idempotent
 def complete_ride(request, pk):
     # Completing a ride must be a POST action
     if request.method != 'POST':
@@ -118,7 +248,7 @@ def complete_ride(request, pk):
 
     ride = get_object_or_404(Ride, pk=pk)
 
-    if request.user != ride.rider:
+    if request.user.pk != ride.rider_id:
         messages.error(request, 'You are not authorized to complete this ride')
         return redirect('ride_list')
 
@@ -126,48 +256,144 @@ def complete_ride(request, pk):
         messages.error(request, 'Invalid ride status')
         return redirect('ride_detail', pk=pk)
 
-    with transaction.atomic():
-        # Transfer balance from customer to rider using Decimal arithmetic
-        customer = ride.customer
-        rider = ride.rider
-        try:
-            price = Decimal(ride.price)
-        except (InvalidOperation, TypeError):
-            messages.error(request, 'Invalid ride price stored. Please contact support.')
-            return redirect('ride_detail', pk=pk)
-
-        # Ensure customer still has sufficient balance
-        if customer.balance < price:
-            messages.error(request, 'Customer has insufficient balance to complete this ride.')
-            return redirect('ride_detail', pk=pk)
-
-        # Update ride status first
-        ride.status = 'dropped'
-        ride.save()
-
-        # Transfer funds
-        customer.balance = (Decimal(customer.balance) - price).quantize(Decimal('0.01'))
-        rider.balance = (Decimal(rider.balance) + price).quantize(Decimal('0.01'))
-
-        customer.save()
-        rider.save()
-
-        # create completion event with incremented step_count
-        last_step = ride.events.aggregate(max_step=Max('step_count'))['max_step'] or 0
-        RideEvent.objects.create(
-            ride=ride,
-            step_count=last_step + 1,
-            description="Ride completed successfully"
-        )
+    try:
+        price = Decimal(ride.price)
+    except (InvalidOperation, TypeError):
+        messages.error(request, 'Invalid ride price stored. Please contact support.')
+        return redirect('ride_detail', pk=pk)
+
+    try:
+        with transaction.atomic():
+            # Flip the status first so a double submit can't pay out twice
+            if not Ride.objects.complete(pk, request.user):
+                messages.error(request, 'Invalid ride status')
+                return redirect('ride_detail', pk=pk)
+
+            # Move the fare from customer to rider through the balance ledger
+            if price > 0:
+                transfer(ride.customer_id, ride.rider_id, price, reference=f'ride:{pk}')
+
+            # Only the money has to move before we answer; the event log and
+            # stats rollup follow from the task queue once this commits
+            enqueue(record_ride_drop, key=f'ride-dropped:{pk}', ride_id=pk)
+            transaction.on_commit(lambda: publish_ride('ride.completed', pk, 'dropped'))
+            # The 'dropped' signal waits for the task; the lists shouldn't
+            transaction.on_commit(lambda: bump_ride_lists(ride.customer_id, ride.rider_id))
+    except InsufficientFunds:
+        messages.error(request, 'Customer has insufficient balance to complete this ride.')
+        return redirect('ride_detail', pk=pk)
 
     messages.success(request, 'Ride completed successfully!')
     return redirect('ride_detail', pk=pk)
 
 
+FEED_KEEPALIVE_SECONDS = 20
+FEED_MAX_SECONDS = 300
+
+
+async def ride_feed(request):
+    """Server-sent events stream of ride deltas for riders.
+
+    Serve this through ``ridebooking.asgi``: every connection is a coroutine
+    parked on a broker queue, so idle riders cost neither a worker nor a query.
+    """
+    role = await sync_to_async(lambda: request.user.is_authenticated and request.user.user_role)()
+    if role not in ('rider', 'staff'):
+        return JsonResponse({'error': 'Riders only'}, status=403)
+
+    async def stream():
+        loop = asyncio.get_running_loop()
+        # Streams end after a while and EventSource reconnects, so a client
+        # that vanished without the server noticing can't hold a slot forever
+        deadline = loop.time() + FEED_MAX_SECONDS
+        async with get_broker().subscribe(RIDES_CHANNEL) as queue:
+            yield 'retry: 5000\n\n'
+            while loop.time() < deadline:
+                try:
+                    message = await asyncio.wait_for(queue.get(), FEED_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                    continue
+                yield f"event: {message['event']}\ndata: {json.dumps(message)}\n\n"
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
 def calculate_distance(request):
-    """AJAX view to calculate random distance"""
-    if request.method == 'POST':
-        distance = random.uniform(10, 30)
-        # Return a rounded float value
-        return JsonResponse({'distance': round(distance, 2)})
-    return JsonResponse({'error': 'Invalid request method'}, status=400)
+    """AJAX view returning the road distance and suggested fare between pickup and destination"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid request method'}, status=400)
+
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    else:
+        data = request.POST
+    pickup = data.get('pickup') or data.get('pickup_location')
+    destination = data.get('destination')
+    if not pickup or not destination:
+        return JsonResponse({'error': 'Both pickup and destination are required'}, status=400)
+
+    try:
+        return JsonResponse(quote(pickup, destination))
+    except UnknownLocation as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+
+
+def _quote_client_allowed(request):
+    # Partners send one of RIDES_QUOTE_TOKENS; staff may use their session
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Bearer '):
+        given = auth[len('Bearer '):].encode()
+        return any(hmac.compare_digest(given, token.encode()) for token in settings.RIDES_QUOTE_TOKENS)
+    return request.user.is_authenticated and request.user.user_role == 'staff'
+
+
+@csrf_exempt  # read-only, and partners post from outside a browser session
+def quote_rides(request):
+    """Batch quotes: POST JSON ``{"pairs": [[pickup, destination], ...]}``.
+
+    Pairs may also be ``{"pickup": ..., "destination": ...}`` objects. The
+    response has one ``{"distance", "fare"}`` or ``{"error"}`` per pair, in
+    input order. Callers need a ``RIDES_QUOTE_TOKENS`` bearer token or a
+    staff session.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    if not _quote_client_allowed(request):
+        return JsonResponse({'error': 'A partner token or a staff login is required'}, status=403)
+
+    max_bytes = settings.RIDES_QUOTE_MAX_BYTES
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    # The header is only a hint; the limit applies to what is actually read
+    body = b'' if length > max_bytes else request.read(max_bytes + 1)
+    if length > max_bytes or len(body) > max_bytes:
+        return JsonResponse({'error': 'Request body too large'}, status=413)
+    try:
+        pairs = json.loads(body).get('pairs')
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Expected a JSON object with a "pairs" list'}, status=400)
+    if not isinstance(pairs, list):
+        return JsonResponse({'error': 'Expected a JSON object with a "pairs" list'}, status=400)
+    max_pairs = settings.RIDES_QUOTE_MAX_PAIRS
+    if len(pairs) > max_pairs:
+        return JsonResponse({'error': f'At most {max_pairs} pairs per request'}, status=400)
+
+    cleaned = []
+    for i, pair in enumerate(pairs):
+        if isinstance(pair, dict):
+            pair = (pair.get('pickup') or pair.get('pickup_location'), pair.get('destination'))
+        if not isinstance(pair, (list, tuple)) or len(pair) != 2 \
+                or not all(isinstance(place, str) and place for place in pair):
+            return JsonResponse({'error': f'Pair {i} needs a pickup and a destination'}, status=400)
+        cleaned.append(tuple(pair))
+    return JsonResponse({'results': quote_pairs(cleaned), 'price_per_km': float(PRICE_PER_KM)})
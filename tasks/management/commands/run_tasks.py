@@ -0,0 +1,56 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+from tasks.models import Task
+from tasks.queue import run_due
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks. Polls for due tasks every --poll seconds "
+        "and runs them in this process; start as many workers as you like, "
+        "since each task is claimed with a compare-and-set UPDATE. Tasks left "
+        "'running' by a worker that died are requeued after --lock-timeout; "
+        "a run that is merely slow still applies at most once, because it "
+        "marks its task done in its own transaction, fenced on its claim. "
+        "Use with TASKS_RUNNER='worker' so web processes only enqueue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the due tasks and exit')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to sleep when idle')
+        parser.add_argument('--batch-size', type=int, default=20)
+        parser.add_argument('--lock-timeout', type=int, default=300,
+                            help='Requeue tasks running for longer than this many seconds')
+        parser.add_argument('--prune-days', type=int, default=7,
+                            help='Delete finished tasks older than this many days (0 keeps them)')
+
+    def handle(self, *args, **options):
+        ran = 0
+        last_maintenance = None
+        try:
+            while True:
+                now = time.monotonic()
+                if last_maintenance is None or now - last_maintenance > 60:
+                    self._maintain(options)
+                    last_maintenance = now
+                count = run_due(options['batch_size'])
+                ran += count
+                close_old_connections()
+                if not count:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Ran {ran} tasks"))
+
+    def _maintain(self, options):
+        released = Task.objects.release_stale(timezone.now() - timedelta(seconds=options['lock_timeout']))
+        if released:
+            self.stdout.write(self.style.WARNING(f"Requeued {released} stale tasks"))
+        if options['prune_days']:
+            cutoff = timezone.now() - timedelta(days=options['prune_days'])
+            Task.objects.filter(status='done', updated_at__lt=cutoff).delete()
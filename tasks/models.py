@@ -0,0 +1,63 @@
+from django.db import models
+from django.utils import timezone
+
+
+class TaskQuerySet(models.QuerySet):
+    def due(self, now=None):
+        return self.filter(status='pending', run_after__lte=now or timezone.now()).order_by('run_after', 'id')
+
+    def claim(self, pk):
+        """Atomically move a due task to ``running``; True if this call got it.
+
+        Same compare-and-set as ``Ride.objects.claim``: workers racing for one
+        task all issue the UPDATE and exactly one sees a row count of 1.
+        """
+        now = timezone.now()
+        return self.filter(pk=pk, status='pending', run_after__lte=now).update(
+            status='running',
+            locked_at=now,
+            attempts=models.F('attempts') + 1,
+        ) == 1
+
+    def release_stale(self, older_than):
+        """Put tasks whose worker died mid-run back in the queue.
+
+        A task that is only slow is safe to release: its run holds its row
+        locked and marks it done in the same transaction, fenced on its
+        claim, so it either finishes first or rolls back (``run_task``).
+        """
+        return self.filter(status='running', locked_at__lt=older_than).update(status='pending', locked_at=None)
+
+
+class Task(models.Model):
+    """A deferred job, written in the same transaction as the work that needs it."""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    name = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict)
+    # Enqueueing a key that is already queued or done is a no-op
+    key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # The worker's poll: due pending tasks, oldest first
+            models.Index(fields=['status', 'run_after', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
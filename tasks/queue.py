@@ -0,0 +1,172 @@
+"""A small database-backed task queue for post-commit side effects.
+
+``enqueue`` writes a ``Task`` row inside the caller's transaction, so a job
+exists exactly when the work that needs it committed, and hands it to the
+runner named by ``TASKS_RUNNER`` once that transaction commits:
+
+* ``'thread'`` (default) runs it on a small in-process thread pool;
+* ``'worker'`` leaves it for ``manage.py run_tasks`` processes to poll;
+* ``'immediate'`` runs it in the committing thread (tests, debugging).
+
+A job enqueued with ``delay`` is due that many seconds later. Only the
+``'worker'`` runner polls for due jobs, so the other two start a timer after
+commit and hand the job to the thread pool when it fires; the same timer
+retries a failed job after its backoff.
+
+Each attempt runs in a transaction that starts by marking the task done,
+fenced on the attempt's own claim, so the database effects of a task apply
+at most once: a run whose task was requeued and claimed again meanwhile
+rolls back instead. Writing first also takes the write lock up front, so on
+SQLite a task waits for other writers rather than failing to upgrade a read
+lock with "database is locked". Failures are retried with
+exponential backoff up to ``max_attempts``. Passing ``key`` makes enqueueing
+idempotent: a second job with the same key is dropped.
+"""
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from importlib import import_module
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def task(func):
+    """Register ``func`` so it can be enqueued and run by name."""
+    _registry[f'{func.__module__}.{func.__name__}'] = func
+    return func
+
+
+def _resolve(name):
+    if name not in _registry:
+        # Importing the module runs its @task decorators
+        import_module(name.rpartition('.')[0])
+    return _registry[name]
+
+
+def enqueue(func, key=None, delay=0, max_attempts=5, **kwargs):
+    """Queue ``func(**kwargs)`` to run after the current transaction commits.
+
+    ``kwargs`` must be JSON-serializable; ``delay`` postpones the run by that
+    many seconds. Returns the new ``Task``, or None when ``key`` was already used.
+    """
+    name = f'{func.__module__}.{func.__name__}'
+    if name not in _registry:
+        raise ValueError(f'{name} is not registered with @task')
+    try:
+        with transaction.atomic():
+            job = Task.objects.create(
+                name=name,
+                kwargs=kwargs,
+                key=key,
+                max_attempts=max_attempts,
+                run_after=timezone.now() + timedelta(seconds=delay),
+            )
+    except IntegrityError:
+        if key is None:
+            raise
+        return None
+    transaction.on_commit(lambda: _dispatch(job.pk, delay))
+    return job
+
+
+def _dispatch(pk, delay=0):
+    runner = getattr(settings, 'TASKS_RUNNER', 'thread')
+    if runner == 'worker':
+        return
+    if delay > 0:
+        _later(delay, pk)
+    elif runner == 'immediate':
+        run_task(pk)
+    else:
+        _thread_pool().submit(_run_in_thread, pk)
+
+
+def _later(seconds, pk):
+    """Hand task ``pk`` to the thread pool in ``seconds``; nothing else polls for it."""
+    timer = threading.Timer(max(seconds, 0), lambda: _thread_pool().submit(_run_in_thread, pk))
+    timer.daemon = True
+    timer.start()
+
+
+def _thread_pool():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'TASKS_THREADS', 2), thread_name_prefix='tasks'
+                )
+    return _executor
+
+
+def _run_in_thread(pk):
+    try:
+        if run_task(pk) is False:
+            # Retry in-process after the backoff; a run_tasks worker may also take it
+            retry_at = Task.objects.filter(pk=pk, status='pending').values_list('run_after', flat=True).first()
+            if retry_at is not None:
+                _later((retry_at - timezone.now()).total_seconds(), pk)
+    except Exception:
+        logger.exception('Task %s crashed its runner', pk)
+    finally:
+        close_old_connections()
+
+
+def _backoff(attempts):
+    base = getattr(settings, 'TASKS_RETRY_SECONDS', 5)
+    return timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+class StaleClaim(Exception):
+    """The task was requeued and claimed by another run since this one claimed it."""
+
+
+def run_task(pk):
+    """Claim and run one task.
+
+    Returns True when it succeeded, False when it failed, and None when
+    another runner had it already (or it isn't due).
+    """
+    if not Task.objects.claim(pk):
+        return None
+    job = Task.objects.get(pk=pk)
+    # Each claim bumps attempts, so this matches only while the claim is ours
+    claimed = Task.objects.filter(pk=pk, status='running', attempts=job.attempts)
+    try:
+        with transaction.atomic():
+            if not claimed.update(status='done', locked_at=None, last_error=''):
+                raise StaleClaim
+            _resolve(job.name)(**job.kwargs)
+        return True
+    except StaleClaim:
+        logger.warning('Task %s (%s) attempt %s lost its claim', pk, job.name, job.attempts)
+        return None
+    except Exception:
+        error = traceback.format_exc()
+        failed = job.attempts >= job.max_attempts
+        logger.warning('Task %s (%s) attempt %s failed', pk, job.name, job.attempts, exc_info=True)
+        claimed.update(
+            status='failed' if failed else 'pending',
+            locked_at=None,
+            last_error=error[-4000:],
+            run_after=timezone.now() + _backoff(job.attempts),
+        )
+        return False
+
+
+def run_due(limit=10):
+    """Run up to ``limit`` due tasks; returns how many this call ran or failed."""
+    attempted = 0
+    for pk in list(Task.objects.due().values_list('pk', flat=True)[:limit]):
+        attempted += run_task(pk) is not None
+    return attempted
@@ -0,0 +1,104 @@
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from . import queue
+from .models import Task, TaskQuerySet
+from .queue import enqueue, run_task, task
+
+calls = []
+
+
+@task
+def record(value):
+    calls.append(value)
+
+
+@task
+def explode():
+    raise RuntimeError('boom')
+
+
+@override_settings(TASKS_RUNNER='worker', TASKS_RETRY_SECONDS=5)
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def enqueue(self, func, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return enqueue(func, **kwargs)
+
+    def test_one_claim_wins(self):
+        job = self.enqueue(record, value=1)
+        self.assertTrue(Task.objects.claim(job.pk))
+        self.assertFalse(Task.objects.claim(job.pk))
+        # A second runner finds it taken and leaves it alone
+        self.assertIsNone(run_task(job.pk))
+        self.assertEqual(calls, [])
+
+    def test_runs_once(self):
+        job = self.enqueue(record, value=1)
+        self.assertTrue(run_task(job.pk))
+        self.assertIsNone(run_task(job.pk))
+        self.assertEqual(calls, [1])
+        self.assertEqual(Task.objects.get(pk=job.pk).status, 'done')
+
+    def test_failures_back_off_then_give_up(self):
+        job = self.enqueue(explode, max_attempts=2)
+        started = timezone.now()
+        with self.assertLogs('tasks.queue', 'WARNING'):
+            self.assertFalse(run_task(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('pending', 1))
+        self.assertGreaterEqual(job.run_after, started + timedelta(seconds=5))
+        self.assertIn('boom', job.last_error)
+        # Not due yet
+        self.assertIsNone(run_task(job.pk))
+
+        Task.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        started = timezone.now()
+        with self.assertLogs('tasks.queue', 'WARNING'):
+            self.assertFalse(run_task(job.pk))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertGreaterEqual(job.run_after, started + timedelta(seconds=10))
+
+    def test_key_deduplicates(self):
+        first = self.enqueue(record, key='once', value=1)
+        self.assertIsNotNone(first)
+        self.assertIsNone(self.enqueue(record, key='once', value=2))
+        self.assertEqual(list(Task.objects.values_list('pk', flat=True)), [first.pk])
+
+    def test_release_stale(self):
+        stale, busy = self.enqueue(record, value=1), self.enqueue(record, value=2)
+        for job in (stale, busy):
+            Task.objects.claim(job.pk)
+        Task.objects.filter(pk=stale.pk).update(locked_at=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(Task.objects.release_stale(timezone.now() - timedelta(minutes=5)), 1)
+        self.assertEqual(Task.objects.get(pk=stale.pk).status, 'pending')
+        self.assertEqual(Task.objects.get(pk=busy.pk).status, 'running')
+        self.assertTrue(run_task(stale.pk))
+        self.assertEqual(calls, [1])
+
+    def test_run_that_lost_its_claim_does_nothing(self):
+        job = self.enqueue(record, value=1)
+        real_get = TaskQuerySet.get
+
+        def load_then_lose(queryset, *args, **kwargs):
+            loaded = real_get(queryset, *args, **kwargs)
+            # Released as stale and claimed by another worker meanwhile
+            Task.objects.filter(pk=loaded.pk).update(attempts=loaded.attempts + 1)
+            return loaded
+
+        with mock.patch.object(TaskQuerySet, 'get', load_then_lose), self.assertLogs('tasks.queue', 'WARNING'):
+            self.assertIsNone(run_task(job.pk))
+        self.assertEqual(calls, [])
+        self.assertEqual(Task.objects.get(pk=job.pk).status, 'running')
+
+    @override_settings(TASKS_RUNNER='thread')
+    def test_delayed_job_waits_on_a_timer(self):
+        with mock.patch.object(queue.threading, 'Timer') as timer:
+            job = self.enqueue(record, delay=30, value=1)
+        self.assertEqual(timer.call_args.args[0], 30)
+        timer.return_value.start.assert_called_once_with()
+        self.assertEqual(Task.objects.get(pk=job.pk).status, 'pending')